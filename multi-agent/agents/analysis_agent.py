@@ -1,8 +1,9 @@
-from langchain_community.chat_models import ChatTongyi
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
 from config.settings import settings
 from tools.chart_tools import ChartTools  # 导入图表工具
+from agents.llm_client import llm_client
+from agents.context_serializer import serialize_data_context, serialize_indicators
 from typing import List, Dict, Any, Union
 
 # ... (顶部导入不变) ...
@@ -14,24 +15,26 @@ _chart_tools_instance = ChartTools()
 
 @tool("生成股票K线图")
 def generate_candlestick_chart_tool(data: List[Dict[str, Any]], title: str = "股票K线图") -> str:
-    """根据提供的股票数据生成K线图，并返回其描述或Base64编码图片。
+    """根据提供的股票数据生成K线图，并返回其描述（图片在后台渲染并缓存，由界面展示）。
     输入为包含'日期', '开盘价', '最高价', '最低价', '收盘价', '成交量'的字典列表。"""
     return _chart_tools_instance.generate_candlestick_chart(data, title)
 
+@tool("生成折线图")
+def generate_line_chart_tool(data: List[Dict[str, Any]], x_col: str, y_col: str, title: str = "折线图") -> str:
+    """根据数据生成折线图（如收盘价走势），并返回其描述。输入为字典列表，指定X轴和Y轴的列名。"""
+    return _chart_tools_instance.generate_line_chart(data, x_col, y_col, title)
+
 class AnalysisAgent:
     def __init__(self):
-        self.llm = ChatTongyi(
-            model=settings.default_model,
-            dashscope_api_key=settings.qwen_api_key,
-            temperature=settings.temperature
-        )
         # ✅ 修复：直接使用装饰器后的工具函数列表
-        self.tools = [generate_candlestick_chart_tool]
+        self.tools = [generate_candlestick_chart_tool, generate_line_chart_tool]
+        self.chart_tools = _chart_tools_instance
         # ... (其余不变) ...
         self.prompt = ChatPromptTemplate.from_messages([
-            ("system", "你是一个专业的金融分析师，根据提供的数据和用户请求，生成详细、客观的分析报告。如果需要图表，请使用工具生成。"),
+            ("system", "你是一个专业的金融分析师，根据提供的数据和用户请求，生成详细、客观的分析报告。"
+                       "技术指标已在本地计算完成，请直接引用指标数值判断趋势，不必根据原始价格自行推算。如果需要图表，请使用工具生成。"),
             ("placeholder", "{chat_history}"),
-            ("human", "请根据以下数据进行分析：\n数据：{data_context}\n用户请求：{input}"),
+            ("human", "请根据以下数据进行分析：\n数据：{data_context}\n技术指标：{indicators}\n用户请求：{input}"),
         ])
 
     def run(
@@ -42,49 +45,36 @@ class AnalysisAgent:
     ) -> str:
         """执行数据分析任务，返回分析结果。"""
         print(f"\n--- Analysis Agent: 接收到请求 ---")
-        history_for_agent = []
-        if chat_history:
-            for msg in chat_history:
-                if isinstance(msg, HumanMessage):
-                    history_for_agent.append(HumanMessage(content=msg.content))
-                elif isinstance(msg, AIMessage):
-                    history_for_agent.append(AIMessage(content=msg.content))
-
-        if isinstance(data_context, dict):
-            data_str = str(data_context)
-        else:
-            data_str = data_context
-
         try:
-            messages = self.prompt.format_messages(
-                input=input_data,
-                data_context=data_str,
-                chat_history=history_for_agent
-            )
+            messages = self._build_messages(input_data, data_context, chat_history)
+            response = llm_client.invoke(messages, tools=self.tools)
 
-            llm_with_tools = self.llm.bind_tools(self.tools)
-            response = llm_with_tools.invoke(messages)
+            if response.tool_calls:
+                final_messages, tool_output = self._run_tool_calls(messages, response, data_context)
+                final_response = llm_client.invoke(final_messages)
+                return final_response.content + "\n" + "\n".join(tool_output)
+
+            print(f"--- Analysis Agent: 完成任务 ---")
+            return response.content
+        except Exception as e:
+            print(f"[错误] Analysis Agent 执行失败: {e}")
+            return f"分析失败: {e}"
+
+    async def arun(
+        self,
+        input_data: str,
+        data_context: Union[str, Dict[str, Any]],
+        chat_history: List[BaseMessage] = None
+    ) -> str:
+        """run 的异步版本"""
+        print(f"\n--- Analysis Agent: 接收到请求 ---")
+        try:
+            messages = self._build_messages(input_data, data_context, chat_history)
+            response = await llm_client.ainvoke(messages, tools=self.tools)
 
             if response.tool_calls:
-                tool_output = []
-                for tool_call in response.tool_calls:
-                    tool_name = tool_call["name"]
-                    tool_args = tool_call["args"]
-
-                    if tool_name == "生成股票K线图":
-                        chart_result = self.chart_tools.generate_candlestick_chart(
-                            tool_args.get("data", data_context.get("price_data", [])),
-                            tool_args.get("title", "股票K线图")
-                        )
-                        tool_output.append(f"工具调用结果 ({tool_name}): {chart_result}")
-                    else:
-                        tool_output.append(f"未知工具: {tool_name}")
-
-                final_messages = messages + [
-                    AIMessage(content=response.content, tool_calls=response.tool_calls),
-                    HumanMessage(content="\n".join(tool_output))
-                ]
-                final_response = self.llm.invoke(final_messages)
+                final_messages, tool_output = self._run_tool_calls(messages, response, data_context)
+                final_response = await llm_client.ainvoke(final_messages)
                 return final_response.content + "\n" + "\n".join(tool_output)
 
             print(f"--- Analysis Agent: 完成任务 ---")
@@ -92,3 +82,49 @@ class AnalysisAgent:
         except Exception as e:
             print(f"[错误] Analysis Agent 执行失败: {e}")
             return f"分析失败: {e}"
+
+    def _build_messages(self, input_data, data_context, chat_history) -> List[BaseMessage]:
+        # 紧凑渲染并按 token 预算截断，避免原始记录原样塞进提示词；技术指标单独放入指标槽位
+        data_str = serialize_data_context(data_context, exclude=("indicators",))
+        indicators = data_context.get("indicators") if isinstance(data_context, dict) else None
+        indicators_str = serialize_indicators(indicators, settings.context_token_budgets.get("indicators", 200)) \
+            if indicators else "无"
+
+        return self.prompt.format_messages(
+            input=input_data,
+            data_context=data_str,
+            indicators=indicators_str,
+            chat_history=chat_history or []
+        )
+
+    def _run_tool_calls(self, messages, response, data_context):
+        """执行模型请求的工具调用，返回 (追加了工具结果的消息列表, 工具输出文本列表)"""
+        tool_output = []
+        for tool_call in response.tool_calls:
+            tool_name = tool_call["name"]
+            tool_args = tool_call["args"]
+
+            if tool_name == "生成股票K线图":
+                default_data = data_context.get("price_data", []) if isinstance(data_context, dict) else []
+                chart_result = self.chart_tools.generate_candlestick_chart(
+                    tool_args.get("data", default_data),
+                    tool_args.get("title", "股票K线图")
+                )
+                tool_output.append(f"工具调用结果 ({tool_name}): {chart_result}")
+            elif tool_name == "生成折线图":
+                default_data = data_context.get("price_data", []) if isinstance(data_context, dict) else []
+                chart_result = self.chart_tools.generate_line_chart(
+                    tool_args.get("data", default_data),
+                    tool_args.get("x_col", "trade_date"),
+                    tool_args.get("y_col", "close"),
+                    tool_args.get("title", "折线图")
+                )
+                tool_output.append(f"工具调用结果 ({tool_name}): {chart_result}")
+            else:
+                tool_output.append(f"未知工具: {tool_name}")
+
+        final_messages = messages + [
+            AIMessage(content=response.content, tool_calls=response.tool_calls),
+            HumanMessage(content="\n".join(tool_output))
+        ]
+        return final_messages, tool_output
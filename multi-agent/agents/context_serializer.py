@@ -0,0 +1,218 @@
+import json
+import math
+import time
+from typing import Any, Dict, List, Sequence, Tuple, Union
+from config.settings import settings
+from tools.token_counter import count_tokens, truncate_to_tokens
+
+# 日线/行情记录在表格中保留的列：(字段, 表头)
+PRICE_COLUMNS: List[Tuple[str, str]] = [
+    ("trade_date", "日期"), ("open", "开"), ("high", "高"), ("low", "低"),
+    ("close", "收"), ("pct_chg", "涨跌%"), ("vol", "成交量"),
+]
+QUOTE_COLUMNS: List[Tuple[str, str]] = [
+    ("code", "代码"), ("name", "名称"), ("date", "日期"), ("current_price", "现价"), ("last_close", "昨收"),
+    ("open", "开"), ("high", "高"), ("low", "低"), ("volume", "成交量"),
+]
+
+# 公司资料中对分析无帮助的字段（TuShare stock_company 与新浪公司概况）
+PROFILE_DROP_FIELDS = {
+    "ts_code", "code", "com_id", "exchange", "secretary", "email", "website", "office", "ann_date",
+    "英文名称", "邮政编码", "公司电话", "公司传真", "公司电子邮箱", "公司网址", "董秘", "董秘电话", "董秘传真",
+    "董秘电子邮箱", "信息披露网址", "信息披露报纸名称", "证券简称更名历史", "注册地址", "办公地址",
+}
+NEWS_DROP_FIELDS = {"link", "url_hash"}
+
+SECTION_TITLES = {"price_data": "行情", "indicators": "技术指标", "company_info": "公司资料", "news": "相关新闻"}
+# 长期记忆检索到的历史分析随每次写入而变化：放在数据末尾并用标记包围，LLM 缓存计算键时去掉这一段
+RELATED_HISTORY_OPEN = "【相关历史分析】"
+RELATED_HISTORY_CLOSE = "【相关历史分析完】"
+
+
+def _fmt(value: Any) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        if math.isnan(value):
+            return "-"
+        return f"{value:.0f}" if abs(value) >= 1e5 else f"{value:.2f}"
+    return str(value)
+
+
+def _fit_lines(header: List[str], lines: List[str], budget: int, keep_tail: bool = False) -> str:
+    """逐行加入直到超出预算；keep_tail=True 时优先保留末尾（如最近的交易日）"""
+    used = sum(count_tokens(line) + 1 for line in header)
+    kept = []
+    for line in (reversed(lines) if keep_tail else lines):
+        cost = count_tokens(line) + 1
+        if used + cost > budget:
+            break
+        kept.append(line)
+        used += cost
+    if keep_tail:
+        kept.reverse()
+    omitted = len(lines) - len(kept)
+    footer = [f"（另有 {omitted} 条因篇幅省略）"] if omitted else []
+    return "\n".join(header + kept + footer)
+
+
+def _records_table(records: Sequence[Dict[str, Any]], columns: List[Tuple[str, str]], budget: int,
+                   sort_key: str = None) -> str:
+    columns = [(key, label) for key, label in columns if any(key in record for record in records)]
+    if sort_key:
+        records = sorted(records, key=lambda record: str(record.get(sort_key, "")))
+    header = ["|".join(label for _, label in columns)]
+    lines = ["|".join(_fmt(record.get(key)) for key, _ in columns) for record in records]
+    return _fit_lines(header, lines, budget, keep_tail=bool(sort_key))
+
+
+def _error_text(value: Dict[str, Any]) -> str:
+    return f"获取失败：{value['error']}"
+
+
+def serialize_price_data(price_data: Any, budget: int) -> str:
+    if isinstance(price_data, dict):
+        if "error" in price_data:
+            return _error_text(price_data)
+        return _records_table([price_data], QUOTE_COLUMNS, budget)
+    if isinstance(price_data, list) and price_data and isinstance(price_data[0], dict):
+        if "trade_date" in price_data[0]:
+            return _records_table(price_data, PRICE_COLUMNS, budget, sort_key="trade_date")
+        return _records_table(price_data, QUOTE_COLUMNS, budget)
+    return serialize_value(price_data, budget)
+
+
+def serialize_indicators(indicators: Any, budget: int) -> str:
+    """技术指标摘要渲染为一行 “名称 数值” 列表"""
+    if isinstance(indicators, dict) and "error" in indicators:
+        return _error_text(indicators)
+    if not isinstance(indicators, dict):
+        return serialize_value(indicators, budget)
+    return truncate_to_tokens("；".join(f"{key} {_fmt(value)}" for key, value in indicators.items()), budget)
+
+
+def serialize_company_info(company_info: Any, budget: int) -> str:
+    if isinstance(company_info, list) and company_info:
+        company_info = company_info[0]
+    if not isinstance(company_info, dict):
+        return serialize_value(company_info, budget)
+    if "error" in company_info and len(company_info) == 1:
+        return _error_text(company_info)
+
+    lines = []
+    for key, value in company_info.items():
+        if key in PROFILE_DROP_FIELDS or value in (None, "", "--"):
+            continue
+        text = truncate_to_tokens(_fmt(value), settings.context_profile_field_tokens)
+        lines.append(f"{key}：{text}")
+    return _fit_lines([], lines, budget)
+
+
+def serialize_news(news: Any, budget: int) -> str:
+    if isinstance(news, dict) and "error" in news:
+        return _error_text(news)
+    if not isinstance(news, list):
+        return serialize_value(news, budget)
+    lines = []
+    for item in news:
+        if not isinstance(item, dict):
+            continue
+        extra = {k: v for k, v in item.items() if k not in NEWS_DROP_FIELDS | {"title", "date", "source"}}
+        line = f"- [{item.get('date', '未知日期')}] {item.get('title', '')}"
+        if item.get("source"):
+            line += f"（{item['source']}）"
+        if extra:
+            line += " " + json.dumps(extra, ensure_ascii=False, default=str)
+        lines.append(line)
+    return _fit_lines([], lines, budget)
+
+
+def serialize_related_history(hits: Any, budget: int) -> str:
+    """长期记忆检索结果：按相似度顺序列出，注明写入日期，便于模型判断时效"""
+    if not isinstance(hits, list):
+        return serialize_value(hits, budget)
+    lines = []
+    for hit in hits:
+        if not isinstance(hit, dict):
+            continue
+        created_at = hit.get("created_at")
+        date = time.strftime("%Y-%m-%d", time.localtime(created_at)) if created_at else "未知日期"
+        lines.append(f"- [{date}] {' '.join(str(hit.get('text', '')).split())}")
+    return _fit_lines([], lines, budget)
+
+
+def strip_related_history(text: str) -> str:
+    """去掉 serialize_data_context 输出的相关历史分析段（连同其前面的换行），其余文本不变"""
+    while True:
+        start = text.find(RELATED_HISTORY_OPEN)
+        end = text.find(RELATED_HISTORY_CLOSE, start) if start >= 0 else -1
+        if end < 0:
+            return text
+        if start and text[start - 1] == "\n":
+            start -= 1
+        text = text[:start] + text[end + len(RELATED_HISTORY_CLOSE):]
+
+
+def serialize_value(value: Any, budget: int) -> str:
+    """未知结构：紧凑 JSON（浮点数保留两位小数）后按预算截断"""
+    if isinstance(value, str):
+        return truncate_to_tokens(value, budget)
+    if isinstance(value, list) and value and all(isinstance(item, dict) for item in value):
+        keys = list(dict.fromkeys(key for item in value for key in item if key not in NEWS_DROP_FIELDS))
+        return _records_table(value, [(key, key) for key in keys], budget)
+
+    def compact(obj):
+        if isinstance(obj, float):
+            return None if math.isnan(obj) else round(obj, 2)
+        if isinstance(obj, dict):
+            return {k: compact(v) for k, v in obj.items()}
+        if isinstance(obj, (list, tuple)):
+            return [compact(v) for v in obj]
+        return obj
+
+    text = json.dumps(compact(value), ensure_ascii=False, separators=(",", ":"), default=str)
+    return truncate_to_tokens(text, budget)
+
+
+SECTION_SERIALIZERS = {
+    "price_data": serialize_price_data,
+    "indicators": serialize_indicators,
+    "company_info": serialize_company_info,
+    "news": serialize_news,
+    "related_history": serialize_related_history,
+}
+
+
+def serialize_data_context(data_context: Union[str, Dict[str, Any], List, None], scale: float = 1.0,
+                           exclude: Sequence[str] = ()) -> str:
+    """
+    将 data_context 渲染为紧凑的提示词文本：行情为定精度表格、去掉公司资料与新闻中的冗余字段、
+    截断过长文本，并按 context_token_budgets 为每个部分设置 token 上限（scale 用于整体缩放预算）。
+    exclude 中的部分不输出（例如已在提示词中单独提供的技术指标）。
+    """
+    budgets = settings.context_token_budgets
+    default_budget = budgets.get("default", 300)
+
+    def budget_for(section: str) -> int:
+        return max(1, int(budgets.get(section, default_budget) * scale))
+
+    if data_context is None:
+        return "没有可用的数据。"
+    if not isinstance(data_context, dict):
+        return serialize_value(data_context, budget_for("default"))
+    if set(data_context) == {"error"}:
+        return _error_text(data_context)
+
+    parts = []
+    if data_context.get("company_name") or data_context.get("ts_code"):
+        parts.append(f"股票：{data_context.get('company_name') or ''}（{data_context.get('ts_code') or ''}）")
+    for section, value in data_context.items():
+        if section in ("company_name", "ts_code", "related_history") or section in exclude:
+            continue
+        serializer = SECTION_SERIALIZERS.get(section, serialize_value)
+        title = SECTION_TITLES.get(section, section)
+        parts.append(f"【{title}】\n{serializer(value, budget_for(section))}")
+    if data_context.get("related_history") and "related_history" not in exclude:
+        history = serialize_related_history(data_context["related_history"], budget_for("related_history"))
+        parts.append(f"{RELATED_HISTORY_OPEN}\n{history}\n{RELATED_HISTORY_CLOSE}")
+    return "\n".join(parts)
@@ -1,13 +1,17 @@
-from langchain_community.chat_models import ChatTongyi
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
+from langchain_core.messages import BaseMessage
 from langchain.agents import AgentExecutor, create_tool_calling_agent
 from config.settings import settings
 from tools.stock_tools import StockTools
 from tools.news_tools import NewsTools
+from tools.security_master import get_security_master, Security
+from agents.llm_client import llm_client
 from langchain.tools import tool
+from concurrent.futures import ThreadPoolExecutor, wait
 from typing import List, Dict, Any, Union
+import asyncio
 import json
+import time
 
 _stock_tools_instance = StockTools()
 _news_tools_instance = NewsTools()
@@ -19,6 +23,24 @@ def get_stock_price_tool(ts_code: str = "600519.SH") -> dict:
     return _stock_tools_instance.get_stock_price_internal(ts_code)
 
 
+@tool("获取股票历史行情")
+def get_stock_history_tool(ts_code: str, start_date: str = None, end_date: str = None) -> Union[List[Dict[str, Any]], dict]:
+    """获取指定股票在某一区间的日线历史行情，日期格式为 YYYYMMDD，不填则返回本地可用的全部历史（约两年）"""
+    return _stock_tools_instance.get_stock_history(ts_code, start_date, end_date)
+
+
+@tool("批量获取股票价格")
+def get_stock_prices_batch_tool(ts_codes: List[str]) -> List[Dict[str, Any]]:
+    """一次性获取多只股票（如自选股、持仓列表）的最新行情，输入为 ts_code 列表，例如 ["600519.SH", "000001.SZ"]"""
+    return _stock_tools_instance.get_stock_prices_batch(ts_codes)
+
+
+@tool("获取技术指标")
+def get_technical_indicators_tool(ts_code: str = "600519.SH") -> dict:
+    """获取指定股票的技术指标摘要：均线、RSI、MACD、布林带、ATR、年化波动率、最大回撤等"""
+    return _stock_tools_instance.get_indicator_summary(ts_code)
+
+
 @tool("获取公司信息")
 def get_company_info_tool(ts_code: str = "600519.SH") -> dict:
     """获取指定股票代码的上市公司基本信息"""
@@ -34,20 +56,20 @@ def get_company_news_tool(company_name: str) -> List[Dict[str, str]]:
 class DataAgent:
 
     def __init__(self):
-        self.llm = ChatTongyi(
-            model=settings.default_model,
-            dashscope_api_key=settings.qwen_api_key,
-            temperature=settings.temperature
-        )
+        self.llm = llm_client.chat_model()
 
         self.tools = [
             get_stock_price_tool,
+            get_stock_prices_batch_tool,
+            get_stock_history_tool,
+            get_technical_indicators_tool,
             get_company_info_tool,
             get_company_news_tool
         ]
 
         self.prompt = ChatPromptTemplate.from_messages([
-            ("system", "你是一个专业的数据收集助手，擅长使用提供的工具获取股票价格、公司信息和公司新闻。"),
+            ("system", "你是一个专业的数据收集助手，擅长使用提供的工具获取股票价格、公司信息和公司新闻。"
+                       "涉及多只股票的行情时，请使用批量获取股票价格工具一次性获取。"),
             ("placeholder", "{chat_history}"),
             ("human", "{input}"),
             ("placeholder", "{agent_scratchpad}")
@@ -58,24 +80,88 @@ class DataAgent:
 
     def run(self, input_data: str, chat_history: List[BaseMessage] = None) -> Union[str, Dict[str, Any]]:
         print(f"\n--- Data Agent: 接收到请求 ---")
-        history_for_agent = []
+        security, input_data = self._plan(input_data)
+        if security:
+            return self.run_planned(security)
 
-        if chat_history:
-            for msg in chat_history:
-                if isinstance(msg, HumanMessage):
-                    history_for_agent.append(HumanMessage(content=msg.content))
-                elif isinstance(msg, AIMessage):
-                    history_for_agent.append(AIMessage(content=msg.content))
+        try:
+            result = self.executor.invoke({"input": input_data, "chat_history": chat_history or []})
+            print(f"--- Data Agent: 完成任务 ---")
+            return self._parse_output(result)
+        except Exception as e:
+            print(f"[错误] Data Agent 执行失败: {e}")
+            return {"error": f"数据收集失败: {e}"}
+
+    async def arun(self, input_data: str, chat_history: List[BaseMessage] = None) -> Union[str, Dict[str, Any]]:
+        """run 的异步版本：计划执行在线程中完成，AgentExecutor 使用异步调用"""
+        print(f"\n--- Data Agent: 接收到请求 ---")
+        security, input_data = self._plan(input_data)
+        if security:
+            return await asyncio.to_thread(self.run_planned, security)
 
         try:
-            result = self.executor.invoke({"input": input_data, "chat_history": history_for_agent})
+            result = await self.executor.ainvoke({"input": input_data, "chat_history": chat_history or []})
             print(f"--- Data Agent: 完成任务 ---")
-            if "output" in result:
-                try:
-                    return json.loads(result["output"])
-                except json.JSONDecodeError:
-                    return result["output"]
-            return result
+            return self._parse_output(result)
         except Exception as e:
             print(f"[错误] Data Agent 执行失败: {e}")
             return {"error": f"数据收集失败: {e}"}
+
+    @staticmethod
+    def _plan(input_data: str):
+        """
+        预先解析股票代码：明确指向单只股票时返回该股票，按固定计划并发取数，无需 LLM 决定工具调用；
+        否则把识别出的代码附加到输入中，直接提供给模型作为工具参数，避免模型猜测 ts_code。
+        """
+        securities = get_security_master().resolve(input_data)
+        if settings.data_agent_planned_mode and len(securities) == 1 and securities[0].name:
+            return securities[0], input_data
+
+        if securities:
+            hints = "，".join(f"{s.name or s.symbol}: {s.ts_code}" for s in securities)
+            input_data = f"{input_data}\n（已识别股票代码，调用工具时请直接使用：{hints}）"
+        return None, input_data
+
+    @staticmethod
+    def _parse_output(result: Dict[str, Any]) -> Union[str, Dict[str, Any]]:
+        if "output" in result:
+            try:
+                return json.loads(result["output"])
+            except json.JSONDecodeError:
+                return result["output"]
+        return result
+
+    def run_planned(self, security: Security) -> Dict[str, Any]:
+        """
+        计划执行模式：并发获取行情、公司信息和新闻，在共享截止时间内汇总为结构化 data_context。
+        超时或失败的部分以 {"error": ...} 占位，不影响其他部分。
+        每次请求使用独立的线程池：已在运行的取数无法中途取消，超时后留在各自线程中结束，
+        不会占用其他请求的工作线程。
+        """
+        print(f"--- Data Agent: 计划执行 {security.name} ({security.ts_code}) ---")
+        started = time.monotonic()
+        tasks = {
+            "price_data": (_stock_tools_instance.get_stock_price_internal, security.ts_code),
+            "indicators": (_stock_tools_instance.get_indicator_summary, security.ts_code),
+            "company_info": (_stock_tools_instance.get_company_info_internal, security.ts_code),
+            "news": (_news_tools_instance.get_company_news, security.name),
+        }
+        pool = ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix="data-agent")
+        try:
+            futures = {key: pool.submit(fn, arg) for key, (fn, arg) in tasks.items()}
+            wait(futures.values(), timeout=settings.data_agent_deadline_seconds)
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        data_context = {"ts_code": security.ts_code, "company_name": security.name}
+        for key, future in futures.items():
+            if not future.done():
+                data_context[key] = {"error": f"超过 {settings.data_agent_deadline_seconds} 秒未返回"}
+                continue
+            try:
+                data_context[key] = future.result()
+            except Exception as e:
+                data_context[key] = {"error": f"数据获取失败: {e}"}
+
+        print(f"--- Data Agent: 完成任务 (计划执行耗时 {time.monotonic() - started:.2f}s) ---")
+        return data_context
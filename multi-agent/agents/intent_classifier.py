@@ -0,0 +1,91 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List
+from tools.keyword_automaton import KeywordAutomaton
+
+ROUTES = ["data_retrieval", "analysis", "report_generation", "general_response"]
+
+# 路由关键词及权重：权重越高，越能单独决定路由
+INTENT_KEYWORDS: Dict[str, Dict[str, float]] = {
+    "data_retrieval": {
+        "价格": 3.0, "股价": 3.0, "行情": 3.0, "报价": 2.5, "现价": 2.5, "多少钱": 2.5,
+        "收盘": 2.0, "开盘": 2.0, "涨跌": 2.0, "涨幅": 2.0, "跌幅": 2.0, "成交量": 2.0,
+        "公司概况": 2.5, "公司信息": 2.5, "新闻": 2.0, "消息": 1.0, "公告": 1.5,
+        "信息": 1.5, "数据": 1.5, "资料": 1.5, "查询": 1.5, "查一下": 1.5, "获取": 1.0,
+    },
+    "analysis": {
+        "分析": 3.0, "建议": 2.5, "价值": 2.5, "估值": 2.5, "走势": 2.0, "趋势": 2.0,
+        "前景": 2.0, "值得": 2.0, "买入": 2.0, "卖出": 2.0, "持有": 2.0, "风险": 1.5,
+        "怎么看": 2.0, "投资": 1.5, "技术面": 2.0, "基本面": 2.0, "对比": 1.5, "比较": 1.5,
+    },
+    "report_generation": {
+        "报告": 4.0, "研报": 4.0, "总结": 3.0, "综述": 3.0, "写一份": 3.0, "撰写": 2.5,
+        "生成": 1.5, "整理": 1.5,
+    },
+    "general_response": {
+        "你好": 3.0, "您好": 3.0, "谢谢": 3.0, "再见": 3.0, "你是谁": 3.0, "帮助": 2.0,
+        "hello": 3.0,
+    },
+}
+
+# 工作流中高层路由包含低层路由（报告需要分析，分析需要数据），
+# 因此被包含的路由不视为竞争者，只在平分时由高层路由胜出
+ROUTE_IMPLIES: Dict[str, List[str]] = {
+    "report_generation": ["analysis", "data_retrieval"],
+    "analysis": ["data_retrieval"],
+    "data_retrieval": [],
+    "general_response": [],
+}
+ROUTE_PRIORITY = {"report_generation": 3, "analysis": 2, "data_retrieval": 1, "general_response": 0}
+
+_STOCK_CODE_PATTERN = re.compile(r'(?<!\d)\d{6}(?:\.(?:SH|SZ|BJ|sh|sz|bj))?(?!\d)')
+
+
+@dataclass
+class IntentResult:
+    route: str
+    confidence: float
+    scores: Dict[str, float] = field(default_factory=dict)
+    matched: List[str] = field(default_factory=list)
+
+
+class IntentClassifier:
+    """
+    本地意图分类器：关键词自动机 + 打分特征，给出路由及置信度。
+    纯本地计算，单次分类耗时为微秒级，置信度不足时由 RouterAgent 回退到 LLM。
+    """
+
+    def __init__(self, keywords: Dict[str, Dict[str, float]] = None, prior: float = 1.0):
+        self.prior = prior
+        self.automaton = KeywordAutomaton()
+        for route, words in (keywords or INTENT_KEYWORDS).items():
+            for word, weight in words.items():
+                self.automaton.add(word, (route, weight))
+        self.automaton.build()
+
+    def classify(self, text: str) -> IntentResult:
+        scores = {route: 0.0 for route in ROUTES}
+        matched = []
+        seen = set()
+        for _, _, keyword, (route, weight) in self.automaton.iter_matches(text):
+            # 同一关键词重复出现只计一次，避免刷分
+            if keyword in seen:
+                continue
+            seen.add(keyword)
+            scores[route] += weight
+            matched.append(keyword)
+
+        # 额外特征：提到股票代码说明与具体标的相关，轻微加强数据类意图
+        if _STOCK_CODE_PATTERN.search(text):
+            scores["data_retrieval"] += 0.5
+
+        best = max(ROUTES, key=lambda r: (scores[r], ROUTE_PRIORITY[r]))
+        if scores[best] <= 0:
+            return IntentResult(route="general_response", confidence=0.0, scores=scores, matched=matched)
+
+        competitor = max(
+            (scores[r] for r in ROUTES if r != best and r not in ROUTE_IMPLIES[best]),
+            default=0.0
+        )
+        confidence = scores[best] / (scores[best] + competitor + self.prior)
+        return IntentResult(route=best, confidence=round(confidence, 4), scores=scores, matched=matched)
@@ -0,0 +1,140 @@
+import contextvars
+import hashlib
+import json
+import re
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Optional, Sequence
+from langchain_core.caches import BaseCache
+from langchain_core.globals import get_llm_cache, set_llm_cache
+from langchain_core.load import dumps, loads
+from langchain_core.outputs import Generation
+from config.settings import settings
+from agents.context_serializer import strip_related_history
+from tools.cache import TTLCache, MISSING
+from tools.market_hours import market_aware_ttl
+from storage.llm_cache_store import LLMCacheStore
+
+_bypass = contextvars.ContextVar("llm_cache_bypass", default=False)
+_MODEL_PATTERN = re.compile(r"'model(?:_name)?', '([^']+)'")
+
+
+def _without_related_history(value: Any) -> Any:
+    """递归去掉反序列化后消息内容中的相关历史分析段"""
+    if isinstance(value, str):
+        return strip_related_history(value)
+    if isinstance(value, list):
+        return [_without_related_history(item) for item in value]
+    if isinstance(value, dict):
+        return {k: _without_related_history(v) for k, v in value.items()}
+    return value
+
+
+@contextmanager
+def llm_cache_bypass(enabled: bool = True):
+    """在该上下文内的 LLM 调用不读取缓存（结果仍会写回，相当于强制刷新）"""
+    token = _bypass.set(enabled)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def llm_cache_bypassed() -> bool:
+    """当前上下文是否要求忽略已缓存的结果"""
+    return _bypass.get()
+
+
+class TieredLLMCache(BaseCache):
+    """
+    两级 LLM 响应缓存：内存 LRU + SQLite。
+    LangChain 传入的 prompt 是序列化后的完整消息列表，llm_string 包含模型名、temperature
+    以及 bind_tools 绑定的工具定义，二者哈希后作为键，输入完全相同才会命中；
+    例外是长期记忆检索到的相关历史分析，它不参与键计算，否则每写入一次新分析同一问题就无法命中。
+    有效期随行情新鲜度变化：交易时段内较短，休市期间缓存到下次开盘。
+    """
+
+    def __init__(self, store: LLMCacheStore = None):
+        self.memory = TTLCache(maxsize=settings.llm_cache_memory_size, name="llm_response")
+        try:
+            self.store = store or LLMCacheStore()
+        except Exception as e:
+            print(f"[WARNING LLMCache] SQLite tier unavailable: {e}. Using memory tier only.")
+            self.store = None
+        self._lock = threading.Lock()
+        self.store_hits = 0
+        self.bypassed = 0
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        # prompt 是 dumps 序列化的消息列表：先解析成对象，在消息内容里去掉相关历史分析段再重新序列化，
+        # 不依赖转义后的文本形式
+        try:
+            prompt = json.dumps(_without_related_history(json.loads(prompt)), ensure_ascii=False, sort_keys=True)
+        except ValueError:
+            prompt = strip_related_history(prompt)
+        return hashlib.sha256(f"{llm_string}\0{prompt}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _ttl() -> float:
+        return market_aware_ttl(settings.llm_cache_ttl_trading, settings.llm_cache_ttl_closed_max)
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        if _bypass.get():
+            with self._lock:
+                self.bypassed += 1
+            return None
+
+        key = self._key(prompt, llm_string)
+        cached = self.memory.get(key)
+        if cached is not MISSING:
+            return cached
+        if self.store is None:
+            return None
+
+        try:
+            payload = self.store.get(key)
+            if payload is None:
+                return None
+            generations = [loads(item) for item in loads(payload)]
+        except Exception as e:
+            print(f"[WARNING LLMCache] Reading SQLite tier failed: {e}")
+            return None
+        with self._lock:
+            self.store_hits += 1
+        # 回填内存层，剩余有效期按当前时段重新计算
+        self.memory.set(key, generations, self._ttl())
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        key = self._key(prompt, llm_string)
+        ttl = self._ttl()
+        self.memory.set(key, list(return_val), ttl)
+        if self.store is None:
+            return
+        try:
+            match = _MODEL_PATTERN.search(llm_string)
+            payload = dumps([dumps(generation) for generation in return_val])
+            self.store.put(key, payload, ttl, model=match.group(1) if match else None)
+        except Exception as e:
+            print(f"[WARNING LLMCache] Writing SQLite tier failed: {e}")
+
+    def clear(self, **kwargs: Any) -> None:
+        self.memory.clear()
+        if self.store is not None:
+            self.store.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.memory.stats(), "store_hits": self.store_hits, "bypassed": self.bypassed}
+
+
+def install_llm_cache() -> Optional[TieredLLMCache]:
+    """设置为 LangChain 全局 LLM 缓存，所有未单独指定 cache 的 ChatTongyi 调用都会经过它"""
+    if not settings.llm_cache_enabled:
+        return None
+    cache = get_llm_cache()
+    if not isinstance(cache, TieredLLMCache):
+        cache = TieredLLMCache()
+        set_llm_cache(cache)
+    return cache
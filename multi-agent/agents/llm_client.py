@@ -0,0 +1,111 @@
+import asyncio
+import contextvars
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import AsyncIterator, Dict, List, Sequence, Tuple
+from langchain_community.chat_models import ChatTongyi
+from langchain_core.messages import BaseMessage, BaseMessageChunk
+from config.settings import settings
+
+
+class LLMClient:
+    """
+    所有 Agent 共享的通义千问客户端：
+    - 按 (模型, temperature) 复用 ChatTongyi 实例，不再每个 Agent 各建一个；
+    - 每个模型的并发请求数受 llm_max_concurrency 限制，超出的请求排队等待；
+    - 同步 invoke 与异步 ainvoke/astream 都有整体超时（llm_timeout_seconds）。
+    """
+
+    def __init__(self):
+        self._models: Dict[Tuple[str, float], ChatTongyi] = {}
+        self._sync_limits: Dict[str, threading.BoundedSemaphore] = {}
+        # asyncio.Semaphore 绑定事件循环，按循环分别创建
+        self._async_limits: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = \
+            weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=settings.llm_max_concurrency * 2, thread_name_prefix="llm")
+
+    def chat_model(self, model: str = None, temperature: float = None) -> ChatTongyi:
+        """返回共享的 ChatTongyi 实例（供 AgentExecutor 等需要模型对象的场景使用）"""
+        model = model or settings.default_model
+        temperature = settings.temperature if temperature is None else temperature
+        with self._lock:
+            llm = self._models.get((model, temperature))
+            if llm is None:
+                llm = ChatTongyi(model=model, dashscope_api_key=settings.qwen_api_key, temperature=temperature)
+                self._models[(model, temperature)] = llm
+            return llm
+
+    def _runnable(self, model: str, temperature: float, tools: Sequence = None):
+        llm = self.chat_model(model, temperature)
+        return llm.bind_tools(list(tools)) if tools else llm
+
+    def _sync_limit(self, model: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            return self._sync_limits.setdefault(model, threading.BoundedSemaphore(settings.llm_max_concurrency))
+
+    def _async_limit(self, model: str) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            limits = self._async_limits.setdefault(loop, {})
+            return limits.setdefault(model, asyncio.Semaphore(settings.llm_max_concurrency))
+
+    def invoke(self, messages: List[BaseMessage], tools: Sequence = None, model: str = None,
+               temperature: float = None, timeout: float = None) -> BaseMessage:
+        """同步调用，超时抛出 TimeoutError（后台请求完成后自动释放并发名额）"""
+        model = model or settings.default_model
+        timeout = timeout or settings.llm_timeout_seconds
+        runnable = self._runnable(model, temperature, tools)
+
+        def call():
+            with self._sync_limit(model):
+                return runnable.invoke(messages)
+
+        # 复制上下文，缓存跳过标记、回调配置等在工作线程中依然生效
+        future = self._pool.submit(contextvars.copy_context().run, call)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            raise TimeoutError(f"LLM ({model}) 超过 {timeout} 秒未返回")
+
+    async def ainvoke(self, messages: List[BaseMessage], tools: Sequence = None, model: str = None,
+                      temperature: float = None, timeout: float = None) -> BaseMessage:
+        """异步调用，等待期间不占用线程，超时抛出 TimeoutError"""
+        model = model or settings.default_model
+        timeout = timeout or settings.llm_timeout_seconds
+        runnable = self._runnable(model, temperature, tools)
+        async with self._async_limit(model):
+            try:
+                return await asyncio.wait_for(runnable.ainvoke(messages), timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"LLM ({model}) 超过 {timeout} 秒未返回")
+
+    async def astream(self, messages: List[BaseMessage], model: str = None, temperature: float = None,
+                      timeout: float = None) -> AsyncIterator[BaseMessageChunk]:
+        """异步流式输出，timeout 为整个响应的截止时间"""
+        model = model or settings.default_model
+        timeout = timeout or settings.llm_timeout_seconds
+        runnable = self._runnable(model, temperature)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        async with self._async_limit(model):
+            stream = runnable.astream(messages)
+            try:
+                while True:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        raise TimeoutError(f"LLM ({model}) 流式输出超过 {timeout} 秒")
+                    try:
+                        chunk = await asyncio.wait_for(stream.__anext__(), remaining)
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        raise TimeoutError(f"LLM ({model}) 流式输出超过 {timeout} 秒")
+                    yield chunk
+            finally:
+                await stream.aclose()
+
+
+# 进程内共享的 LLM 客户端
+llm_client = LLMClient()
@@ -1,22 +1,29 @@
-from langchain_community.chat_models import ChatTongyi
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
+from langchain_core.messages import BaseMessage
 from config.settings import settings
-from typing import List, Dict, Any, Union
+from agents.llm_client import llm_client
+from agents.context_serializer import serialize_data_context
+from typing import List, Dict, Any, Tuple, Union
+
+# 合并模式下报告部分的标题，用于从一次输出中拆分出分析结果
+FUSED_REPORT_HEADING = "## 二、投资报告"
 
 
 class ReportAgent:
     def __init__(self):
-        self.llm = ChatTongyi(
-            model=settings.default_model,
-            dashscope_api_key=settings.qwen_api_key,
-            temperature=settings.temperature
-        )
         self.prompt = ChatPromptTemplate.from_messages([
             ("system", "你是一个专业的报告生成助手，请根据提供的数据、分析结果和用户请求，生成一份结构清晰、内容详尽的金融报告。"),
             ("placeholder", "{chat_history}"),
             ("human", "请根据以下信息生成一份报告：\n用户请求：{input}\n原始数据：{data_context}\n分析结果：{analysis_result}"),
         ])
+        # 合并模式：一次调用同时完成数据分析与报告撰写，省去单独的分析调用
+        self.fused_prompt = ChatPromptTemplate.from_messages([
+            ("system", "你是一个专业的金融分析师兼报告撰写人，请根据提供的数据和用户请求，先给出详细、客观的分析，"
+                       "再在此基础上生成一份结构清晰、内容详尽的金融报告。"),
+            ("placeholder", "{chat_history}"),
+            ("human", "用户请求：{input}\n数据：{data_context}\n"
+                      "请严格按以下两个部分输出：\n## 一、数据分析\n（分析内容）\n" + FUSED_REPORT_HEADING + "\n（报告内容）"),
+        ])
 
     def run(
         self,
@@ -27,29 +34,89 @@ class ReportAgent:
     ) -> str:
         """执行报告生成任务，返回最终报告"""
         print(f"\n--- Report Agent: 接收到请求 ---")
-        history_for_agent = []
-        if chat_history:
-            for msg in chat_history:
-                if isinstance(msg, HumanMessage):
-                    history_for_agent.append(HumanMessage(content=msg.content))
-                elif isinstance(msg, AIMessage):
-                    history_for_agent.append(AIMessage(content=msg.content))
-
-        if isinstance(data_context, dict):
-            data_str = str(data_context)
-        else:
-            data_str = data_context
+        try:
+            messages = self._build_messages(input_data, data_context, analysis_result, chat_history)
+            response = llm_client.invoke(messages)
+            print(f"--- Report Agent: 完成任务 ---")
+            return response.content
+        except Exception as e:
+            print(f"[错误] Report Agent 执行失败: {e}")
+            return f"报告生成失败: {e}"
 
+    async def arun(
+        self,
+        input_data: str,
+        data_context: Union[str, Dict[str, Any]],
+        analysis_result: str,
+        chat_history: List[BaseMessage] = None
+    ) -> str:
+        """run 的异步版本"""
+        print(f"\n--- Report Agent: 接收到请求 ---")
         try:
-            messages = self.prompt.format_messages(
-                input=input_data,
-                data_context=data_str,
-                analysis_result=analysis_result,
-                chat_history=history_for_agent
-            )
-            response = self.llm.invoke(messages)
+            messages = self._build_messages(input_data, data_context, analysis_result, chat_history)
+            response = await llm_client.ainvoke(messages)
             print(f"--- Report Agent: 完成任务 ---")
             return response.content
         except Exception as e:
             print(f"[错误] Report Agent 执行失败: {e}")
             return f"报告生成失败: {e}"
+
+    def _build_messages(self, input_data, data_context, analysis_result, chat_history) -> List[BaseMessage]:
+        # 紧凑渲染并按 token 预算截断，避免原始记录原样塞进提示词
+        data_str = serialize_data_context(data_context, scale=settings.report_context_scale)
+
+        return self.prompt.format_messages(
+            input=input_data,
+            data_context=data_str,
+            analysis_result=analysis_result,
+            chat_history=chat_history or []
+        )
+
+    def run_fused(
+        self,
+        input_data: str,
+        data_context: Union[str, Dict[str, Any]],
+        chat_history: List[BaseMessage] = None
+    ) -> Tuple[str, str]:
+        """合并模式：一次 LLM 调用生成分析与报告，返回 (分析结果, 完整报告)"""
+        print(f"\n--- Report Agent (合并模式): 接收到请求 ---")
+        try:
+            messages = self._build_fused_messages(input_data, data_context, chat_history)
+            response = llm_client.invoke(messages)
+            print(f"--- Report Agent (合并模式): 完成任务 ---")
+            return self._split_fused(response.content)
+        except Exception as e:
+            print(f"[错误] Report Agent 合并模式执行失败: {e}")
+            return f"分析失败: {e}", f"报告生成失败: {e}"
+
+    async def arun_fused(
+        self,
+        input_data: str,
+        data_context: Union[str, Dict[str, Any]],
+        chat_history: List[BaseMessage] = None
+    ) -> Tuple[str, str]:
+        """run_fused 的异步版本"""
+        print(f"\n--- Report Agent (合并模式): 接收到请求 ---")
+        try:
+            messages = self._build_fused_messages(input_data, data_context, chat_history)
+            response = await llm_client.ainvoke(messages)
+            print(f"--- Report Agent (合并模式): 完成任务 ---")
+            return self._split_fused(response.content)
+        except Exception as e:
+            print(f"[错误] Report Agent 合并模式执行失败: {e}")
+            return f"分析失败: {e}", f"报告生成失败: {e}"
+
+    def _build_fused_messages(self, input_data, data_context, chat_history) -> List[BaseMessage]:
+        # 数据只发送一次，使用完整预算
+        return self.fused_prompt.format_messages(
+            input=input_data,
+            data_context=serialize_data_context(data_context),
+            chat_history=chat_history or []
+        )
+
+    @staticmethod
+    def _split_fused(content: str) -> Tuple[str, str]:
+        """按报告标题拆出分析部分；模型未按格式输出时分析结果与报告相同"""
+        index = content.find(FUSED_REPORT_HEADING)
+        analysis = content[:index].strip() if index > 0 else content
+        return analysis, content
@@ -1,49 +1,60 @@
-from langchain_community.chat_models import ChatTongyi
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
+from langchain_core.messages import BaseMessage
 from config.settings import settings
+from agents.intent_classifier import IntentClassifier, IntentResult, ROUTES
+from agents.llm_client import llm_client
 from typing import List
 
 
 class RouterAgent:
     def __init__(self):
-        self.llm = ChatTongyi(
-            model=settings.default_model,
-            dashscope_api_key=settings.qwen_api_key,
-            temperature=settings.temperature
-        )
         self.prompt = ChatPromptTemplate.from_messages([
             ("system", "你是一个智能路由助手，负责将用户请求路由到合适的Agent。请根据用户的问题判断任务类别（data_retrieval/analysis/report_generation/general_response），直接返回类别字符串。"),
             ("human", "用户请求：{input}")
         ])
+        self.classifier = IntentClassifier()
 
     def route_request(self, user_input: str, chat_history: List[BaseMessage] = None) -> str:
         """识别用户需求，路由到正确的 Agent"""
         print(f"\n--- Router Agent: 接收到请求 ---")
-        history_for_agent = []
-        if chat_history:
-            for msg in chat_history:
-                if isinstance(msg, HumanMessage):
-                    history_for_agent.append(HumanMessage(content=msg.content))
-                elif isinstance(msg, AIMessage):
-                    history_for_agent.append(AIMessage(content=msg.content))
+        intent, route = self._fast_route(user_input)
+        if route:
+            return route
 
         try:
-            response = self.llm.invoke(self.prompt.format_messages(input=user_input))
-            route = response.content.strip().lower()
-
-            # 规则加强，覆盖模型结果
-            if any(k in user_input for k in ['价格', '行情', '信息', '数据']):
-                route = 'data_retrieval'
-            elif any(k in user_input for k in ['分析', '建议', '价值']):
-                route = 'analysis'
-            elif any(k in user_input for k in ['报告', '总结']):
-                route = 'report_generation'
-            else:
-                route = 'general_response'
-
-            print(f"--- Router Agent: 跳转到 {route} ---")
+            response = llm_client.invoke(self.prompt.format_messages(input=user_input))
+            return self._parse_route(response.content, intent)
+        except Exception as e:
+            print(f"[错误] Router Agent 执行失败: {e}")
+            return intent.route if intent.confidence > 0 else "general_response"
+
+    async def aroute_request(self, user_input: str, chat_history: List[BaseMessage] = None) -> str:
+        """route_request 的异步版本，回退 LLM 时不占用线程"""
+        print(f"\n--- Router Agent: 接收到请求 ---")
+        intent, route = self._fast_route(user_input)
+        if route:
             return route
+
+        try:
+            response = await llm_client.ainvoke(self.prompt.format_messages(input=user_input))
+            return self._parse_route(response.content, intent)
         except Exception as e:
             print(f"[错误] Router Agent 执行失败: {e}")
-            return "general_response"
+            return intent.route if intent.confidence > 0 else "general_response"
+
+    def _fast_route(self, user_input: str):
+        """本地意图分类，置信度足够时直接给出路由，否则路由为 None"""
+        intent = self.classifier.classify(user_input)
+        print(f"--- Router Agent: 本地意图 {intent.route} (置信度 {intent.confidence:.2f}, 命中 {intent.matched}) ---")
+        if settings.router_fast_path_enabled and intent.confidence >= settings.router_confidence_threshold:
+            print(f"--- Router Agent: 跳转到 {intent.route} ---")
+            return intent, intent.route
+        return intent, None
+
+    @staticmethod
+    def _parse_route(content: str, intent: IntentResult) -> str:
+        # 模型输出可能带有多余文字，取其中出现的合法类别；都没有则采用本地分类结果
+        llm_route = content.strip().lower()
+        route = next((r for r in ROUTES if r in llm_route), intent.route)
+        print(f"--- Router Agent: 跳转到 {route} ---")
+        return route
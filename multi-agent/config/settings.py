@@ -1,6 +1,11 @@
-from typing import Optional
+import os
+from typing import Dict, List, Optional
 from pydantic_settings import BaseSettings
 
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(PROJECT_ROOT, "data")
+
+
 class Settings(BaseSettings):
     qwen_api_key: Optional[str] = None
     tushare_token: Optional[str] = None
@@ -8,6 +13,155 @@ class Settings(BaseSettings):
     default_model: str = "qwen-turbo"
     temperature: float = 0.1
 
+    # 共享 LLM 客户端：每个模型的最大并发请求数与单次调用超时
+    llm_max_concurrency: int = 8
+    llm_timeout_seconds: float = 60.0
+
+    # LLM 响应缓存（内存 LRU + SQLite）：输入完全相同时直接复用结果，
+    # 交易时段内有效期较短，休市期间缓存到下次开盘（0 表示不设上限）
+    llm_cache_enabled: bool = True
+    llm_cache_memory_size: int = 256
+    llm_cache_ttl_trading: int = 300
+    llm_cache_ttl_closed_max: int = 0
+
+    # 短期记忆：bounded 模式保留最近若干轮原文（受 token 预算限制），更早的对话合并为滚动摘要；
+    # buffer 模式保存全部消息
+    short_memory_mode: str = "bounded"
+    short_memory_keep_turns: int = 4
+    short_memory_token_budget: int = 1500
+    short_memory_summary_tokens: int = 300
+
+    # 长期记忆：历史分析/报告切块后写入本地向量索引（data/long_memory），回答时检索相关内容作为上下文。
+    # 嵌入方式 hashing（本地，离线可用）或 dashscope（需要网络）；检索相似度低于 min_score 的结果丢弃，
+    # 与已有内容相似度达到 dedupe_score 的块不再写入
+    long_memory_enabled: bool = True
+    long_memory_dir: str = os.path.join(DATA_DIR, "long_memory")
+    long_memory_embedder: str = "hashing"
+    long_memory_dashscope_model: str = "text-embedding-v2"
+    long_memory_dim: int = 128
+    long_memory_chunk_size: int = 500
+    long_memory_chunk_overlap: int = 50
+    long_memory_embed_batch_size: int = 64
+    long_memory_search_block: int = 65536
+    long_memory_top_k: int = 3
+    long_memory_min_score: float = 0.3
+    long_memory_dedupe_score: float = 0.98
+    long_memory_filter_oversample: int = 10
+
+    # 提示词中 data_context 的紧凑序列化：各部分 token 上限（tiktoken 编码计数，不可用时按字符估算），
+    # 公司资料单个字段的 token 上限，以及报告阶段相对分析阶段的预算比例
+    tokenizer_encoding: str = "cl100k_base"
+    context_token_budgets: Dict[str, int] = {"price_data": 400, "indicators": 200, "company_info": 300,
+                                             "news": 300, "default": 300}
+    context_profile_field_tokens: int = 120
+    report_context_scale: float = 0.5
+
+    # 路由：本地意图分类置信度达到阈值时直接路由，否则回退 LLM
+    router_fast_path_enabled: bool = True
+    router_confidence_threshold: float = 0.6
+
+    # 证券主数据快照（ts_code, symbol, name, fullname, cnspell）；仓库自带的只是少量样例。
+    # 配置了 TUSHARE_TOKEN 时，快照缺失、条数少于 security_master_min_size 或超过 max_age 秒未更新会在后台自动刷新
+    security_master_path: str = os.path.join(DATA_DIR, "security_master.csv")
+    security_master_max_age: int = 7 * 86400
+    security_master_min_size: int = 1000
+
+    # StockTools 内存缓存：行情交易时段内短 TTL、休市缓存到下次开盘（0 表示不设上限）
+    stock_cache_size: int = 1024
+    price_cache_ttl_trading: int = 30
+    price_cache_ttl_closed_max: int = 0
+    company_info_cache_ttl: int = 86400
+
+    # 图表：渲染进程数、单张图表渲染超时，PNG 按内容哈希缓存在 chart_dir
+    chart_dir: str = os.path.join(DATA_DIR, "charts")
+    chart_max_workers: int = 2
+    chart_render_timeout: float = 30.0
+    # 图表尺寸（像素）；每根K线至少 chart_min_bar_px 像素，超出时日线自动聚合为周/月/季线，
+    # 折线图每 chart_min_point_px 像素保留一个点（LTTB 降采样）
+    chart_width_px: int = 1000
+    chart_height_px: int = 600
+    chart_min_bar_px: int = 4
+    chart_min_point_px: int = 2
+
+    # 批量行情：每次上游请求最多包含的股票数量
+    tencent_quote_batch_size: int = 60
+    tushare_daily_batch_size: int = 500
+    # TuShare daily 单次调用最多返回的行数；批量/合并请求按 代码数 × 交易日数 估算后分块
+    tushare_daily_max_rows: int = 6000
+
+    # 技术指标：基于最近多少个交易日的日线计算
+    indicator_lookback_days: int = 250
+
+    # 本地 SQLite 数据库（WAL 模式）与公司资料持久缓存
+    database_path: str = os.path.join(DATA_DIR, "finance_agent.db")
+    company_profile_max_age: int = 30 * 86400
+    # 日线历史 Parquet 存储：首次下载的天数、同一股票重复检查增量的最小间隔
+    history_dir: str = os.path.join(DATA_DIR, "history")
+    history_bootstrap_days: int = 730
+    history_recheck_seconds: int = 1800
+    # 内存中最多保留多少只股票的日线（LRU 淘汰，淘汰后再次访问从 Parquet 读取）
+    history_cache_size: int = 64
+
+    # 预热用的自选股列表，.env 中写作 JSON 数组：WATCHLIST=["600519.SH","000001.SZ"]
+    watchlist: List[str] = []
+
+    # TuShare 配额：各接口每分钟调用次数（未列出的接口使用 default），排队超时与并发数
+    tushare_rate_limits: Dict[str, int] = {"default": 100, "daily": 200, "stock_company": 60}
+    tushare_queue_timeout: float = 30.0
+    tushare_max_concurrency: int = 4
+
+    # 数据源健康跟踪与熔断：最近 circuit_min_calls 次错误率达到阈值即熔断 cooldown 秒
+    source_health_window: int = 50
+    circuit_min_calls: int = 5
+    circuit_error_threshold: float = 0.6
+    circuit_cooldown_seconds: float = 60.0
+    # 对冲请求：TuShare 超过其 p95 耗时（样本不足时用默认值）仍未返回，就并行请求备用源
+    hedged_requests_enabled: bool = False
+    hedge_default_delay: float = 1.0
+    hedge_min_delay: float = 0.2
+    hedge_max_delay: float = 3.0
+    hedge_max_workers: int = 16
+
+    # 后台热门股票行情轮询（默认关闭），结果写入 mmap 快照供多进程共享读取
+    quote_poller_enabled: bool = False
+    quote_poller_interval: float = 3.0
+    quote_poller_top_n: int = 50
+    quote_poller_window_seconds: float = 1800
+    # 查询次数按多少秒一个时间桶汇总到 SQLite（各进程共享，写方据此排名）
+    quote_poller_bucket_seconds: int = 60
+    quote_snapshot_path: str = os.path.join(DATA_DIR, "quote_snapshot.bin")
+    quote_snapshot_max_age: float = 10.0
+
+    # 报告请求合并模式：一次 LLM 调用同时生成分析与报告（可在单次请求中覆盖）
+    fused_report_enabled: bool = False
+
+    # 分析/报告结果写入 analysis_history（后台线程批量提交）；同一股票、同一问题且输入数据未变化时，
+    # analysis_reuse_max_age 秒内的结果直接复用，不再调用 LLM（0 表示不复用）
+    analysis_reuse_max_age: float = 1800
+    analysis_history_batch_size: int = 50
+    analysis_history_flush_interval: float = 1.0
+    # 写入失败时按指数退避重试的最长间隔；进程退出时最多等待多少秒把未写入的结果落盘
+    analysis_history_retry_max_delay: float = 30.0
+    analysis_history_exit_timeout: float = 10.0
+
+    # DataAgent 计划执行：识别出单只股票时并发调用行情/公司信息/新闻工具，共享截止时间
+    data_agent_planned_mode: bool = True
+    data_agent_deadline_seconds: float = 8.0
+
+    # 新闻聚合：多来源并发抓取，截止时间内返回已到达的结果
+    news_max_items: int = 10
+    news_deadline_seconds: float = 4.0
+    news_max_workers: int = 8
+    # 新闻本地存储：距上次抓取未超过该秒数时直接读取存储
+    news_freshness_seconds: int = 600
+
+    # 爬虫 HTTP 连接池：按主机复用 keep-alive 连接，5xx/超时按指数退避（带抖动）重试
+    http_pool_size: int = 10
+    http_connect_timeout: float = 3.0
+    http_read_timeout: float = 5.0
+    http_max_retries: int = 2
+    http_backoff_factor: float = 0.3
+
     class Config:
         env_file = ".env"
         extra = "ignore"
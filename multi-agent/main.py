@@ -1,17 +1,20 @@
+import hashlib
+import json
 import os
 import re
-from typing import TypedDict, List, Dict, Any, Union
+import threading
+from typing import TypedDict, List, Dict, Any, Iterator, Optional, Union
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, END
 from memory.short_memory import ShortTermMemory
 
 
 # ========= 导入其他模块 =========
-from agents.router_agent import RouterAgent
-from agents.data_agent import DataAgent
-from agents.analysis_agent import AnalysisAgent
-from agents.report_agent import ReportAgent
+from agents.llm_cache import install_llm_cache, llm_cache_bypass, llm_cache_bypassed
 from config.settings import settings
+from tools.security_master import get_security_master
+from tools.chart_tools import strip_chart_markers
 
 
 # 定义 LangGraph 的状态
@@ -24,15 +27,59 @@ class AgentState(TypedDict):
     current_agent: str
     route: str
     final_goal: str
+    fused_report: Optional[bool]
+    data_hash: Optional[str]
+    reused_result: Optional[Dict[str, str]]
 
 
-# 实例化 Agents 和 记忆
-router_agent = RouterAgent()
-data_agent = DataAgent()
-analysis_agent = AnalysisAgent()
-report_agent = ReportAgent()
 short_term_memory = ShortTermMemory()
 
+# Agents、长期记忆、结果历史与行情轮询在首次运行工作流时才创建：图表渲染进程池以 spawn 启动子进程，
+# 子进程会以 __mp_main__ 的名义重新导入 __main__（如 python main.py 时的本模块），模块级不能有这些副作用
+router_agent = None
+data_agent = None
+analysis_agent = None
+report_agent = None
+long_term_memory = None
+analysis_history = None
+_runtime_lock = threading.Lock()
+_runtime_ready = False
+
+
+def _init_runtime():
+    global router_agent, data_agent, analysis_agent, report_agent, long_term_memory, analysis_history, _runtime_ready
+    if _runtime_ready:
+        return
+    with _runtime_lock:
+        if _runtime_ready:
+            return
+        from agents.router_agent import RouterAgent
+        from agents.data_agent import DataAgent
+        from agents.analysis_agent import AnalysisAgent
+        from agents.report_agent import ReportAgent
+        from memory.long_memory import LongTermMemory
+        from storage.analysis_store import AnalysisHistoryStore
+        from tools.stock_tools import StockTools
+        from tools.quote_poller import QuotePoller
+
+        # 所有 Agent 共享的 LLM 响应缓存
+        install_llm_cache()
+
+        # 实例化 Agents 和 记忆
+        router_agent = RouterAgent()
+        data_agent = DataAgent()
+        analysis_agent = AnalysisAgent()
+        report_agent = ReportAgent()
+        # 长期记忆：保存历史分析与报告，作为后续相关问题的参考上下文
+        long_term_memory = LongTermMemory() if settings.long_memory_enabled else None
+        # 分析/报告结果历史：后台批量写入，输入未变化时复用近期结果
+        analysis_history = AnalysisHistoryStore()
+
+        # 可选：后台轮询热门股票行情，写入共享快照
+        if settings.quote_poller_enabled:
+            QuotePoller(StockTools()).start()
+        _runtime_ready = True
+
 
 # ======== 定义 LangGraph 节点函数 ========
 
@@ -42,16 +89,81 @@ def call_router(state: AgentState):
     return {"current_agent": "router", "route": route, "final_goal": route}
 
 
+def _attach_related_history(user_input: str, data_context):
+    """在结构化的 data_context 中附上长期记忆里与问题相关的历史分析"""
+    if long_term_memory is None or not isinstance(data_context, dict) or set(data_context) == {"error"}:
+        return data_context
+    ts_code = data_context.get("ts_code")
+    # 只引用同一只股票的历史分析（或未关联股票的内容），避免相似措辞带入其他股票的结论
+    same_security = (lambda meta: not meta.get("ts_codes") or ts_code in meta["ts_codes"]) if ts_code else None
+    try:
+        hits = long_term_memory.search(user_input, k=settings.long_memory_top_k, where=same_security)
+    except Exception as e:
+        print(f"[WARNING LongTermMemory] Retrieval failed: {e}")
+        return data_context
+    if hits:
+        print(f"[DEBUG LongTermMemory] Retrieved {len(hits)} related chunks (best score {hits[0]['score']}).")
+        data_context = {**data_context, "related_history": hits}
+    return data_context
+
+
+def _data_hash(data_context) -> Optional[str]:
+    """单只股票的结构化数据指纹；检索到的历史分析不计入（它们本身就是此前的结果）"""
+    if not isinstance(data_context, dict) or not data_context.get("ts_code"):
+        return None
+    content = {k: v for k, v in data_context.items() if k != "related_history"}
+    return hashlib.sha256(json.dumps(content, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+
+def _query_hash(user_input: str) -> str:
+    normalized = re.sub(r"[\s，。？！,.?!]+", "", user_input).lower()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def _find_reusable_result(state: AgentState, data_context, data_hash: Optional[str]) -> Optional[Dict[str, str]]:
+    """同一股票、同一问题、数据未变化且未过期的历史结果；需要报告时必须有报告记录"""
+    if not data_hash or settings.analysis_reuse_max_age <= 0 or llm_cache_bypassed():
+        return None
+    ticker = data_context["ts_code"]
+    query_hash = _query_hash(state["user_input"])
+    max_age = settings.analysis_reuse_max_age
+    analysis = analysis_history.find_recent(ticker, "analysis", data_hash, query_hash, max_age)
+    if state.get("final_goal") == "report_generation":
+        report = analysis_history.find_recent(ticker, "report", data_hash, query_hash, max_age)
+        return {"analysis": analysis or "", "report": report} if report else None
+    return {"analysis": analysis, "report": analysis} if analysis else None
+
+
+def _after_data_retrieval(state: AgentState, result):
+    data_context = _attach_related_history(state["user_input"], result)
+    data_hash = _data_hash(result)
+    reused = _find_reusable_result(state, data_context, data_hash)
+    if reused:
+        print(f"[DEBUG MainRouter] Reusing stored result for {data_context['ts_code']} (data unchanged).")
+    return {"data_context": data_context, "data_hash": data_hash, "reused_result": reused,
+            "current_agent": "data_retrieval"}
+
+
+def _record_result(state: AgentState, analysis_type: str, result: str):
+    """把成功的分析/报告交给后台写入 analysis_history"""
+    data_context = state.get("data_context")
+    if not state.get("data_hash") or not result or result.startswith(("分析失败", "报告生成失败")):
+        return
+    analysis_history.record(data_context["ts_code"], analysis_type, result,
+                            state["data_hash"], _query_hash(state["user_input"]))
+
+
 def call_data_agent(state: AgentState):
     print("----- 进入 Data Agent Node -----")
     result = data_agent.run(state["user_input"], state["chat_history"])
-    return {"data_context": result, "current_agent": "data_retrieval"}
+    return _after_data_retrieval(state, result)
 
 
 def call_analysis_agent(state: AgentState):
     print("----- 进入 Analysis Agent Node -----")
     data_context = state.get("data_context", "没有可用的数据。")
     result = analysis_agent.run(state["user_input"], data_context, state["chat_history"])
+    _record_result(state, "analysis", result)
     # 将分析结果也映射到 report_content，以便最终统一提取
     return {"analysis_result": result, "report_content": result, "current_agent": "analysis"}
 
@@ -61,9 +173,65 @@ def call_report_agent(state: AgentState):
     data_context = state.get("data_context", "没有可用的数据。")
     analysis_result = state.get("analysis_result", "没有可用的分析结果。")
     result = report_agent.run(state["user_input"], data_context, analysis_result, state["chat_history"])
+    _record_result(state, "report", result)
+    return {"report_content": result, "current_agent": "report_generation"}
+
+
+def call_fused_report(state: AgentState):
+    print("----- 进入 Fused Report Node -----")
+    data_context = state.get("data_context", "没有可用的数据。")
+    analysis_result, report = report_agent.run_fused(state["user_input"], data_context, state["chat_history"])
+    _record_result(state, "analysis", analysis_result)
+    _record_result(state, "report", report)
+    return {"analysis_result": analysis_result, "report_content": report, "current_agent": "fused_report"}
+
+
+# 异步版本：通过 app.ainvoke/astream 运行时使用，等待 LLM 期间不占用线程
+
+async def acall_router(state: AgentState):
+    print("----- 进入 Router Node -----")
+    route = await router_agent.aroute_request(state["user_input"], state["chat_history"])
+    return {"current_agent": "router", "route": route, "final_goal": route}
+
+
+async def acall_data_agent(state: AgentState):
+    print("----- 进入 Data Agent Node -----")
+    result = await data_agent.arun(state["user_input"], state["chat_history"])
+    return _after_data_retrieval(state, result)
+
+
+async def acall_analysis_agent(state: AgentState):
+    print("----- 进入 Analysis Agent Node -----")
+    data_context = state.get("data_context", "没有可用的数据。")
+    result = await analysis_agent.arun(state["user_input"], data_context, state["chat_history"])
+    _record_result(state, "analysis", result)
+    return {"analysis_result": result, "report_content": result, "current_agent": "analysis"}
+
+
+async def acall_report_agent(state: AgentState):
+    print("----- 进入 Report Agent Node -----")
+    data_context = state.get("data_context", "没有可用的数据。")
+    analysis_result = state.get("analysis_result", "没有可用的分析结果。")
+    result = await report_agent.arun(state["user_input"], data_context, analysis_result, state["chat_history"])
+    _record_result(state, "report", result)
     return {"report_content": result, "current_agent": "report_generation"}
 
 
+async def acall_fused_report(state: AgentState):
+    print("----- 进入 Fused Report Node -----")
+    data_context = state.get("data_context", "没有可用的数据。")
+    analysis_result, report = await report_agent.arun_fused(state["user_input"], data_context, state["chat_history"])
+    _record_result(state, "analysis", analysis_result)
+    _record_result(state, "report", report)
+    return {"analysis_result": analysis_result, "report_content": report, "current_agent": "fused_report"}
+
+
+def call_reused_result(state: AgentState):
+    print("----- 进入 Reused Result Node -----")
+    reused = state["reused_result"]
+    return {"analysis_result": reused["analysis"], "report_content": reused["report"], "current_agent": "reused_result"}
+
+
 def call_general_response(state: AgentState):
     print("----- 进入 General Response Node -----")
     # 将通用响应也映射到 report_content
@@ -77,20 +245,14 @@ def router_decision_logic(state: AgentState) -> str:
     initial_route = state.get("route", "general_response")
     user_input = state["user_input"]
 
-    # 提取可能的股票名称或代码 (用于判断是否需要数据)
-    mentioned_stock_name = ""
-    for name in ["贵州茅台", "平安银行", "中国平安", "五粮液"]:
-        if name.lower() in user_input.lower():
-            mentioned_stock_name = name
-            break
-
-    stock_code_pattern = re.compile(r'\b(?:[0-9]{6})\b')
-    has_stock_code = stock_code_pattern.search(user_input)
+    # 通过证券主数据识别文本中提到的股票（名称/代码/拼音首字母）
+    mentioned_securities = get_security_master().resolve(user_input)
 
     # 如果初始路由是 analysis 或 report_generation，并且有股票相关关键词，就强制先去 data_retrieval
-    if initial_route in ["analysis", "report_generation"] and (mentioned_stock_name or has_stock_code):
+    if initial_route in ["analysis", "report_generation"] and mentioned_securities:
         print(
-            f"[DEBUG MainRouter] Initial route is {initial_route} for stock-related query. FORCING to data_retrieval first.")
+            f"[DEBUG MainRouter] Initial route is {initial_route} for stock-related query "
+            f"({', '.join(s.ts_code for s in mentioned_securities)}). FORCING to data_retrieval first.")
         return "data_retrieval"
 
     # 否则，按照 LLM/规则给出的初始路由走
@@ -98,6 +260,22 @@ def router_decision_logic(state: AgentState) -> str:
     return initial_route
 
 
+def _use_fused_report(state: AgentState) -> bool:
+    fused = state.get("fused_report")
+    return settings.fused_report_enabled if fused is None else fused
+
+
+def data_decision_logic(state: AgentState) -> str:
+    # 有可复用的近期结果时直接结束；需要生成报告且启用合并模式时，一次调用完成分析与报告；否则先进入分析
+    if state.get("reused_result"):
+        print("----- Data Decision Logic: reusing stored result -----")
+        return "reused_result"
+    if state.get("final_goal") == "report_generation" and _use_fused_report(state):
+        print("----- Data Decision Logic: using fused analysis + report -----")
+        return "fused_report"
+    return "analysis"
+
+
 def analysis_decision_logic(state: AgentState) -> str:
     print(f"----- Analysis Decision Logic: Final Goal is {state.get('final_goal')} -----")
     if state.get("final_goal") == "report_generation":
@@ -109,10 +287,13 @@ def analysis_decision_logic(state: AgentState) -> str:
 workflow = StateGraph(AgentState)
 
 # 添加节点
-workflow.add_node("router", call_router)
-workflow.add_node("data_retrieval", call_data_agent)
-workflow.add_node("analysis", call_analysis_agent)
-workflow.add_node("report_generation", call_report_agent)
+# 节点同时提供同步与异步实现，app.stream 与 app.astream 均可运行
+workflow.add_node("router", RunnableLambda(call_router, afunc=acall_router))
+workflow.add_node("data_retrieval", RunnableLambda(call_data_agent, afunc=acall_data_agent))
+workflow.add_node("analysis", RunnableLambda(call_analysis_agent, afunc=acall_analysis_agent))
+workflow.add_node("report_generation", RunnableLambda(call_report_agent, afunc=acall_report_agent))
+workflow.add_node("fused_report", RunnableLambda(call_fused_report, afunc=acall_fused_report))
+workflow.add_node("reused_result", call_reused_result)
 workflow.add_node("general_response", call_general_response)
 
 # 设置入口点
@@ -130,8 +311,16 @@ workflow.add_conditional_edges(
     },
 )
 
-# 数据获取后，默认进入分析
-workflow.add_edge("data_retrieval", "analysis")
+# 数据获取后进入分析；需要报告且启用合并模式时直接进入合并节点；数据未变化时复用近期结果
+workflow.add_conditional_edges(
+    "data_retrieval",
+    data_decision_logic,
+    {
+        "analysis": "analysis",
+        "fused_report": "fused_report",
+        "reused_result": "reused_result",
+    }
+)
 
 # 分析节点后的条件分支，根据 final_goal 决定是结束还是去生成报告
 workflow.add_conditional_edges(
@@ -145,36 +334,16 @@ workflow.add_conditional_edges(
 
 # 报告生成或通用响应后结束
 workflow.add_edge("report_generation", END)
+workflow.add_edge("fused_report", END)
+workflow.add_edge("reused_result", END)
 workflow.add_edge("general_response", END)
 
 # 编译图
 app = workflow.compile()
 
 
-def run_agent_workflow(user_query: str):
-    # 更新短期记忆
-    short_term_memory.add_message(HumanMessage(content=user_query))
-    current_chat_history = short_term_memory.get_messages()
-
-    # 初始状态
-    initial_state = AgentState(
-        user_input=user_query,
-        chat_history=current_chat_history,
-        data_context=None,
-        analysis_result=None,
-        report_content=None,
-        current_agent="start",
-        route="",
-        final_goal=""
-    )
-    # 运行图
-    final_state = None
-    for s in app.stream(initial_state):
-        final_state = s
-        current_node_key = list(s.keys())[0] if s else "Unknown"
-        print(f"--- 当前节点: {current_node_key} ---")
-
-    # 智能地提取最终输出，根据 final_goal 优先级
+def _extract_final_output(final_state) -> str:
+    """智能地提取最终输出，根据 final_goal 优先级"""
     final_output = "系统未能生成预期结果。"
     if final_state:
         resolved_final_state = final_state.get(END) if END in final_state else None
@@ -204,12 +373,126 @@ def run_agent_workflow(user_query: str):
             final_output = "系统未返回任何状态，可能在启动时发生错误。"
     else:
         final_output = "系统未返回任何状态，可能在启动时发生错误。"
+    return final_output
+
+
+def _remember_answer(user_query: str, final_state, final_output: str):
+    """分析/报告类回答在后台写入长期记忆（图表标记指向的临时文件不保存）"""
+    if long_term_memory is None or not final_state:
+        return
+    last_update = final_state[list(final_state.keys())[-1]] or {}
+    answer_type = last_update.get("current_agent")
+    if answer_type not in ("analysis", "report_generation", "fused_report") \
+            or final_output.startswith(("分析失败", "报告生成失败")):
+        return
+    ts_codes = [s.ts_code for s in get_security_master().resolve(user_query)]
+    long_term_memory.add_knowledge_async(
+        f"问题：{user_query}\n{strip_chart_markers(final_output)}",
+        {"query": user_query, "type": answer_type, "ts_codes": ts_codes},
+    )
+
+
+def _initial_state(user_query: str, chat_history: List[BaseMessage], fused_report: Optional[bool]) -> AgentState:
+    return AgentState(
+        user_input=user_query,
+        chat_history=chat_history,
+        data_context=None,
+        analysis_result=None,
+        report_content=None,
+        current_agent="start",
+        route="",
+        final_goal="",
+        fused_report=fused_report,
+        data_hash=None,
+        reused_result=None
+    )
+
+
+def run_agent_workflow(user_query: str, bypass_cache: bool = False, fused_report: Optional[bool] = None):
+    """fused_report 为 None 时按 settings.fused_report_enabled 决定报告请求是否合并分析与报告"""
+    _init_runtime()
+    # 更新短期记忆
+    short_term_memory.add_message(HumanMessage(content=user_query))
+    current_chat_history = short_term_memory.get_messages()
+
+    # 初始状态
+    initial_state = _initial_state(user_query, current_chat_history, fused_report)
+    # 运行图
+    final_state = None
+    # bypass_cache=True 时忽略已缓存的 LLM 响应，重新生成并刷新缓存
+    with llm_cache_bypass(bypass_cache):
+        for s in app.stream(initial_state):
+            final_state = s
+            current_node_key = list(s.keys())[0] if s else "Unknown"
+            print(f"--- 当前节点: {current_node_key} ---")
+
+    final_output = _extract_final_output(final_state)
+    _remember_answer(user_query, final_state, final_output)
 
     # 更新记忆
     short_term_memory.add_message(AIMessage(content=final_output))
     return final_output
 
 
+def stream_agent_workflow(user_query: str, bypass_cache: bool = False,
+                          fused_report: Optional[bool] = None) -> Iterator[Dict[str, str]]:
+    """
+    run_agent_workflow 的流式版本，逐个产出事件：
+    - {"type": "node", "node": 节点名}：某个节点执行完成；
+    - {"type": "token", "node": 节点名, "content": 文本片段}：最终答案节点生成的 LLM token；
+    - {"type": "final", "content": 完整回答}：图运行结束后的最终输出（与 run_agent_workflow 返回值一致）。
+    需要生成报告时只转发报告节点（或合并节点）的 token，分析节点的中间结果不直接展示。
+    """
+    _init_runtime()
+    short_term_memory.add_message(HumanMessage(content=user_query))
+    current_chat_history = short_term_memory.get_messages()
+
+    initial_state = _initial_state(user_query, current_chat_history, fused_report)
+    final_state = None
+    answer_nodes = {"analysis"}
+    with llm_cache_bypass(bypass_cache):
+        for mode, payload in app.stream(initial_state, stream_mode=["updates", "messages"]):
+            if mode == "messages":
+                chunk, metadata = payload
+                node = metadata.get("langgraph_node")
+                if node in answer_nodes and isinstance(chunk.content, str) and chunk.content:
+                    yield {"type": "token", "node": node, "content": chunk.content}
+                continue
+
+            final_state = payload
+            for node, update in payload.items():
+                if node == "router" and update and update.get("final_goal") == "report_generation":
+                    answer_nodes = {"report_generation", "fused_report"}
+                print(f"--- 当前节点: {node} ---")
+                yield {"type": "node", "node": node}
+
+    final_output = _extract_final_output(final_state)
+    _remember_answer(user_query, final_state, final_output)
+    short_term_memory.add_message(AIMessage(content=final_output))
+    yield {"type": "final", "content": final_output}
+
+
+async def arun_agent_workflow(user_query: str, bypass_cache: bool = False,
+                              fused_report: Optional[bool] = None) -> str:
+    """run_agent_workflow 的异步版本：同一进程内可并发处理多个用户请求"""
+    _init_runtime()
+    short_term_memory.add_message(HumanMessage(content=user_query))
+    current_chat_history = short_term_memory.get_messages()
+
+    initial_state = _initial_state(user_query, current_chat_history, fused_report)
+    final_state = None
+    with llm_cache_bypass(bypass_cache):
+        async for s in app.astream(initial_state):
+            final_state = s
+            current_node_key = list(s.keys())[0] if s else "Unknown"
+            print(f"--- 当前节点: {current_node_key} ---")
+
+    final_output = _extract_final_output(final_state)
+    _remember_answer(user_query, final_state, final_output)
+    short_term_memory.add_message(AIMessage(content=final_output))
+    return final_output
+
+
 if __name__ == "__main__":
     print("金融多智能体系统启动，国内版，基于LangGraph和Qwen。")
     while True:
@@ -1,31 +1,319 @@
-from typing import List, Dict, Any
-# from langchain_community.embeddings import DashScopeEmbeddings # 如需Qwen embedding
-# from langchain_community.vectorstores import FAISS # 如需向量数据库
-# from langchain.text_splitter import RecursiveCharacterTextSplitter
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Sequence
+import numpy as np
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from config.settings import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows 无 fcntl
+    fcntl = None
+
+# 嵌入函数：输入一批文本，返回 (文本数, 维度) 的 float32 矩阵
+EmbeddingFunction = Callable[[Sequence[str]], np.ndarray]
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:\.[a-z]+)?|[一-鿿]")
+
+
+class HashingEmbedder:
+    """
+    完全本地、无需训练的嵌入：中文按单字与相邻二字、英文/数字按整词切分，
+    经 crc32 哈希到固定维度（带符号以抵消冲突），词频取 1 + log(tf)，最后 L2 归一化。
+    """
+
+    def __init__(self, dim: int = None):
+        self.dim = dim or settings.long_memory_dim
+        self.name = f"hashing:{self.dim}"
+
+    def _features(self, text: str) -> List[str]:
+        tokens = _TOKEN_PATTERN.findall(text.lower())
+        bigrams = [a + b for a, b in zip(tokens, tokens[1:]) if len(a) == 1 and len(b) == 1]
+        return tokens + bigrams
+
+    def __call__(self, texts: Sequence[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            counts: Dict[str, int] = {}
+            for feature in self._features(text or ""):
+                counts[feature] = counts.get(feature, 0) + 1
+            if not counts:
+                continue
+            hashes = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in counts), dtype=np.uint64, count=len(counts))
+            weights = 1.0 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+            signs = np.where(hashes & (1 << 31), -1.0, 1.0).astype(np.float32)
+            np.add.at(out[row], (hashes % self.dim).astype(np.int64), weights * signs)
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.where(norms == 0, 1.0, norms)
+
+
+class DashScopeEmbedder:
+    """通义千问 DashScope 文本嵌入（需要网络与 QWEN_API_KEY）"""
 
-class LongTermMemory:
     def __init__(self):
-        # self.embeddings = DashScopeEmbeddings(dashscope_api_key=settings.qwen_api_key)
-        # self.vector_store = FAISS.from_documents([], self.embeddings)
-        # self.text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        print("LongTermMemory initialized (placeholder). Extend with VectorDB for RAG.")
+        from langchain_community.embeddings import DashScopeEmbeddings
+        self.name = f"dashscope:{settings.long_memory_dashscope_model}"
+        self.embeddings = DashScopeEmbeddings(model=settings.long_memory_dashscope_model,
+                                              dashscope_api_key=settings.qwen_api_key)
+
+    def __call__(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.asarray(self.embeddings.embed_documents(list(texts)), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1.0, norms)
+
+
+def get_embedder(name: str = None) -> EmbeddingFunction:
+    name = name or settings.long_memory_embedder
+    if name == "dashscope":
+        return DashScopeEmbedder()
+    if name != "hashing":
+        print(f"[WARNING LongTermMemory] Unknown embedder '{name}'. Using hashing embedder.")
+    return HashingEmbedder()
+
+
+class LongTermMemory:
+    """
+    长期记忆：文本切块后嵌入，向量以 float32 行追加写入 vectors.f32，元数据逐行写入 meta.jsonl。
+    启动时以 np.memmap 映射已有向量，不重新嵌入；检索为归一化向量的分块矩阵乘 + argpartition 取 top-k，
+    支持一次检索多条查询。写入与检索可并发进行，检索使用写入前的快照。
+    多个进程共用同一目录时，写入期间持有 LOCK_FILE 上的排他 flock，并先读入其他进程追加的行。
+    """
+
+    VECTOR_FILE = "vectors.f32"
+    META_FILE = "meta.jsonl"
+    INDEX_FILE = "index.json"
+    LOCK_FILE = "write.lock"
+
+    def __init__(self, root: str = None, embedding_function: EmbeddingFunction = None):
+        self.root = root or settings.long_memory_dir
+        self.embed = embedding_function or get_embedder()
+        self.embedder_name = getattr(self.embed, "name", type(self.embed).__name__)
+        self.text_splitter = RecursiveCharacterTextSplitter(chunk_size=settings.long_memory_chunk_size,
+                                                            chunk_overlap=settings.long_memory_chunk_overlap)
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="long-memory")
+        self._vectors: Optional[np.ndarray] = None
+        self._offsets: List[int] = []
+        self._meta_size = 0
+        self.dim: Optional[int] = None
+        os.makedirs(self.root, exist_ok=True)
+        self._open()
+        print(f"[DEBUG LongTermMemory] Loaded {len(self)} chunks from {self.root} (embedder: {self.embedder_name}).")
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
 
-    def add_knowledge(self, knowledge: str, metadata: Dict[str, Any] = None):
-        """添加知识到长期记忆"""
-        # docs = self.text_splitter.create_documents([knowledge], metadatas=[metadata or {}])
-        # self.vector_store.add_documents(docs)
-        print(f"Adding knowledge to long-term memory: {knowledge[:50]}...")
+    def _open(self):
+        """映射已有索引；嵌入方式或维度变化时用 meta.jsonl 中的原文重建一次"""
+        info = self._read_index_info()
+        self._offsets = self._scan_offsets()
+        self.dim = info.get("dim")
+
+        if self._offsets and info.get("embedder") != self.embedder_name:
+            print(f"[WARNING LongTermMemory] Index built with '{info.get('embedder')}', "
+                  f"current embedder is '{self.embedder_name}'. Re-embedding {len(self._offsets)} chunks.")
+            self._rebuild()
+            return
+        self._remap()
+
+    @contextmanager
+    def _file_lock(self):
+        """跨进程写锁：偏移量取自文件长度，两个进程交错追加会使向量与元数据行错位"""
+        if fcntl is None:
+            yield
+            return
+        with open(self._path(self.LOCK_FILE), "a+b") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _read_index_info(self) -> Dict[str, Any]:
+        index_path = self._path(self.INDEX_FILE)
+        if not os.path.exists(index_path):
+            return {}
+        with open(index_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _scan_offsets(self) -> List[int]:
+        """记录每条元数据的起始字节位置，检索时按需读取，不在启动时解析全部 JSON"""
+        offsets = []
+        meta_path = self._path(self.META_FILE)
+        position = 0
+        if os.path.exists(meta_path):
+            with open(meta_path, "rb") as f:
+                for line in f:
+                    if line.strip():
+                        offsets.append(position)
+                    position += len(line)
+        self._meta_size = position
+        return offsets
+
+    def _remap(self):
+        vector_path = self._path(self.VECTOR_FILE)
+        if not self.dim or not os.path.exists(vector_path) or not self._offsets:
+            self._vectors = None
+            return
+        rows = min(len(self._offsets), os.path.getsize(vector_path) // (self.dim * 4))
+        # 追加写入中途失败时向量与元数据行数可能不一致，以较小者为准
+        self._offsets = self._offsets[:rows]
+        self._vectors = np.memmap(vector_path, dtype=np.float32, mode="r", shape=(rows, self.dim)) if rows else None
+
+    def _write_index_info(self):
+        tmp_path = self._path(self.INDEX_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"embedder": self.embedder_name, "dim": self.dim}, f)
+        os.replace(tmp_path, self._path(self.INDEX_FILE))
+
+    def _rebuild(self):
+        records = self._read_records(range(len(self._offsets)))
+        self._remove_files()
+        self._append([r["text"] for r in records], [r.get("metadata", {}) for r in records],
+                     [r.get("created_at", time.time()) for r in records])
+
+    def _append(self, texts: List[str], metadatas: List[Dict[str, Any]], created_at: List[float]):
+        batch = settings.long_memory_embed_batch_size
+        vectors = np.concatenate([np.asarray(self.embed(texts[i:i + batch]), dtype=np.float32)
+                                  for i in range(0, len(texts), batch)])
+
+        with self._file_lock():
+            # 其他进程可能已追加过：先同步其写入的行与索引信息，再以当前文件长度为起点
+            meta_path = self._path(self.META_FILE)
+            position = os.path.getsize(meta_path) if os.path.exists(meta_path) else 0
+            if position != self._meta_size:
+                self._offsets = self._scan_offsets()
+                self.dim = self._read_index_info().get("dim", self.dim)
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._write_index_info()
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"嵌入维度 {vectors.shape[1]} 与索引维度 {self.dim} 不一致")
+
+            new_offsets = []
+            lines = []
+            for text, metadata, ts in zip(texts, metadatas, created_at):
+                line = (json.dumps({"text": text, "metadata": metadata, "created_at": ts},
+                                   ensure_ascii=False, default=str) + "\n").encode("utf-8")
+                new_offsets.append(position)
+                lines.append(line)
+                position += len(line)
+
+            # 先写向量再写元数据：中途失败时多出的向量行在下次追加前截掉，保证行号对齐
+            vector_path = self._path(self.VECTOR_FILE)
+            expected_size = len(self._offsets) * self.dim * 4
+            if os.path.exists(vector_path) and os.path.getsize(vector_path) > expected_size:
+                os.truncate(vector_path, expected_size)
+            with open(vector_path, "ab") as f:
+                f.write(vectors.tobytes())
+            with open(meta_path, "ab") as f:
+                f.write(b"".join(lines))
+            self._offsets = self._offsets + new_offsets
+            self._meta_size = position
+            self._remap()
+
+    def _remove_files(self):
+        with self._file_lock():
+            for name in (self.VECTOR_FILE, self.META_FILE, self.INDEX_FILE):
+                if os.path.exists(self._path(name)):
+                    os.remove(self._path(name))
+        self._offsets, self._vectors, self.dim, self._meta_size = [], None, None, 0
+
+    def add_knowledge(self, knowledge: str, metadata: Dict[str, Any] = None) -> int:
+        """添加知识到长期记忆：切块、去重、嵌入并追加到索引，返回新增块数"""
+        if not knowledge or not knowledge.strip():
+            return 0
+        chunks = self.text_splitter.split_text(knowledge)
+        # 与已有内容几乎相同的块（如同一问题的重复回答）不再写入
+        if len(self) and settings.long_memory_dedupe_score < 1:
+            hits = self.search_batch(chunks, k=1, min_score=settings.long_memory_dedupe_score)
+            chunks = [chunk for chunk, hit in zip(chunks, hits) if not hit]
+        if not chunks:
+            return 0
+        now = time.time()
+        with self._lock:
+            self._append(chunks, [metadata or {}] * len(chunks), [now] * len(chunks))
+        return len(chunks)
+
+    def add_knowledge_async(self, knowledge: str, metadata: Dict[str, Any] = None):
+        """在后台线程写入，不占用请求路径"""
+        def task():
+            try:
+                self.add_knowledge(knowledge, metadata)
+            except Exception as e:
+                print(f"[WARNING LongTermMemory] Adding knowledge failed: {e}")
+        return self._writer.submit(task)
+
+    def _read_records(self, rows, offsets: List[int] = None) -> List[Dict[str, Any]]:
+        offsets = self._offsets if offsets is None else offsets
+        records = []
+        if not rows:
+            return records
+        with open(self._path(self.META_FILE), "rb") as f:
+            for row in rows:
+                f.seek(offsets[row])
+                records.append(json.loads(f.readline()))
+        return records
+
+    def search_batch(self, queries: Sequence[str], k: int = 3, min_score: float = None,
+                     where: Callable[[Dict[str, Any]], bool] = None) -> List[List[Dict[str, Any]]]:
+        """
+        批量检索：每条查询返回按相似度降序的 [{"text", "metadata", "created_at", "score"}]。
+        向量分块参与矩阵乘，内存占用与索引大小无关。
+        where 按元数据过滤：先多取 long_memory_filter_oversample 倍候选，再过滤并截取前 k 条。
+        """
+        min_score = settings.long_memory_min_score if min_score is None else min_score
+        vectors, offsets = self._vectors, self._offsets
+        if vectors is None or not queries or k <= 0:
+            return [[] for _ in queries]
+        limit = k
+        if where is not None:
+            k *= settings.long_memory_filter_oversample
+
+        q = np.asarray(self.embed(list(queries)), dtype=np.float32)
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        block = settings.long_memory_search_block
+        for start in range(0, vectors.shape[0], block):
+            scores = q @ vectors[start:start + block].T
+            take = min(k, scores.shape[1])
+            top = np.argpartition(-scores, take - 1, axis=1)[:, :take]
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+            best_rows = np.concatenate([best_rows, top + start], axis=1)
+            if best_scores.shape[1] > k:
+                keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+
+        results = []
+        for scores, rows in zip(best_scores, best_rows):
+            order = np.argsort(-scores)
+            hits = [(int(rows[i]), float(scores[i])) for i in order if scores[i] >= min_score]
+            records = self._read_records([row for row, _ in hits], offsets)
+            matched = [dict(record, score=round(score, 4)) for record, (_, score) in zip(records, hits)
+                       if where is None or where(record.get("metadata", {}))]
+            results.append(matched[:limit])
+        return results
+
+    def search(self, query: str, k: int = 3, min_score: float = None,
+               where: Callable[[Dict[str, Any]], bool] = None) -> List[Dict[str, Any]]:
+        return self.search_batch([query], k, min_score, where)[0]
 
     def retrieve_knowledge(self, query: str, k: int = 3) -> List[str]:
         """从长期记忆中检索相关知识"""
-        # if self.vector_store:
-        #     docs = self.vector_store.similarity_search(query, k=k)
-        #     return [doc.page_content for doc in docs]
-        print(f"Retrieving knowledge for query: {query}")
-        return [] # Placeholder
+        return [hit["text"] for hit in self.search(query, k)]
 
     def clear(self):
         """清空长期记忆"""
-        # self.vector_store = FAISS.from_documents([], self.embeddings)
+        with self._lock:
+            self._remove_files()
         print("LongTermMemory cleared.")
-
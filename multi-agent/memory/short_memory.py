@@ -1,29 +1,162 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from langchain.memory import ConversationBufferMemory
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
-from typing import List
+from typing import Deque, List, Optional, Tuple
+from config.settings import settings
+from tools.token_counter import count_tokens, truncate_to_tokens
+
+SUMMARY_PROMPT = (
+    "你负责维护一段对话的滚动摘要。请把新增的对话内容合并进已有摘要，保留用户关注的股票、"
+    "问题和结论，删除寒暄与重复信息，输出不超过 {max_tokens} 字的中文摘要，只输出摘要本身。\n"
+    "已有摘要：\n{summary}\n\n新增对话：\n{dialogue}"
+)
+
 
 class ShortTermMemory:
-    def __init__(self):
-        # LangChainDeprecationWarning: 请参阅迁移指南 at: https://python.langchain.com/docs/versions/migrating_memory/
-        # 在 LangGraph 中我们将手动处理消息，此处的 ConversationBufferMemory 主要用于格式化
-        self.memory = ConversationBufferMemory(return_messages=True)
+    """
+    短期对话记忆，两种模式（short_memory_mode）：
+    - buffer：完整保存全部消息（原有行为）；
+    - bounded：最近 short_memory_keep_turns 轮原样保留且总量不超过 short_memory_token_budget，
+      更早的消息在后台增量合并进滚动摘要（每次只处理新移出的消息，不重算整段历史）。
+    get_messages 返回预先构建并缓存的消息列表，Agent 可直接放入提示词。
+    """
+
+    def __init__(self, mode: str = None):
+        self.mode = mode or settings.short_memory_mode
+        self._lock = threading.RLock()
+        if self.mode == "buffer":
+            # LangChainDeprecationWarning: 请参阅迁移指南 at: https://python.langchain.com/docs/versions/migrating_memory/
+            # 在 LangGraph 中我们将手动处理消息，此处的 ConversationBufferMemory 主要用于格式化
+            self.memory = ConversationBufferMemory(return_messages=True)
+            return
+
+        self.memory = None
+        self._recent: Deque[Tuple[BaseMessage, int]] = deque()
+        self._recent_tokens = 0
+        self._summary = ""
+        self._pending: List[BaseMessage] = []
+        self._cached: Optional[List[BaseMessage]] = None
+        # clear() 时递增，丢弃清空前提交的摘要任务结果
+        self._generation = 0
+        self._folder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory-summary")
 
     def add_message(self, message: BaseMessage):
+        if self.memory is not None:
+            if isinstance(message, HumanMessage):
+                self.memory.chat_memory.add_user_message(message.content)
+            elif isinstance(message, AIMessage):
+                self.memory.chat_memory.add_ai_message(message.content)
+            return
+
         if isinstance(message, HumanMessage):
-            self.memory.chat_memory.add_user_message(message.content)
+            message = HumanMessage(content=message.content)
         elif isinstance(message, AIMessage):
-            self.memory.chat_memory.add_ai_message(message.content)
+            message = AIMessage(content=message.content)
+        else:
+            return
+
+        with self._lock:
+            tokens = count_tokens(message.content)
+            self._recent.append((message, tokens))
+            self._recent_tokens += tokens
+            evicted = False
+            # 始终保留最新一条消息，其余按轮数和 token 预算从最早的开始移出
+            while len(self._recent) > 1 and (
+                len(self._recent) > settings.short_memory_keep_turns * 2
+                or self._recent_tokens > settings.short_memory_token_budget
+            ):
+                old, old_tokens = self._recent.popleft()
+                self._recent_tokens -= old_tokens
+                self._pending.append(old)
+                evicted = True
+            self._cached = None
+            generation = self._generation
+
+        if evicted:
+            self._folder.submit(self._fold, generation)
+
+    def _fold(self, generation: int):
+        """把已移出的消息合并进摘要；单线程执行，保证摘要按顺序增量更新"""
+        with self._lock:
+            if generation != self._generation or not self._pending:
+                return
+            batch, self._pending = self._pending, []
+            summary = self._summary
+
+        try:
+            new_summary = self._summarize(summary, batch)
+        except Exception as e:
+            print(f"[WARNING ShortTermMemory] LLM summary failed: {e}. Using extractive summary.")
+            new_summary = self._extractive_summary(summary, batch)
+
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._summary = new_summary
+            self._cached = None
+
+    @staticmethod
+    def _dialogue(messages: List[BaseMessage], max_tokens: int = None) -> List[str]:
+        lines = []
+        for msg in messages:
+            role = "用户" if isinstance(msg, HumanMessage) else "助手"
+            content = msg.content if max_tokens is None else truncate_to_tokens(msg.content, max_tokens)
+            lines.append(f"{role}：{content}")
+        return lines
+
+    def _summarize(self, summary: str, messages: List[BaseMessage]) -> str:
+        if not settings.qwen_api_key:
+            return self._extractive_summary(summary, messages)
+        from agents.llm_client import llm_client
+
+        max_tokens = settings.short_memory_summary_tokens
+        prompt = SUMMARY_PROMPT.format(
+            max_tokens=max_tokens,
+            summary=summary or "（无）",
+            dialogue="\n".join(self._dialogue(messages, max_tokens)),
+        )
+        response = llm_client.invoke([HumanMessage(content=prompt)])
+        return truncate_to_tokens(response.content.strip(), max_tokens)
+
+    def _extractive_summary(self, summary: str, messages: List[BaseMessage]) -> str:
+        """不调用 LLM 的兜底摘要：每条消息保留开头一小段，超出预算时丢弃最早的内容"""
+        lines = (summary.splitlines() if summary else []) + self._dialogue(messages, 60)
+        while len(lines) > 1 and count_tokens("\n".join(lines)) > settings.short_memory_summary_tokens:
+            lines.pop(0)
+        return truncate_to_tokens("\n".join(lines), settings.short_memory_summary_tokens)
 
     def get_messages(self) -> List[BaseMessage]:
-        return self.memory.chat_memory.messages
+        if self.memory is not None:
+            return self.memory.chat_memory.messages
+
+        with self._lock:
+            if self._cached is None:
+                # 摘要以一问一答的形式放在最前面，避免出现位于中间的 system 消息
+                prefix = [
+                    HumanMessage(content=f"（此前对话摘要）\n{self._summary}"),
+                    AIMessage(content="好的，我已了解之前的对话内容。"),
+                ] if self._summary else []
+                self._cached = prefix + [msg for msg, _ in self._recent]
+            return self._cached
 
     def clear(self):
-        self.memory.clear()
+        if self.memory is not None:
+            self.memory.clear()
+            return
+        with self._lock:
+            self._generation += 1
+            self._recent.clear()
+            self._recent_tokens = 0
+            self._summary = ""
+            self._pending = []
+            self._cached = None
 
     def get_history_string(self) -> str:
         """返回格式化的聊天历史字符串"""
         history = ""
-        for msg in self.memory.chat_memory.messages:
+        for msg in self.get_messages():
             if isinstance(msg, HumanMessage):
                 history += f"Human: {msg.content}\n"
             elif isinstance(msg, AIMessage):
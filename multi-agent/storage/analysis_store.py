@@ -0,0 +1,122 @@
+import atexit
+import threading
+import time
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+from config.settings import settings
+from storage.database import get_connection
+
+_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _utc_timestamp(seconds: float = None) -> str:
+    """与列默认值 CURRENT_TIMESTAMP 相同的 UTC 文本格式，保证按字符串比较即按时间比较"""
+    return datetime.fromtimestamp(time.time() if seconds is None else seconds, timezone.utc).strftime(_TIMESTAMP_FORMAT)
+
+
+class AnalysisHistoryStore:
+    """
+    分析/报告结果历史（analysis_history 表）：
+    - 写入先进入内存中的待写列表，由后台线程按 analysis_history_batch_size 条或
+      analysis_history_flush_interval 秒批量提交，请求路径上不做磁盘 I/O；提交失败的批次留在列表中退避重试，
+      查找时同样检查尚未落盘的结果；
+    - data_hash（输入数据指纹）与 query_hash（问题指纹）列在旧库上通过 ALTER TABLE 补齐，
+      查找时要求二者与当前请求一致，且结果不早于 max_age 秒。
+    """
+
+    def __init__(self, db_path: str = None):
+        self.db_path = db_path
+        conn = get_connection(self.db_path)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS analysis_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ticker TEXT NOT NULL,
+                analysis_type TEXT NOT NULL,
+                result TEXT NOT NULL,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(analysis_history)")}
+        for column in ("data_hash", "query_hash"):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE analysis_history ADD COLUMN {column} TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_analysis_history_lookup "
+                     "ON analysis_history (ticker, analysis_type, timestamp)")
+        conn.commit()
+
+        # 已提交但尚未写入数据库的结果，按提交顺序排列；只有写入成功后才从头部移除
+        self._pending: List[Tuple] = []
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._writer_loop, name="analysis-history-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self._flush_at_exit)
+
+    def record(self, ticker: str, analysis_type: str, result: str, data_hash: str = None, query_hash: str = None):
+        """提交一条结果，由后台线程写入"""
+        with self._cond:
+            self._pending.append((ticker, analysis_type, result, _utc_timestamp(), data_hash, query_hash))
+            self._cond.notify_all()
+
+    def flush(self, timeout: float = None) -> bool:
+        """等待已提交的结果全部写入，超时仍有未写入的结果时返回 False"""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending, timeout)
+
+    def _flush_at_exit(self):
+        if not self.flush(settings.analysis_history_exit_timeout):
+            print(f"[ERROR AnalysisHistoryStore] {len(self._pending)} results not written before exit.")
+
+    def _writer_loop(self):
+        failures = 0
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending)
+                # 上次失败的批次立即重试（退避已在失败时完成），否则等待攒满一批或到达提交间隔
+                if not failures:
+                    deadline = time.monotonic() + settings.analysis_history_flush_interval
+                    self._cond.wait_for(lambda: len(self._pending) >= settings.analysis_history_batch_size,
+                                        max(0.0, deadline - time.monotonic()))
+                batch = self._pending[:settings.analysis_history_batch_size]
+            try:
+                conn = get_connection(self.db_path)
+                conn.executemany(
+                    "INSERT INTO analysis_history (ticker, analysis_type, result, timestamp, data_hash, query_hash) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    batch
+                )
+                conn.commit()
+            except Exception as e:
+                failures += 1
+                delay = min(settings.analysis_history_retry_max_delay, 2 ** (failures - 1))
+                print(f"[ERROR AnalysisHistoryStore] Writing {len(batch)} results failed: {e}. "
+                      f"Retrying in {delay} seconds.")
+                time.sleep(delay)
+                continue
+            failures = 0
+            with self._cond:
+                del self._pending[:len(batch)]
+                self._cond.notify_all()
+
+    def find_recent(self, ticker: str, analysis_type: str, data_hash: str, query_hash: str,
+                    max_age: float) -> Optional[str]:
+        """返回 max_age 秒内、输入数据与问题均相同的最新结果（含尚未落盘的），没有则返回 None"""
+        since = _utc_timestamp(time.time() - max_age)
+        with self._cond:
+            for row in reversed(self._pending):
+                if row[:2] == (ticker, analysis_type) and row[3] >= since and row[4:] == (data_hash, query_hash):
+                    return row[2]
+        row = get_connection(self.db_path).execute(
+            "SELECT result FROM analysis_history "
+            "WHERE ticker = ? AND analysis_type = ? AND timestamp >= ? AND data_hash = ? AND query_hash = ? "
+            "ORDER BY timestamp DESC LIMIT 1",
+            (ticker, analysis_type, since, data_hash, query_hash)
+        ).fetchone()
+        return row[0] if row else None
+
+    def latest(self, ticker: str, analysis_type: str, limit: int = 5) -> List[Tuple[str, str]]:
+        """某只股票最近的若干条结果 [(时间, 内容)]"""
+        return get_connection(self.db_path).execute(
+            "SELECT timestamp, result FROM analysis_history WHERE ticker = ? AND analysis_type = ? "
+            "ORDER BY timestamp DESC LIMIT ?",
+            (ticker, analysis_type, limit)
+        ).fetchall()
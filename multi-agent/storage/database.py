@@ -0,0 +1,26 @@
+import os
+import sqlite3
+import threading
+from config.settings import settings
+
+_local = threading.local()
+
+
+def get_connection(path: str = None) -> sqlite3.Connection:
+    """
+    获取当前线程的 SQLite 连接（每个线程、每个数据库文件复用一个连接）。
+    连接开启 WAL 模式，读写互不阻塞，适合 Streamlit 多会话并发访问。
+    """
+    path = path or settings.database_path
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(path)
+    if conn is None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = sqlite3.connect(path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        connections[path] = conn
+    return conn
@@ -0,0 +1,163 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from config.settings import settings
+from tools.market_hours import now_cn
+from tools.security_master import TS_CODE_PATTERN, InvalidCodeError
+
+# 与 TuShare daily 返回字段保持一致
+HISTORY_COLUMNS = ["ts_code", "trade_date", "open", "high", "low", "close",
+                   "pre_close", "change", "pct_chg", "vol", "amount"]
+
+
+def _latest_expected_trade_date(now: datetime = None) -> str:
+    """按工作日推算最近一个应已收盘的交易日（收盘数据约 15:30 后可用，未考虑节假日）"""
+    now = now or now_cn()
+    day = now.date() if now.hour * 60 + now.minute >= 15 * 60 + 30 else now.date() - timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day.strftime("%Y%m%d")
+
+
+class HistoryStore:
+    """
+    日线历史本地列式存储：每只股票一个 Parquet 文件（data/history/<ts_code>.parquet）。
+    请求时只向 TuShare 补齐缺失的交易日（含早于本地最早日期的区间），按任意区间返回 DataFrame 切片；
+    内存中最多保留 history_cache_size 只股票的数据（LRU）。
+    """
+
+    def __init__(self, pro=None, root: str = None):
+        self.pro = pro
+        self.root = root or settings.history_dir
+        self._frames: "OrderedDict[str, pd.DataFrame]" = OrderedDict()
+        self._frames_lock = threading.Lock()
+        self._checked_at: Dict[str, float] = {}
+        # 已向前补齐到的最早日期：上市晚于该日期时本地最早日期仍会更晚，避免重复请求
+        self._covered_from: Dict[str, str] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    def _path(self, ts_code: str) -> str:
+        return os.path.join(self.root, f"{ts_code}.parquet")
+
+    def _lock_for(self, ts_code: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(ts_code, threading.Lock())
+
+    def _cached(self, ts_code: str) -> Optional[pd.DataFrame]:
+        with self._frames_lock:
+            frame = self._frames.get(ts_code)
+            if frame is not None:
+                self._frames.move_to_end(ts_code)
+            return frame
+
+    def _remember(self, ts_code: str, frame: pd.DataFrame):
+        with self._frames_lock:
+            self._frames[ts_code] = frame
+            self._frames.move_to_end(ts_code)
+            while len(self._frames) > settings.history_cache_size:
+                self._frames.popitem(last=False)
+
+    def _load(self, ts_code: str) -> pd.DataFrame:
+        frame = self._cached(ts_code)
+        if frame is not None:
+            return frame
+        path = self._path(ts_code)
+        if os.path.exists(path):
+            # memory_map 读取避免额外拷贝，索引为交易日（升序）
+            frame = pq.read_table(path, memory_map=True).to_pandas()
+            frame.index = pd.to_datetime(frame["trade_date"], format="%Y%m%d")
+        else:
+            frame = pd.DataFrame(columns=HISTORY_COLUMNS, index=pd.DatetimeIndex([], name="trade_date"))
+        self._remember(ts_code, frame)
+        return frame
+
+    def _save(self, ts_code: str, frame: pd.DataFrame):
+        os.makedirs(self.root, exist_ok=True)
+        path = self._path(ts_code)
+        tmp_path = f"{path}.tmp"
+        pq.write_table(pa.Table.from_pandas(frame[HISTORY_COLUMNS], preserve_index=False), tmp_path)
+        os.replace(tmp_path, path)
+
+    def _fetch(self, ts_code: str, start_date: str, end_date: str) -> pd.DataFrame:
+        df = self.pro.daily(ts_code=ts_code, start_date=start_date, end_date=end_date)
+        if df is None or df.empty:
+            return pd.DataFrame(columns=HISTORY_COLUMNS)
+        return df.reindex(columns=HISTORY_COLUMNS)
+
+    def top_up(self, ts_code: str, start: Optional[str] = None, force: bool = False) -> pd.DataFrame:
+        """
+        补齐本地缺失的交易日：本地为空时下载 history_bootstrap_days 天（start 更早时从 start 开始），
+        start 早于本地最早交易日时向前补齐，否则只下载最后一个已存交易日之后的数据。
+        向后补齐在 history_recheck_seconds 内不重复检查。
+        """
+        # 代码同时用作文件名，只接受标准 A 股代码，防止 "../x" 之类的值逃出 history_dir
+        if not TS_CODE_PATTERN.match(ts_code):
+            raise InvalidCodeError(f"无效的股票代码: {ts_code}")
+        start = pd.Timestamp(start).strftime("%Y%m%d") if start else None
+        with self._lock_for(ts_code):
+            frame = self._load(ts_code)
+            if self.pro is None:
+                return frame
+
+            today = now_cn()
+            end = today.strftime("%Y%m%d")
+            recently_checked = time.monotonic() - self._checked_at.get(ts_code, float("-inf")) \
+                < settings.history_recheck_seconds
+            first = frame["trade_date"].iloc[0] if not frame.empty else None
+            covered = min(filter(None, (first, self._covered_from.get(ts_code))), default=None)
+            wants_earlier = start is not None and (covered is None or start < covered)
+
+            ranges = []
+            if frame.empty:
+                if force or not recently_checked or wants_earlier:
+                    bootstrap = (today - timedelta(days=settings.history_bootstrap_days)).strftime("%Y%m%d")
+                    ranges.append((min(start or bootstrap, bootstrap), end))
+            else:
+                if wants_earlier:
+                    before_first = (datetime.strptime(first, "%Y%m%d") - timedelta(days=1)).strftime("%Y%m%d")
+                    ranges.append((start, before_first))
+                last = frame["trade_date"].iloc[-1]
+                if force or not (last >= _latest_expected_trade_date() or recently_checked):
+                    ranges.append(((datetime.strptime(last, "%Y%m%d") + timedelta(days=1)).strftime("%Y%m%d"), end))
+
+            fetched = []
+            for range_start, range_end in ranges:
+                fetched.append(self._fetch(ts_code, range_start, range_end))
+                self._covered_from[ts_code] = min(range_start, self._covered_from.get(ts_code, range_start))
+                if range_end == end:
+                    self._checked_at[ts_code] = time.monotonic()
+            new_rows = pd.concat(fetched) if fetched else pd.DataFrame(columns=HISTORY_COLUMNS)
+            if new_rows.empty:
+                return frame
+
+            new_rows.index = pd.to_datetime(new_rows["trade_date"], format="%Y%m%d")
+            frame = pd.concat([frame, new_rows]) if not frame.empty else new_rows
+            frame = frame[~frame.index.duplicated(keep="last")].sort_index()
+            frame.index.name = "trade_date"
+            self._remember(ts_code, frame)
+            print(f"[DEBUG HistoryStore] Topped up {len(new_rows)} bars for {ts_code} "
+                  f"({', '.join(f'{a} - {b}' for a, b in ranges)}), {len(frame)} bars stored.")
+            try:
+                self._save(ts_code, frame)
+            except Exception as e:
+                print(f"[WARNING HistoryStore] Saving history for {ts_code} failed: {e}. Keeping in memory only.")
+            return frame
+
+    def get_history(self, ts_code: str, start: Optional[str] = None, end: Optional[str] = None) -> pd.DataFrame:
+        """
+        返回 [start, end] 区间（YYYYMMDD，含两端）的日线，按交易日升序，索引为 DatetimeIndex。
+        返回的是内存中完整数据的切片，调用方不应原地修改。
+        """
+        frame = self.top_up(ts_code.strip().upper(), start)
+        if frame.empty:
+            return frame
+        start_ts = pd.Timestamp(start) if start else None
+        end_ts = pd.Timestamp(end) if end else None
+        return frame.loc[start_ts:end_ts]
@@ -0,0 +1,48 @@
+from typing import Dict, List
+from storage.database import get_connection
+
+
+class HotTickerStore:
+    """
+    各进程的行情查询次数（hot_ticker_hits 表），按 (股票, 时间桶) 累加，
+    轮询写方据此在所有 Streamlit/worker 进程的查询中挑选热门股票。
+    """
+
+    def __init__(self, db_path: str = None):
+        self.db_path = db_path
+        conn = get_connection(self.db_path)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS hot_ticker_hits (
+                ts_code TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                hits INTEGER NOT NULL,
+                PRIMARY KEY (ts_code, bucket)
+            )
+        """)
+        conn.commit()
+
+    def add(self, counts: Dict[str, int], bucket: int):
+        """把一段时间内本进程的查询次数累加到 bucket 时间桶"""
+        if not counts:
+            return
+        conn = get_connection(self.db_path)
+        conn.executemany(
+            "INSERT INTO hot_ticker_hits (ts_code, bucket, hits) VALUES (?, ?, ?) "
+            "ON CONFLICT(ts_code, bucket) DO UPDATE SET hits = hits + excluded.hits",
+            [(code, bucket, hits) for code, hits in counts.items()]
+        )
+        conn.commit()
+
+    def top(self, n: int, since_bucket: int) -> List[str]:
+        """since_bucket 及之后的时间桶内查询次数最多的 n 只股票"""
+        rows = get_connection(self.db_path).execute(
+            "SELECT ts_code FROM hot_ticker_hits WHERE bucket >= ? "
+            "GROUP BY ts_code ORDER BY SUM(hits) DESC, ts_code LIMIT ?",
+            (since_bucket, n)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def prune(self, before_bucket: int):
+        conn = get_connection(self.db_path)
+        conn.execute("DELETE FROM hot_ticker_hits WHERE bucket < ?", (before_bucket,))
+        conn.commit()
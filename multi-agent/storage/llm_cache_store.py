@@ -0,0 +1,48 @@
+import time
+from typing import Optional
+from storage.database import get_connection
+
+
+class LLMCacheStore:
+    """
+    LLM 响应持久缓存：以请求内容哈希为键保存序列化后的生成结果及过期时间，
+    进程重启或多个 Streamlit 进程之间共享。
+    """
+
+    def __init__(self, db_path: str = None):
+        self.db_path = db_path
+        conn = get_connection(self.db_path)
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                cache_key TEXT PRIMARY KEY,
+                model TEXT,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_llm_cache_expires_at ON llm_cache (expires_at);
+        """)
+        conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+        conn.commit()
+
+    def get(self, cache_key: str) -> Optional[str]:
+        """读取未过期的缓存内容，不存在或已过期返回 None"""
+        row = get_connection(self.db_path).execute(
+            "SELECT payload FROM llm_cache WHERE cache_key = ? AND expires_at > ?", (cache_key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def put(self, cache_key: str, payload: str, ttl: float, model: str = None):
+        now = time.time()
+        conn = get_connection(self.db_path)
+        conn.execute(
+            "INSERT OR REPLACE INTO llm_cache (cache_key, model, payload, created_at, expires_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (cache_key, model, payload, now, now + ttl)
+        )
+        conn.commit()
+
+    def clear(self):
+        conn = get_connection(self.db_path)
+        conn.execute("DELETE FROM llm_cache")
+        conn.commit()
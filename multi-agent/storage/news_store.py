@@ -0,0 +1,89 @@
+import time
+from typing import Dict, List, Optional, Tuple
+from storage.database import get_connection
+
+# 来源页面未给出发布时间时的占位文本；入库时存为 NULL，排序时排在有日期的新闻之后
+UNKNOWN_DATE = "未知日期"
+
+
+def _publish_date(item: Dict[str, str]) -> Optional[str]:
+    date = item.get("date")
+    return None if not date or date == UNKNOWN_DATE else date
+
+
+class NewsStore:
+    """
+    公司新闻本地存储：按 (公司, 链接哈希) 去重保存新闻，并为每家公司记录游标
+    （已见过的最新发布时间、最近一次抓取时间），抓取时只需处理游标之后的新条目。
+    """
+
+    def __init__(self, db_path: str = None):
+        self.db_path = db_path
+        conn = get_connection(self.db_path)
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS news_items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                company TEXT NOT NULL,
+                url_hash TEXT NOT NULL,
+                title TEXT NOT NULL,
+                link TEXT,
+                publish_date TEXT,
+                source TEXT,
+                fetched_at REAL NOT NULL,
+                UNIQUE (company, url_hash)
+            );
+            CREATE INDEX IF NOT EXISTS idx_news_items_company_date ON news_items (company, publish_date DESC);
+            CREATE INDEX IF NOT EXISTS idx_news_items_url_hash ON news_items (url_hash);
+            CREATE TABLE IF NOT EXISTS news_cursors (
+                company TEXT PRIMARY KEY,
+                last_publish_date TEXT,
+                last_fetched_at REAL NOT NULL
+            );
+        """)
+        # 早期版本把占位文本原样写入了 publish_date
+        conn.execute("UPDATE news_items SET publish_date = NULL WHERE publish_date = ?", (UNKNOWN_DATE,))
+        conn.commit()
+
+    def cursor(self, company: str) -> Tuple[Optional[str], Optional[float]]:
+        """返回 (已见过的最新发布时间, 最近抓取时间)，没有记录时均为 None"""
+        row = get_connection(self.db_path).execute(
+            "SELECT last_publish_date, last_fetched_at FROM news_cursors WHERE company = ?", (company,)
+        ).fetchone()
+        return (row[0], row[1]) if row else (None, None)
+
+    def is_fresh(self, company: str, max_age: float) -> bool:
+        _, last_fetched_at = self.cursor(company)
+        return last_fetched_at is not None and time.time() - last_fetched_at <= max_age
+
+    def add(self, company: str, items: List[Dict[str, str]]) -> int:
+        """写入一次成功抓取的新闻（已存在的忽略）并推进游标，返回新增条数；抓取失败时不应调用"""
+        now = time.time()
+        conn = get_connection(self.db_path)
+        before = conn.total_changes
+        conn.executemany(
+            "INSERT OR IGNORE INTO news_items (company, url_hash, title, link, publish_date, source, fetched_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(company, item["url_hash"], item["title"], item.get("link"), _publish_date(item), item.get("source"), now)
+             for item in items]
+        )
+        inserted = conn.total_changes - before
+
+        dates = [date for date in map(_publish_date, items) if date]
+        last_publish_date, _ = self.cursor(company)
+        if dates:
+            last_publish_date = max(dates + ([last_publish_date] if last_publish_date else []))
+        conn.execute(
+            "INSERT OR REPLACE INTO news_cursors (company, last_publish_date, last_fetched_at) VALUES (?, ?, ?)",
+            (company, last_publish_date, now)
+        )
+        conn.commit()
+        return inserted
+
+    def latest(self, company: str, k: int) -> List[Dict[str, str]]:
+        """按发布时间倒序返回最近 k 条新闻，发布时间未知的排在最后"""
+        rows = get_connection(self.db_path).execute(
+            "SELECT title, link, publish_date, source FROM news_items WHERE company = ? "
+            "ORDER BY publish_date IS NULL, publish_date DESC, id DESC LIMIT ?", (company, k)
+        ).fetchall()
+        return [{"title": title, "link": link, "date": date or UNKNOWN_DATE, "source": source}
+                for title, link, date, source in rows]
@@ -0,0 +1,98 @@
+import json
+import time
+from typing import Any, Dict, Iterable, Optional, Union
+from storage.database import get_connection
+
+ProfilePayload = Union[list, dict]
+
+
+class CompanyProfileStore:
+    """
+    公司资料持久缓存：保存 TuShare stock_company 记录或新浪 comInfo1 解析结果，
+    以 ts_code 为键并记录刷新时间，进程重启后无需重新抓取。
+    """
+
+    def __init__(self, db_path: str = None):
+        self.db_path = db_path
+        conn = get_connection(self.db_path)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS company_profile_cache (
+                ts_code TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                refreshed_at REAL NOT NULL
+            )
+        """)
+        conn.commit()
+
+    def get(self, ts_code: str, max_age: float = None) -> Optional[ProfilePayload]:
+        """读取缓存的公司资料，超过 max_age 秒视为过期返回 None"""
+        row = get_connection(self.db_path).execute(
+            "SELECT payload, refreshed_at FROM company_profile_cache WHERE ts_code = ?", (ts_code,)
+        ).fetchone()
+        if row is None:
+            return None
+        payload, refreshed_at = row
+        if max_age is not None and time.time() - refreshed_at > max_age:
+            return None
+        return json.loads(payload)
+
+    def put(self, ts_code: str, payload: ProfilePayload):
+        # TuShare 返回记录列表，新浪 HTML 解析结果为字典
+        source = "tushare" if isinstance(payload, list) else "sina"
+        conn = get_connection(self.db_path)
+        conn.execute(
+            "INSERT OR REPLACE INTO company_profile_cache (ts_code, source, payload, refreshed_at) "
+            "VALUES (?, ?, ?, ?)",
+            (ts_code, source, json.dumps(payload, ensure_ascii=False, default=str), time.time())
+        )
+        conn.commit()
+
+    def refreshed_at(self, ts_code: str) -> Optional[float]:
+        row = get_connection(self.db_path).execute(
+            "SELECT refreshed_at FROM company_profile_cache WHERE ts_code = ?", (ts_code,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def warm_up(self, stock_tools, codes: Iterable[str], max_age: float = None, force: bool = False) -> Dict[str, Any]:
+        """
+        批量预热：为自选股拉取公司资料写入缓存，已存在且未过期的跳过（force=True 时全部刷新）。
+        返回 {"refreshed": [...], "skipped": [...], "failed": {...}}。
+        """
+        summary = {"refreshed": [], "skipped": [], "failed": {}}
+        for ts_code in dict.fromkeys(code.strip().upper() for code in codes if code.strip()):
+            if not force and self.get(ts_code, max_age=max_age) is not None:
+                summary["skipped"].append(ts_code)
+                continue
+            # refresh=True 跳过各级缓存重新抓取，成功后由 StockTools 写回本表
+            result = stock_tools.get_company_info_internal(ts_code, refresh=True)
+            if isinstance(result, dict) and "error" in result:
+                summary["failed"][ts_code] = result["error"]
+                continue
+            summary["refreshed"].append(ts_code)
+        return summary
+
+
+if __name__ == "__main__":
+    # 用法：python -m storage.profile_store [--force] [ts_code ...]，未指定代码时使用 settings.watchlist
+    import argparse
+    from config.settings import settings
+    from tools.stock_tools import StockTools
+    from tools.tushare_quota import tushare_priority, PRIORITY_BACKGROUND
+
+    parser = argparse.ArgumentParser(description="预热公司资料持久缓存")
+    parser.add_argument("codes", nargs="*", help="ts_code 列表，例如 600519.SH 000001.SZ")
+    parser.add_argument("--force", action="store_true", help="忽略已有缓存，全部重新抓取")
+    args = parser.parse_args()
+
+    codes = args.codes or settings.watchlist
+    if not codes:
+        raise SystemExit("No codes given and WATCHLIST is empty.")
+    store = CompanyProfileStore()
+    # 预热属于后台任务，TuShare 配额优先留给交互请求
+    with tushare_priority(PRIORITY_BACKGROUND):
+        result = store.warm_up(StockTools(), codes, max_age=settings.company_profile_max_age, force=args.force)
+    print(f"[DEBUG CompanyProfileStore] Warm-up done: {len(result['refreshed'])} refreshed, "
+          f"{len(result['skipped'])} skipped, {len(result['failed'])} failed.")
+    for ts_code, error in result["failed"].items():
+        print(f"[ERROR CompanyProfileStore] {ts_code}: {error}")
@@ -0,0 +1,92 @@
+# test_chart_resample.py
+# K线周期聚合与折线 LTTB 降采样测试（不联网、不渲染图片），运行：python -m pytest -q test_chart_resample.py
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# 确保能找到项目根目录下的模块
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from tools.chart_tools import choose_frequency, lttb, resample_ohlcv
+
+
+@pytest.fixture(scope="module")
+def daily() -> pd.DataFrame:
+    """三年左右的日线 OHLCV（工作日，剔除若干天模拟停牌/节假日）"""
+    rng = np.random.default_rng(0)
+    index = pd.bdate_range("2021-01-04", "2023-12-29")
+    index = index.delete(rng.choice(len(index), 40, replace=False))
+    n = len(index)
+    close = 50 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    open_ = close * (1 + rng.normal(0, 0.01, n))
+    return pd.DataFrame({
+        "Open": open_,
+        "High": np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.01, n))),
+        "Low": np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.01, n))),
+        "Close": close,
+        "Volume": rng.integers(1_000, 100_000, n).astype(np.float64),
+    }, index=pd.DatetimeIndex(index, name="Date"))
+
+
+@pytest.mark.parametrize("freq", ["W", "M", "Q"])
+def test_resample_keeps_ohlc_per_period(daily, freq):
+    out = resample_ohlcv(daily, freq)
+    periods = daily.index.to_period(freq)
+    assert len(out) == periods.nunique()
+    assert out.index.is_monotonic_increasing and out.index.name == daily.index.name
+
+    for (period, group), (date, bar) in zip(daily.groupby(periods), out.iterrows()):
+        # 日期为该周期最后一个交易日，开/收取首末日，高/低取极值，成交量求和
+        assert date == group.index[-1]
+        assert bar["Open"] == group["Open"].iloc[0]
+        assert bar["Close"] == group["Close"].iloc[-1]
+        assert bar["High"] == group["High"].max()
+        assert bar["Low"] == group["Low"].min()
+        assert bar["Volume"] == pytest.approx(group["Volume"].sum())
+
+    assert (out["High"] >= out[["Open", "Close"]].max(axis=1)).all()
+    assert (out["Low"] <= out[["Open", "Close"]].min(axis=1)).all()
+    assert out["Volume"].sum() == pytest.approx(daily["Volume"].sum())
+
+
+def test_resample_daily_or_empty_is_unchanged(daily):
+    assert resample_ohlcv(daily, "D") is daily
+    empty = daily.iloc[:0]
+    assert resample_ohlcv(empty, "W") is empty
+
+
+def test_choose_frequency_picks_finest_level_that_fits(daily):
+    assert choose_frequency(daily.index, len(daily)) == ("D", "日线")
+    weeks = daily.index.to_period("W").nunique()
+    assert choose_frequency(daily.index, weeks) == ("W", "周线")
+    assert choose_frequency(daily.index, weeks - 1) == ("M", "月线")
+    # 季线仍放不下时也返回季线
+    assert choose_frequency(daily.index, 2) == ("Q", "季线")
+
+
+@pytest.mark.parametrize("n, threshold", [(1000, 100), (1000, 3), (10_001, 500), (7, 6)])
+def test_lttb_keeps_endpoints_and_exact_count(n, threshold):
+    rng = np.random.default_rng(n)
+    x = np.arange(n, dtype=np.float64)
+    y = np.cumsum(rng.normal(0, 1, n))
+    indices = lttb(x, y, threshold)
+    assert len(indices) == threshold
+    assert indices[0] == 0 and indices[-1] == n - 1
+    assert (np.diff(indices) > 0).all()
+
+
+def test_lttb_keeps_extreme_spike():
+    y = np.zeros(1000)
+    y[437] = 50.0
+    indices = lttb(np.arange(1000), y, 50)
+    assert 437 in indices
+
+
+@pytest.mark.parametrize("threshold", [1000, 2000, 2, 0])
+def test_lttb_returns_all_points_when_not_reducing(threshold):
+    np.testing.assert_array_equal(lttb(np.arange(1000), np.ones(1000), threshold), np.arange(1000))
@@ -0,0 +1,136 @@
+# test_indicators.py
+# 本地技术指标与 pandas rolling/ewm 参考实现的一致性测试（不联网），运行：python -m pytest -q test_indicators.py
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# 确保能找到项目根目录下的模块
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from tools.indicators import (atr, bollinger, drawdown, ema, indicator_summary, macd, max_drawdown, rsi, sma,
+                              volatility)
+
+
+def _random_walk(n: int, seed: int = 0) -> pd.DataFrame:
+    """随机游走的日线（含 high/low），长度超过 _ewm 的分块大小以覆盖跨块计算"""
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    spread = np.abs(rng.normal(0, 0.01, n)) * close
+    index = pd.bdate_range("2020-01-01", periods=n)
+    return pd.DataFrame({
+        "trade_date": index.strftime("%Y%m%d"),
+        "open": close * (1 + rng.normal(0, 0.005, n)),
+        "high": close + spread,
+        "low": close - spread,
+        "close": close,
+    }, index=index)
+
+
+@pytest.fixture(scope="module")
+def bars() -> pd.DataFrame:
+    return _random_walk(2000)
+
+
+def _assert_matches(actual: np.ndarray, expected: pd.Series):
+    np.testing.assert_allclose(actual, expected.to_numpy(dtype=np.float64), rtol=1e-9, atol=1e-9, equal_nan=True)
+
+
+@pytest.mark.parametrize("window", [5, 20, 60])
+def test_sma_matches_rolling_mean(bars, window):
+    _assert_matches(sma(bars["close"], window), bars["close"].rolling(window).mean())
+
+
+@pytest.mark.parametrize("span", [2, 12, 26, 200])
+def test_ema_matches_pandas_ewm(bars, span):
+    expected = bars["close"].ewm(span=span, adjust=False, min_periods=span).mean()
+    _assert_matches(ema(bars["close"], span), expected)
+
+
+def test_rsi_matches_wilder_smoothing(bars):
+    delta = bars["close"].diff()
+    avg_gain = delta.clip(lower=0).ewm(alpha=1 / 14, adjust=False, min_periods=14).mean()
+    avg_loss = (-delta).clip(lower=0).ewm(alpha=1 / 14, adjust=False, min_periods=14).mean()
+    expected = 100 - 100 / (1 + avg_gain / avg_loss)
+    _assert_matches(rsi(bars["close"], 14), expected)
+
+
+def test_rsi_is_100_without_losses():
+    values = rsi(np.arange(1.0, 40.0), 14)
+    assert np.isnan(values[:14]).all()
+    assert np.allclose(values[14:], 100.0)
+
+
+def test_macd_matches_pandas_ewm(bars):
+    close = bars["close"]
+    dif_expected = close.ewm(span=12, adjust=False, min_periods=12).mean() \
+        - close.ewm(span=26, adjust=False, min_periods=26).mean()
+    dea_expected = dif_expected.ewm(span=9, adjust=False, min_periods=9).mean()
+    dif, dea, hist = macd(close)
+    _assert_matches(dif, dif_expected)
+    _assert_matches(dea, dea_expected)
+    _assert_matches(hist, 2 * (dif_expected - dea_expected))
+
+
+def test_bollinger_matches_rolling_std(bars):
+    mid_expected = bars["close"].rolling(20).mean()
+    std_expected = bars["close"].rolling(20).std(ddof=0)
+    mid, upper, lower = bollinger(bars["close"], 20, 2.0)
+    _assert_matches(mid, mid_expected)
+    _assert_matches(upper, mid_expected + 2 * std_expected)
+    _assert_matches(lower, mid_expected - 2 * std_expected)
+
+
+def test_atr_matches_wilder_true_range(bars):
+    prev_close = bars["close"].shift(1).fillna(bars["close"])
+    true_range = pd.concat([bars["high"] - bars["low"], (bars["high"] - prev_close).abs(),
+                            (bars["low"] - prev_close).abs()], axis=1).max(axis=1)
+    expected = true_range.ewm(alpha=1 / 14, adjust=False, min_periods=14).mean()
+    _assert_matches(atr(bars["high"], bars["low"], bars["close"], 14), expected)
+
+
+def test_volatility_matches_rolling_log_return_std(bars):
+    returns = np.log(bars["close"]).diff()
+    _assert_matches(volatility(bars["close"], 20), returns.rolling(20).std() * np.sqrt(252))
+    _assert_matches(volatility(bars["close"], 20, annualize=False), returns.rolling(20).std())
+
+
+def test_drawdown_matches_cummax(bars):
+    expected = bars["close"] / bars["close"].cummax() - 1
+    _assert_matches(drawdown(bars["close"]), expected)
+    assert max_drawdown(bars["close"]) == pytest.approx(expected.min())
+
+
+def test_two_dimensional_input_matches_per_series(bars):
+    other = _random_walk(len(bars), seed=1)
+    stacked = np.vstack([bars["close"], other["close"]])
+    for fn in (lambda x: sma(x, 20), lambda x: ema(x, 12), rsi, lambda x: macd(x)[1], lambda x: bollinger(x)[1],
+               volatility, drawdown):
+        result = fn(stacked)
+        np.testing.assert_allclose(result[0], fn(bars["close"].to_numpy()), equal_nan=True)
+        np.testing.assert_allclose(result[1], fn(other["close"].to_numpy()), equal_nan=True)
+
+
+def test_short_input_is_all_nan():
+    close = np.array([10.0, 10.5, 10.2])
+    assert np.isnan(sma(close, 5)).all()
+    assert np.isnan(ema(close, 5)).all()
+    assert np.isnan(rsi(close, 14)).all()
+    assert np.isnan(bollinger(close, 20)[0]).all()
+    assert np.isnan(volatility(close, 20)).all()
+
+
+def test_indicator_summary_uses_latest_values(bars):
+    window = bars.tail(250)
+    summary = indicator_summary(window)
+    assert summary["截至"] == window["trade_date"].iloc[-1]
+    assert summary["样本交易日"] == 250
+    assert summary["MA20"] == round(window["close"].tail(20).mean(), 2)
+    assert summary["EMA12"] == round(window["close"].ewm(span=12, adjust=False).mean().iloc[-1], 2)
+    # 窗口不足的指标不输出
+    short = indicator_summary(window.tail(30))
+    assert "MA60" not in short and "MA20" in short
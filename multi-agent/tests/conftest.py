@@ -0,0 +1,40 @@
+# tests/conftest.py
+# 公共测试夹具：项目根目录加入 sys.path，提供可手动推进的假时钟与临时数据库路径
+import os
+import sys
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+
+class FakeClock:
+    """替换模块中的 time：monotonic()/time() 返回手动推进的时间，sleep() 只推进时间不阻塞"""
+
+    def __init__(self, start: float = 1_000_000.0):
+        self.now = start
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def fake_clock() -> FakeClock:
+    return FakeClock()
+
+
+@pytest.fixture
+def db_path(tmp_path) -> str:
+    """每个测试独立的 SQLite 文件"""
+    return str(tmp_path / "test.db")
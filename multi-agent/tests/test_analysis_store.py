@@ -0,0 +1,160 @@
+# tests/test_analysis_store.py
+# 分析结果复用测试：find_recent 按 (股票, 类型, 数据指纹, 问题指纹, 有效期) 匹配，含尚未落盘的结果；
+# 需要报告时必须有报告记录（main._find_reusable_result）
+import sqlite3
+
+import pytest
+
+import main
+import storage.analysis_store as analysis_store
+from agents.llm_cache import llm_cache_bypass
+from config.settings import settings
+from storage.analysis_store import AnalysisHistoryStore
+from storage.database import get_connection
+
+TICKER = "600519.SH"
+
+
+def _stored_rows(db_path: str) -> int:
+    return get_connection(db_path).execute("SELECT COUNT(*) FROM analysis_history").fetchone()[0]
+
+
+def _release_writer(store: AnalysisHistoryStore, monkeypatch):
+    """让被挂起的后台写入线程立即提交，并等待写完"""
+    monkeypatch.setattr(settings, "analysis_history_batch_size", 1)
+    with store._cond:
+        store._cond.notify_all()
+    assert store.flush(5)
+
+
+@pytest.fixture
+def store(db_path, fake_clock, monkeypatch):
+    monkeypatch.setattr(analysis_store, "time", fake_clock)
+    # 攒批条件很难满足：记录停留在待写列表中，直到测试调用 _release_writer
+    monkeypatch.setattr(settings, "analysis_history_batch_size", 1000)
+    monkeypatch.setattr(settings, "analysis_history_flush_interval", 3600.0)
+    store = AnalysisHistoryStore(db_path)
+    yield store
+    _release_writer(store, monkeypatch)
+
+
+@pytest.mark.parametrize("flushed", [False, True], ids=["pending", "stored"])
+@pytest.mark.parametrize("ticker, analysis_type, data_hash, query_hash, age, max_age, expected", [
+    (TICKER, "analysis", "d1", "q1", 0, 600, "结果"),
+    (TICKER, "analysis", "d1", "q1", 599, 600, "结果"),
+    ("000001.SZ", "analysis", "d1", "q1", 0, 600, None),
+    (TICKER, "report", "d1", "q1", 0, 600, None),
+    (TICKER, "analysis", "d2", "q1", 0, 600, None),
+    (TICKER, "analysis", "d1", "q2", 0, 600, None),
+    (TICKER, "analysis", None, "q1", 0, 600, None),
+    (TICKER, "analysis", "d1", "q1", 601, 600, None),
+])
+def test_find_recent_matching(store, db_path, fake_clock, monkeypatch, flushed,
+                              ticker, analysis_type, data_hash, query_hash, age, max_age, expected):
+    store.record(TICKER, "analysis", "结果", "d1", "q1")
+    if flushed:
+        _release_writer(store, monkeypatch)
+        assert not store._pending and _stored_rows(db_path) == 1
+    else:
+        assert _stored_rows(db_path) == 0
+    fake_clock.advance(age)
+    assert store.find_recent(ticker, analysis_type, data_hash, query_hash, max_age) == expected
+
+
+@pytest.mark.parametrize("flushed", [False, True], ids=["pending", "stored"])
+def test_find_recent_returns_newest_match(store, fake_clock, monkeypatch, flushed):
+    store.record(TICKER, "analysis", "较早", "d1", "q1")
+    fake_clock.advance(10)
+    store.record(TICKER, "analysis", "最新", "d1", "q1")
+    store.record(TICKER, "analysis", "其他数据", "d2", "q1")
+    if flushed:
+        _release_writer(store, monkeypatch)
+    assert store.find_recent(TICKER, "analysis", "d1", "q1", 600) == "最新"
+
+
+def test_pending_result_found_before_database(store, db_path, monkeypatch):
+    # 库中已有较早结果，新结果尚在待写列表中时应返回新结果
+    store.record(TICKER, "analysis", "已落盘", "d1", "q1")
+    _release_writer(store, monkeypatch)
+    monkeypatch.setattr(settings, "analysis_history_batch_size", 1000)
+    store.record(TICKER, "analysis", "待写入", "d1", "q1")
+    assert _stored_rows(db_path) == 1
+    assert store.find_recent(TICKER, "analysis", "d1", "q1", 600) == "待写入"
+
+
+def test_old_table_gets_hash_columns(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE analysis_history (id INTEGER PRIMARY KEY AUTOINCREMENT, ticker TEXT NOT NULL, "
+                 "analysis_type TEXT NOT NULL, result TEXT NOT NULL, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)")
+    conn.execute("INSERT INTO analysis_history (ticker, analysis_type, result) VALUES (?, 'analysis', '旧结果')",
+                 (TICKER,))
+    conn.commit()
+    conn.close()
+
+    store = AnalysisHistoryStore(db_path)
+    columns = {row[1] for row in get_connection(db_path).execute("PRAGMA table_info(analysis_history)")}
+    assert {"data_hash", "query_hash"} <= columns
+    # 旧记录没有指纹，不会被复用
+    assert store.find_recent(TICKER, "analysis", "d1", "q1", 600) is None
+    assert store.latest(TICKER, "analysis")[0][1] == "旧结果"
+
+
+DATA_CONTEXT = {"ts_code": TICKER, "company_name": "贵州茅台", "price_data": [{"close": 1500.0}]}
+
+
+@pytest.fixture
+def reuse(store, monkeypatch):
+    """main 使用临时库中的结果历史，返回 (记录函数, 查找函数)"""
+    monkeypatch.setattr(main, "analysis_history", store)
+    monkeypatch.setattr(settings, "analysis_reuse_max_age", 600)
+    data_hash = main._data_hash(DATA_CONTEXT)
+
+    def record(user_input: str, analysis_type: str, result: str):
+        main._record_result({"user_input": user_input, "data_context": DATA_CONTEXT, "data_hash": data_hash},
+                            analysis_type, result)
+
+    def find(user_input: str, final_goal: str, data_context=DATA_CONTEXT):
+        return main._find_reusable_result({"user_input": user_input, "final_goal": final_goal},
+                                          data_context, main._data_hash(data_context))
+
+    return record, find
+
+
+@pytest.mark.parametrize("recorded, final_goal, expected", [
+    ({"analysis": "分析A"}, "analysis", {"analysis": "分析A", "report": "分析A"}),
+    # 需要报告时只有分析记录不能复用
+    ({"analysis": "分析A"}, "report_generation", None),
+    ({"analysis": "分析A", "report": "报告R"}, "report_generation", {"analysis": "分析A", "report": "报告R"}),
+    ({"report": "报告R"}, "report_generation", {"analysis": "", "report": "报告R"}),
+    ({"report": "报告R"}, "analysis", None),
+    ({}, "analysis", None),
+])
+def test_reusable_result_requires_report_for_report_goal(reuse, recorded, final_goal, expected):
+    record, find = reuse
+    for analysis_type, result in recorded.items():
+        record("分析一下贵州茅台", analysis_type, result)
+    assert find("分析一下贵州茅台", final_goal) == expected
+
+
+def test_reusable_result_query_and_data_matching(reuse):
+    record, find = reuse
+    record("分析一下贵州茅台", "analysis", "分析A")
+    # 问题指纹忽略空白与标点、大小写
+    assert find(" 分析一下 贵州茅台？", "analysis")["analysis"] == "分析A"
+    assert find("贵州茅台的估值如何", "analysis") is None
+    # 相关历史分析不计入数据指纹，数据本身变化则不复用
+    assert find("分析一下贵州茅台", "analysis", {**DATA_CONTEXT, "related_history": [{"text": "旧"}]}) is not None
+    assert find("分析一下贵州茅台", "analysis", {**DATA_CONTEXT, "price_data": [{"close": 1501.0}]}) is None
+
+
+def test_reuse_disabled(reuse, monkeypatch):
+    record, find = reuse
+    record("分析一下贵州茅台", "analysis", "分析A")
+    # 失败的结果不会写入
+    record("分析一下贵州茅台", "analysis", "分析失败：超时")
+    assert find("分析一下贵州茅台", "analysis")["analysis"] == "分析A"
+    with llm_cache_bypass():
+        assert find("分析一下贵州茅台", "analysis") is None
+    assert find("分析一下贵州茅台", "analysis", {"company_name": "贵州茅台"}) is None
+    monkeypatch.setattr(settings, "analysis_reuse_max_age", 0)
+    assert find("分析一下贵州茅台", "analysis") is None
@@ -0,0 +1,134 @@
+# tests/test_cache_market_hours.py
+# 交易时段/开盘时间与行情缓存 TTL 的表驱动测试（固定时间点），以及 LRU 淘汰、跨时段过期、错误结果不缓存
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from config.settings import settings
+from tools import cache as cache_module
+from tools.cache import MISSING, TTLCache
+from tools.market_hours import CN_TZ, is_trading_time, market_aware_ttl, next_open, seconds_until_next_open
+
+
+def cn(text: str) -> datetime:
+    """北京时间 'YYYY-MM-DD HH:MM:SS'（2024-01-08 为周一）"""
+    return datetime.strptime(text, "%Y-%m-%d %H:%M:%S").replace(tzinfo=CN_TZ)
+
+
+@pytest.mark.parametrize("moment, trading", [
+    ("2024-01-08 09:29:59", False),
+    ("2024-01-08 09:30:00", True),
+    ("2024-01-08 11:29:59", True),
+    ("2024-01-08 11:30:00", False),   # 午间休市
+    ("2024-01-08 12:59:59", False),
+    ("2024-01-08 13:00:00", True),
+    ("2024-01-08 14:59:59", True),
+    ("2024-01-08 15:00:00", False),
+    ("2024-01-12 10:00:00", True),    # 周五
+    ("2024-01-13 10:00:00", False),   # 周六
+    ("2024-01-14 14:00:00", False),   # 周日
+])
+def test_is_trading_time(moment, trading):
+    assert is_trading_time(cn(moment)) is trading
+
+
+@pytest.mark.parametrize("moment, expected_open", [
+    ("2024-01-08 08:00:00", "2024-01-08 09:30:00"),
+    ("2024-01-08 10:15:00", "2024-01-08 10:15:00"),   # 交易中返回当前时间
+    ("2024-01-08 11:30:00", "2024-01-08 13:00:00"),
+    ("2024-01-08 12:59:59", "2024-01-08 13:00:00"),
+    ("2024-01-08 15:00:00", "2024-01-09 09:30:00"),
+    ("2024-01-08 23:59:59", "2024-01-09 09:30:00"),
+    ("2024-01-12 15:00:00", "2024-01-15 09:30:00"),   # 周五收盘到下周一
+    ("2024-01-13 09:30:00", "2024-01-15 09:30:00"),
+    ("2024-01-14 23:00:00", "2024-01-15 09:30:00"),
+])
+def test_next_open(moment, expected_open):
+    assert next_open(cn(moment)) == cn(expected_open)
+
+
+def test_naive_and_foreign_datetimes_are_treated_as_beijing_time():
+    assert is_trading_time(datetime(2024, 1, 8, 10, 0))
+    # UTC 02:00 即北京时间 10:00
+    assert is_trading_time(datetime(2024, 1, 8, 2, 0, tzinfo=timezone.utc))
+    # UTC 03:30 即北京时间 11:30，距午后开盘 90 分钟
+    assert seconds_until_next_open(datetime(2024, 1, 8, 3, 30, tzinfo=timezone.utc)) == 5400
+
+
+@pytest.mark.parametrize("moment, max_closed, expected", [
+    ("2024-01-08 10:00:00", None, 30),                 # 交易时段内用短 TTL
+    ("2024-01-08 11:30:00", None, 90 * 60),            # 午休缓存到 13:00
+    ("2024-01-08 12:59:50", None, 30),                 # 距开盘不足 trading_ttl 时取 trading_ttl
+    ("2024-01-08 15:00:00", None, 18.5 * 3600),        # 收盘缓存到次日 9:30
+    ("2024-01-12 15:00:00", None, (2 * 24 + 18.5) * 3600),
+    ("2024-01-12 15:00:00", 3600, 3600),               # 休市 TTL 上限
+    ("2024-01-13 12:00:00", None, 45.5 * 3600),      # 周六中午到周一 9:30
+])
+def test_market_aware_ttl(moment, max_closed, expected):
+    assert market_aware_ttl(30, max_closed, cn(moment)) == pytest.approx(expected)
+
+
+@pytest.fixture
+def clock(monkeypatch, fake_clock):
+    monkeypatch.setattr(cache_module, "time", fake_clock)
+    return fake_clock
+
+
+def test_lunch_break_entry_expires_at_afternoon_open(clock):
+    cache = TTLCache(maxsize=8)
+    cache.set("600519.SH", {"close": 1688.0}, market_aware_ttl(30, dt=cn("2024-01-08 11:45:00")))
+    clock.advance(75 * 60 - 1)       # 12:59:59
+    assert cache.get("600519.SH") == {"close": 1688.0}
+    clock.advance(1)                 # 13:00:00 开盘
+    assert cache.get("600519.SH") is MISSING
+    assert cache.stats()["expirations"] == 1
+
+
+def test_trading_entry_does_not_outlive_trading_ttl(clock):
+    cache = TTLCache(maxsize=8)
+    cache.set("k", 1, market_aware_ttl(30, dt=cn("2024-01-08 11:29:50")))
+    clock.advance(29.9)
+    assert cache.get("k") == 1
+    clock.advance(0.1)
+    assert cache.get("k") is MISSING
+
+
+def test_lru_eviction_keeps_recently_used(clock):
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1, 60)
+    cache.set("b", 2, 60)
+    assert cache.get("a") == 1       # a 变为最近使用
+    cache.set("c", 3, 60)
+    assert cache.get("b") is MISSING
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_non_positive_ttl_is_not_stored(clock):
+    cache = TTLCache()
+    cache.set("k", 1, 0)
+    assert cache.get("k", default=None) is None
+    assert len(cache) == 0
+
+
+def test_stock_tools_never_cache_errors(monkeypatch, db_path, tmp_path):
+    monkeypatch.setattr(settings, "database_path", db_path)
+    monkeypatch.setattr(settings, "history_dir", str(tmp_path / "history"))
+    monkeypatch.setattr(settings, "tushare_token", "")
+    from tools import stock_tools
+    monkeypatch.setattr(stock_tools.quote_snapshot, "get", lambda *args, **kwargs: None)
+    tools = stock_tools.StockTools()
+
+    results = iter([{"error": "行情获取失败"}, [{"close": 1688.0}]])
+    calls = []
+
+    def fetch(ts_code):
+        calls.append(ts_code)
+        return next(results)
+
+    monkeypatch.setattr(tools, "_get_price_from_sina", fetch)
+    assert tools.get_stock_price_internal("600519.SH") == {"error": "行情获取失败"}
+    assert tools.get_stock_price_internal("600519.SH") == [{"close": 1688.0}]
+    # 成功结果被缓存，不再调用上游
+    assert tools.get_stock_price_internal("600519.SH") == [{"close": 1688.0}]
+    assert calls == ["600519.SH", "600519.SH"]
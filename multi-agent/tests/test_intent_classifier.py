@@ -0,0 +1,133 @@
+# tests/test_intent_classifier.py
+# 本地意图分类测试：关键词自动机的重叠匹配、置信度与 router_confidence_threshold 的比较、低置信度时回退 LLM 的路由结果
+from types import SimpleNamespace
+
+import pytest
+
+import agents.router_agent as router_module
+from agents.intent_classifier import IntentClassifier
+from agents.router_agent import RouterAgent
+from config.settings import settings
+from tools.keyword_automaton import KeywordAutomaton
+
+
+def _spans(automaton: KeywordAutomaton, text: str):
+    return sorted((start, end, keyword) for start, end, keyword, _ in automaton.search(text))
+
+
+def test_automaton_reports_overlapping_and_nested_keywords():
+    automaton = KeywordAutomaton()
+    automaton.add_many((k, None) for k in ["he", "she", "his", "hers"])
+    assert _spans(automaton, "ushers") == [(1, 4, "she"), (2, 4, "he"), (2, 6, "hers")]
+
+    automaton = KeywordAutomaton()
+    automaton.add_many((k, None) for k in ["中国平安", "平安", "平安银行"])
+    assert _spans(automaton, "中国平安银行") == [(0, 4, "中国平安"), (2, 4, "平安"), (2, 6, "平安银行")]
+
+
+def test_automaton_values_case_and_rebuild():
+    automaton = KeywordAutomaton()
+    automaton.add("PE", "valuation")
+    assert automaton.search("看看pe和Pe") == [(2, 4, "PE", "valuation"), (5, 7, "PE", "valuation")]
+    # 搜索后再添加的关键词在下次搜索时自动重建生效
+    automaton.add("看看")
+    assert [m[2] for m in automaton.search("看看pe")] == ["看看", "PE"]
+    assert len(automaton) == 2
+
+    strict = KeywordAutomaton(case_sensitive=True)
+    strict.add("PE")
+    assert strict.search("pe") == []
+
+
+@pytest.mark.parametrize("text, route, confidence, matched", [
+    # 单一意图
+    ("贵州茅台股价多少", "data_retrieval", 0.75, ["股价"]),
+    # 重叠关键词“公司信息”“信息”都计分
+    ("600519 公司信息", "data_retrieval", 0.8182, ["公司信息", "信息"]),
+    # analysis 隐含取数，data_retrieval 不算竞争意图
+    ("分析一下茅台的股价", "analysis", 0.75, ["分析", "股价"]),
+    ("写一份茅台的报告", "report_generation", 0.875, ["写一份", "报告"]),
+    # 重复关键词只计一次
+    ("分析分析分析", "analysis", 0.75, ["分析"]),
+    # 同分时取优先级高的意图，但与竞争意图相抵后置信度低
+    ("你好，帮我分析一下", "analysis", 0.4286, ["你好", "分析"]),
+    # 没有命中任何关键词
+    ("今天天气", "general_response", 0.0, []),
+    ("", "general_response", 0.0, []),
+])
+def test_classify_route_and_confidence(text, route, confidence, matched):
+    intent = IntentClassifier().classify(text)
+    assert intent.route == route
+    assert intent.confidence == pytest.approx(confidence, abs=1e-4)
+    assert intent.matched == matched
+
+
+class FakeLLM:
+    def __init__(self, content: str = None, error: Exception = None):
+        self.content = content
+        self.error = error
+        self.calls = 0
+
+    def invoke(self, messages):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return SimpleNamespace(content=self.content)
+
+
+@pytest.fixture
+def router(monkeypatch):
+    monkeypatch.setattr(settings, "router_fast_path_enabled", True)
+    monkeypatch.setattr(settings, "router_confidence_threshold", 0.6)
+    return RouterAgent()
+
+
+def _use_llm(monkeypatch, llm: FakeLLM) -> FakeLLM:
+    monkeypatch.setattr(router_module.llm_client, "invoke", llm.invoke)
+    return llm
+
+
+def test_confidence_above_threshold_skips_llm(router, monkeypatch):
+    llm = _use_llm(monkeypatch, FakeLLM("general_response"))
+    assert router.route_request("贵州茅台股价多少") == "data_retrieval"
+    assert llm.calls == 0
+
+
+@pytest.mark.parametrize("threshold, expected_calls", [(0.75, 0), (0.76, 1)])
+def test_threshold_is_inclusive(router, monkeypatch, threshold, expected_calls):
+    monkeypatch.setattr(settings, "router_confidence_threshold", threshold)
+    llm = _use_llm(monkeypatch, FakeLLM("data_retrieval"))
+    assert router.route_request("贵州茅台股价多少") == "data_retrieval"
+    assert llm.calls == expected_calls
+
+
+def test_fast_path_disabled_always_asks_llm(router, monkeypatch):
+    monkeypatch.setattr(settings, "router_fast_path_enabled", False)
+    llm = _use_llm(monkeypatch, FakeLLM("report_generation"))
+    assert router.route_request("写一份茅台的报告") == "report_generation"
+    assert llm.calls == 1
+
+
+@pytest.mark.parametrize("text, content, expected", [
+    # 低置信度时采用 LLM 给出的类别，即使带有多余文字或大小写不同
+    ("你好，帮我分析一下", "general_response", "general_response"),
+    ("你好，帮我分析一下", "路由：Report_Generation。", "report_generation"),
+    ("今天天气", "data_retrieval", "data_retrieval"),
+    # LLM 输出中没有合法类别时回退到本地分类结果
+    ("你好，帮我分析一下", "我不确定", "analysis"),
+    ("今天天气", "unknown", "general_response"),
+])
+def test_low_confidence_uses_llm_answer(router, monkeypatch, text, content, expected):
+    llm = _use_llm(monkeypatch, FakeLLM(content))
+    assert router.route_request(text) == expected
+    assert llm.calls == 1
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("你好，帮我分析一下", "analysis"),
+    ("今天天气", "general_response"),
+])
+def test_llm_failure_falls_back_to_local_intent(router, monkeypatch, text, expected):
+    llm = _use_llm(monkeypatch, FakeLLM(error=TimeoutError("llm timeout")))
+    assert router.route_request(text) == expected
+    assert llm.calls == 1
@@ -0,0 +1,89 @@
+# tests/test_llm_cache.py
+# LLM 响应缓存测试：相关历史分析段不参与键计算；bypass_cache 时跳过读取但仍刷新缓存
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.load import dumps
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.outputs import Generation
+
+from agents.context_serializer import RELATED_HISTORY_OPEN, serialize_data_context, strip_related_history
+from agents.llm_cache import TieredLLMCache, llm_cache_bypass
+from storage.llm_cache_store import LLMCacheStore
+
+LLM_STRING = "[('model', 'qwen-plus'), ('temperature', 0.0)]"
+DATA = {"company_name": "贵州茅台", "ts_code": "600519.SH", "valuation": {"pe": 30.1}}
+
+
+def _history(*texts):
+    return [{"text": text, "created_at": 1_700_000_000 + i} for i, text in enumerate(texts)]
+
+
+def _prompt(data_context) -> str:
+    """与 LangChain 调用缓存时相同的 prompt 形式：dumps 序列化的消息列表"""
+    return dumps([SystemMessage(content="你是金融分析师。"),
+                  HumanMessage(content=f"数据：\n{serialize_data_context(data_context)}\n请分析。")])
+
+
+@pytest.fixture
+def cache(db_path, monkeypatch):
+    monkeypatch.setattr(TieredLLMCache, "_ttl", staticmethod(lambda: 300.0))
+    return TieredLLMCache(store=LLMCacheStore(db_path))
+
+
+def test_strip_related_history_removes_only_marked_span():
+    text = serialize_data_context({**DATA, "related_history": _history("上次结论：估值偏高")})
+    assert RELATED_HISTORY_OPEN in text
+    assert strip_related_history(text) == serialize_data_context(DATA)
+    assert strip_related_history("没有标记的文本") == "没有标记的文本"
+
+
+@pytest.mark.parametrize("history_a, history_b", [
+    (_history("上次结论：估值偏高"), _history("上次结论：估值合理", "更早的结论：\"引号\"与\\反斜杠")),
+    (_history("上次结论：估值偏高"), None),
+])
+def test_prompts_differing_only_in_related_history_share_key(history_a, history_b):
+    prompt_a = _prompt({**DATA, "related_history": history_a})
+    prompt_b = _prompt({**DATA, "related_history": history_b})
+    assert prompt_a != prompt_b
+    assert TieredLLMCache._key(prompt_a, LLM_STRING) == TieredLLMCache._key(prompt_b, LLM_STRING)
+
+
+def test_other_differences_change_key():
+    history = _history("上次结论：估值偏高")
+    base = TieredLLMCache._key(_prompt({**DATA, "related_history": history}), LLM_STRING)
+    changed_data = {**DATA, "valuation": {"pe": 30.2}, "related_history": history}
+    assert TieredLLMCache._key(_prompt(changed_data), LLM_STRING) != base
+    assert TieredLLMCache._key(_prompt({**DATA, "related_history": history}), LLM_STRING + " ") != base
+
+
+def test_chat_model_hits_cache_across_related_history(cache):
+    model = FakeListChatModel(responses=["第一次回答", "第二次回答"], cache=cache)
+    first = model.invoke([HumanMessage(content=serialize_data_context({**DATA, "related_history": _history("A")}))])
+    second = model.invoke([HumanMessage(content=serialize_data_context({**DATA, "related_history": _history("B")}))])
+    assert first.content == second.content == "第一次回答"
+
+
+def test_bypass_skips_lookup_but_refreshes_entry(cache, db_path):
+    prompt = _prompt(DATA)
+    cache.update(prompt, LLM_STRING, [Generation(text="旧结果")])
+    assert [g.text for g in cache.lookup(prompt, LLM_STRING)] == ["旧结果"]
+
+    with llm_cache_bypass():
+        assert cache.lookup(prompt, LLM_STRING) is None
+        cache.update(prompt, LLM_STRING, [Generation(text="新结果")])
+    assert cache.stats()["bypassed"] == 1
+
+    # 内存层与 SQLite 层都已刷新
+    assert [g.text for g in cache.lookup(prompt, LLM_STRING)] == ["新结果"]
+    other_process = TieredLLMCache(store=LLMCacheStore(db_path))
+    assert [g.text for g in other_process.lookup(prompt, LLM_STRING)] == ["新结果"]
+    assert other_process.stats()["store_hits"] == 1
+
+
+def test_bypass_with_chat_model_calls_llm_and_overwrites(cache):
+    model = FakeListChatModel(responses=["第一次回答", "第二次回答"], cache=cache)
+    messages = [HumanMessage(content=serialize_data_context(DATA))]
+    assert model.invoke(messages).content == "第一次回答"
+    with llm_cache_bypass():
+        assert model.invoke(messages).content == "第二次回答"
+    assert model.invoke(messages).content == "第二次回答"
@@ -0,0 +1,139 @@
+# tests/test_news_store.py
+# 新闻本地存储测试：游标推进、(公司, 链接哈希) 去重、news_freshness_seconds 内直接返回存储结果
+import pytest
+
+import storage.news_store as news_store
+from config.settings import settings
+from storage.news_store import UNKNOWN_DATE, NewsStore
+from tools.news_tools import NewsSource, NewsTools
+
+COMPANY = "贵州茅台"
+
+
+def _item(n: int, date: str = UNKNOWN_DATE) -> dict:
+    return {"title": f"新闻{n}", "link": f"https://news.example.com/{n}", "date": date}
+
+
+class StubSource(NewsSource):
+    """按顺序返回预设的抓取结果（列表或异常），并记录每次收到的 since"""
+    name = "stub"
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.since_calls = []
+
+    def fetch(self, company_name, limit, since=None):
+        self.since_calls.append(since)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+@pytest.fixture
+def store(db_path, fake_clock, monkeypatch):
+    monkeypatch.setattr(news_store, "time", fake_clock)
+    return NewsStore(db_path)
+
+
+@pytest.fixture
+def make_tools(store, db_path, monkeypatch):
+    monkeypatch.setattr(settings, "database_path", db_path)
+    monkeypatch.setattr(settings, "news_freshness_seconds", 600)
+    monkeypatch.setattr(settings, "news_max_items", 10)
+
+    def make(source: StubSource) -> NewsTools:
+        tools = NewsTools(sources=[source])
+        tools.store = store
+        return tools
+
+    return make
+
+
+def _titles(items):
+    return [item["title"] for item in items]
+
+
+def test_overlapping_fetches_advance_cursor_and_dedup(make_tools, store, fake_clock):
+    source = StubSource(
+        [_item(1, "2024-05-01 10:00"), _item(2, "2024-05-02 09:00"), _item(3)],
+        # 第二次抓取与第一次有重叠（新闻2），只有新闻4是新的
+        [_item(4, "2024-05-03 08:00"), _item(2, "2024-05-02 09:00")],
+    )
+    tools = make_tools(source)
+
+    assert _titles(tools.get_company_news(COMPANY)) == ["新闻2", "新闻1", "新闻3"]
+    assert store.cursor(COMPANY) == ("2024-05-02 09:00", fake_clock.now)
+
+    fake_clock.advance(601)
+    assert _titles(tools.get_company_news(COMPANY)) == ["新闻4", "新闻2", "新闻1", "新闻3"]
+    assert source.since_calls == [None, "2024-05-02 09:00"]
+    assert store.cursor(COMPANY) == ("2024-05-03 08:00", fake_clock.now)
+    assert len(store.latest(COMPANY, 100)) == 4
+
+
+def test_fresh_store_short_circuits_fetch(make_tools, store, fake_clock):
+    source = StubSource([_item(1, "2024-05-01 10:00")], [_item(2, "2024-05-02 09:00")])
+    tools = make_tools(source)
+
+    tools.get_company_news(COMPANY)
+    fake_clock.advance(600)
+    assert _titles(tools.get_company_news(COMPANY)) == ["新闻1"]
+    assert len(source.since_calls) == 1
+
+    fake_clock.advance(1)
+    assert _titles(tools.get_company_news(COMPANY)) == ["新闻2", "新闻1"]
+    assert len(source.since_calls) == 2
+
+
+def test_no_newer_items_still_refreshes_fetch_time(make_tools, store, fake_clock):
+    source = StubSource([_item(1, "2024-05-01 10:00")], [])
+    tools = make_tools(source)
+
+    tools.get_company_news(COMPANY)
+    fake_clock.advance(601)
+    assert _titles(tools.get_company_news(COMPANY)) == ["新闻1"]
+    assert store.cursor(COMPANY) == ("2024-05-01 10:00", fake_clock.now)
+    assert store.is_fresh(COMPANY, 600)
+
+
+def test_failed_fetch_keeps_cursor_and_serves_stored_news(make_tools, store, fake_clock):
+    source = StubSource([_item(1, "2024-05-01 10:00")], ConnectionError("blocked"), [_item(2, "2024-05-02 09:00")])
+    tools = make_tools(source)
+
+    tools.get_company_news(COMPANY)
+    cursor = store.cursor(COMPANY)
+    fake_clock.advance(601)
+    assert _titles(tools.get_company_news(COMPANY)) == ["新闻1"]
+    assert store.cursor(COMPANY) == cursor
+
+    # 游标未推进，下一次请求不受新鲜度限制，会重新抓取
+    assert _titles(tools.get_company_news(COMPANY)) == ["新闻2", "新闻1"]
+    assert source.since_calls == [None, "2024-05-01 10:00", "2024-05-01 10:00"]
+
+
+def test_add_dedups_per_company_url_hash(store):
+    first = {**_item(1, "2024-05-01 10:00"), "url_hash": "h1"}
+    assert store.add(COMPANY, [first, {**_item(2), "url_hash": "h2"}]) == 2
+    # 同一链接哈希即使标题变化也不重复写入；其他公司的同一链接单独保存
+    assert store.add(COMPANY, [{**first, "title": "新闻1（更新）"}]) == 0
+    assert store.add("五粮液", [first]) == 1
+    assert _titles(store.latest(COMPANY, 10)) == ["新闻1", "新闻2"]
+    assert store.latest(COMPANY, 10)[1]["date"] == UNKNOWN_DATE
+
+
+def test_cursor_never_moves_backwards(store, fake_clock):
+    store.add(COMPANY, [{**_item(1, "2024-05-02 09:00"), "url_hash": "h1"}])
+    fake_clock.advance(60)
+    store.add(COMPANY, [{**_item(2, "2024-04-30 09:00"), "url_hash": "h2"}, {**_item(3), "url_hash": "h3"}])
+    assert store.cursor(COMPANY) == ("2024-05-02 09:00", fake_clock.now)
+    assert store.cursor("五粮液") == (None, None)
+    assert not store.is_fresh("五粮液", 600)
+
+
+def test_incomplete_source_fails_at_creation():
+    class NoFetchSource(NewsSource):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        NoFetchSource()
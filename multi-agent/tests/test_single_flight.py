@@ -0,0 +1,102 @@
+# tests/test_single_flight.py
+# 并发请求合并测试：同一 key 的并发调用只执行一次，结果或异常由全部调用者共享
+import threading
+import time
+
+import pytest
+
+from tools.single_flight import SingleFlight
+
+N_CALLERS = 16
+
+
+def _wait_for(predicate, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met before timeout")
+        time.sleep(0.001)
+
+
+def _run_concurrently(flight: SingleFlight, key, fn):
+    """N_CALLERS 个线程同时以同一 key 调用；fn 在全部跟随者都已加入后才返回"""
+    outcomes = [None] * N_CALLERS
+
+    def caller(i):
+        try:
+            outcomes[i] = ("ok", flight.do(key, fn))
+        except Exception as e:
+            outcomes[i] = ("error", e)
+
+    threads = [threading.Thread(target=caller, args=(i,)) for i in range(N_CALLERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    return outcomes
+
+
+def test_concurrent_callers_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+    result = {"price": 1688.0}
+
+    def fetch():
+        calls.append(threading.get_ident())
+        _wait_for(lambda: flight.coalesced["stock_price"] == N_CALLERS - 1)
+        return result
+
+    outcomes = _run_concurrently(flight, ("stock_price", "600519.SH"), fetch)
+    assert len(calls) == 1
+    assert all(kind == "ok" and value is result for kind, value in outcomes)
+    assert flight.stats() == {"stock_price": {"executed": 1, "coalesced": N_CALLERS - 1}}
+
+
+def test_exception_is_shared_by_all_callers():
+    flight = SingleFlight()
+    calls = []
+    error = RuntimeError("upstream down")
+
+    def fetch():
+        calls.append(1)
+        _wait_for(lambda: flight.coalesced["company_info"] == N_CALLERS - 1)
+        raise error
+
+    outcomes = _run_concurrently(flight, ("company_info", "000001.SZ"), fetch)
+    assert len(calls) == 1
+    assert all(kind == "error" and value is error for kind, value in outcomes)
+
+
+def test_key_is_released_after_completion():
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError("bad")
+
+    assert flight.do(("news", "茅台"), lambda: 1) == 1
+    assert flight.do(("news", "茅台"), lambda: 2) == 2
+    with pytest.raises(ValueError):
+        flight.do(("news", "茅台"), fail)
+    # 异常后 key 同样被释放
+    assert flight.do(("news", "茅台"), lambda: 3) == 3
+    assert flight.stats() == {"news": {"executed": 4, "coalesced": 0}}
+
+
+def test_different_keys_run_independently():
+    flight = SingleFlight()
+    started = threading.Barrier(2, timeout=5)
+
+    def fetch(code):
+        # 两个 key 必须同时在执行中才能通过屏障，若被错误合并会超时
+        started.wait()
+        return code
+
+    results = {}
+    threads = [threading.Thread(target=lambda c=c: results.__setitem__(c, flight.do(("stock_price", c), fetch, c)))
+               for c in ("600519.SH", "000001.SZ")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    assert results == {"600519.SH": "600519.SH", "000001.SZ": "000001.SZ"}
+    assert flight.stats()["stock_price"] == {"executed": 2, "coalesced": 0}
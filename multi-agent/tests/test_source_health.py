@@ -0,0 +1,167 @@
+# tests/test_source_health.py
+# 数据源熔断器（打开 → 半开 → 关闭/再次打开）与对冲请求测试，运行：python -m pytest -q tests
+import threading
+import time
+
+import pytest
+
+from config.settings import settings
+from tools import source_health as sh
+from tools.source_health import CLOSED, HALF_OPEN, OPEN, InputError, SourceHealth, SourceHealthRegistry
+
+
+@pytest.fixture(autouse=True)
+def circuit_settings(monkeypatch):
+    monkeypatch.setattr(settings, "circuit_min_calls", 5)
+    monkeypatch.setattr(settings, "circuit_error_threshold", 0.6)
+    monkeypatch.setattr(settings, "circuit_cooldown_seconds", 60.0)
+
+
+@pytest.fixture
+def clock(monkeypatch, fake_clock):
+    monkeypatch.setattr(sh, "time", fake_clock)
+    return fake_clock
+
+
+def _trip(health: SourceHealth, failures: int = 5):
+    for _ in range(failures):
+        health.record(0.1, False)
+
+
+def test_circuit_stays_closed_below_threshold(clock):
+    health = SourceHealth("src")
+    # 最近 5 次中 2 次失败（40%）未达 60% 阈值
+    for ok in (True, False, True, False, True):
+        health.record(0.1, ok)
+    assert health.stats()["state"] == CLOSED
+    assert health.allow()
+
+
+def test_circuit_opens_then_half_open_trial_closes(clock):
+    health = SourceHealth("src")
+    _trip(health)
+    assert health.stats()["state"] == OPEN
+    assert not health.allow()
+
+    clock.advance(59.9)
+    assert not health.allow()
+    clock.advance(0.1)
+    # 冷却结束只放行一次试探请求
+    assert health.allow()
+    assert health.stats()["state"] == HALF_OPEN
+    assert not health.allow()
+
+    health.record(0.1, True)
+    assert health.stats()["state"] == CLOSED
+    assert health.stats()["calls"] == 0
+    assert health.allow() and health.allow()
+
+
+def test_failed_half_open_trial_reopens_for_full_cooldown(clock):
+    health = SourceHealth("src")
+    _trip(health)
+    clock.advance(60)
+    assert health.allow()
+    health.record(0.1, False)
+    assert health.stats()["state"] == OPEN
+
+    clock.advance(30)
+    assert not health.allow()
+    clock.advance(30)
+    assert health.allow()
+
+
+def test_open_circuit_goes_straight_to_fallback(clock):
+    registry = SourceHealthRegistry()
+    _trip(registry.get("primary"))
+    calls = []
+
+    def primary(x):
+        calls.append("primary")
+        return x
+
+    def fallback(x):
+        calls.append("fallback")
+        return x * 2
+
+    assert registry.call_with_fallback(("primary", primary), ("fallback", fallback), (21,),
+                                       is_ok=lambda r: True, hedge=False) == 42
+    assert calls == ["fallback"]
+
+
+def test_failure_falls_back_and_returns_fallback_error():
+    registry = SourceHealthRegistry()
+
+    def primary(_):
+        raise RuntimeError("primary down")
+
+    result = registry.call_with_fallback(("p", primary), ("f", lambda _: {"error": "f down"}), (1,),
+                                         is_ok=lambda r: "error" not in r, hedge=False)
+    assert result == {"error": "f down"}
+    assert registry.stats()["p"]["error_rate"] == 1.0
+    assert registry.stats()["f"]["error_rate"] == 1.0
+
+
+def test_input_error_is_raised_and_not_recorded():
+    registry = SourceHealthRegistry()
+    fallback_calls = []
+
+    def primary(_):
+        raise InputError("bad code")
+
+    with pytest.raises(InputError):
+        registry.call_with_fallback(("p", primary), ("f", fallback_calls.append), (1,),
+                                    is_ok=lambda r: True, hedge=False)
+    assert fallback_calls == []
+    assert registry.stats()["p"]["calls"] == 0
+
+
+def test_hedge_delay_is_p95_clamped(monkeypatch):
+    monkeypatch.setattr(settings, "hedge_min_delay", 0.05)
+    monkeypatch.setattr(settings, "hedge_max_delay", 0.2)
+    health = SourceHealth("p")
+    for latency in (0.01, 0.02, 0.03, 0.04, 5.0):
+        health.record(latency, True)
+    assert health.latency_quantile(0.95) == 5.0
+
+    registry = SourceHealthRegistry()
+    registry._sources["p"] = health
+    release = threading.Event()
+
+    def slow_primary(_):
+        release.wait(2)
+        return "primary"
+
+    started = time.monotonic()
+    result = registry.call_with_fallback(("p", slow_primary), ("f", lambda _: "fallback"), (1,),
+                                         is_ok=lambda r: True, hedge=True)
+    elapsed = time.monotonic() - started
+    release.set()
+    # p95 为 5 秒，被限制到 hedge_max_delay 后发起备用请求，备用先返回
+    assert result == "fallback"
+    assert 0.2 <= elapsed < 1.0
+
+
+def test_hedge_not_started_when_primary_is_fast(monkeypatch):
+    monkeypatch.setattr(settings, "hedge_default_delay", 0.5)
+    monkeypatch.setattr(settings, "hedge_min_delay", 0.2)
+    registry = SourceHealthRegistry()
+    fallback_calls = []
+    result = registry.call_with_fallback(("p", lambda _: "primary"), ("f", fallback_calls.append), (1,),
+                                         is_ok=lambda r: True, hedge=True)
+    assert result == "primary"
+    assert fallback_calls == []
+
+
+def test_hedge_uses_primary_when_fallback_fails(monkeypatch):
+    monkeypatch.setattr(settings, "hedge_default_delay", 0.05)
+    monkeypatch.setattr(settings, "hedge_min_delay", 0.05)
+    registry = SourceHealthRegistry()
+
+    def slow_primary(_):
+        time.sleep(0.3)
+        return "primary"
+
+    result = registry.call_with_fallback(("p", slow_primary), ("f", lambda _: {"error": "down"}), (1,),
+                                         is_ok=lambda r: r == "primary", hedge=True)
+    assert result == "primary"
@@ -0,0 +1,154 @@
+# tests/test_tushare_quota.py
+# TuShare 配额管理测试：优先级出队、daily 请求合并与按调用方拆分、排队超时，使用假 pro_api 与假时钟
+import heapq
+
+import pandas as pd
+import pytest
+
+from config.settings import settings
+from tools import tushare_quota as tq
+from tools.tushare_quota import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, TuShareQuotaManager, tushare_priority
+
+
+class StubPro:
+    """记录调用参数；daily 为每个代码、每个交易日返回一行"""
+
+    def __init__(self):
+        self.calls = []
+
+    def daily(self, ts_code, start_date=None, end_date=None, trade_date=None):
+        self.calls.append({"ts_code": ts_code, "start_date": start_date, "end_date": end_date})
+        dates = [trade_date] if trade_date else list(pd.bdate_range(start_date, end_date).strftime("%Y%m%d"))
+        return pd.DataFrame([{"ts_code": code, "trade_date": day, "close": 10.0}
+                             for code in ts_code.split(",") for day in dates])
+
+    def stock_company(self, ts_code):
+        self.calls.append({"ts_code": ts_code})
+        return pd.DataFrame([{"ts_code": ts_code, "chairman": "张三"}])
+
+
+@pytest.fixture
+def clock(monkeypatch, fake_clock):
+    monkeypatch.setattr(tq, "time", fake_clock)
+    return fake_clock
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(settings, "tushare_rate_limits", {"default": 60, "daily": 60})
+    monkeypatch.setattr(settings, "tushare_daily_max_rows", 6000)
+    monkeypatch.setattr(settings, "tushare_daily_batch_size", 500)
+
+
+def _enqueue(manager: TuShareQuotaManager, pro, endpoint: str, priority: int, **kwargs) -> tq._Request:
+    """直接放入队列（不启动调度线程），便于逐步检查出队顺序"""
+    request = tq._Request(priority, next(manager._seq), pro, endpoint, kwargs)
+    heapq.heappush(manager._heap, request)
+    return request
+
+
+def test_interactive_requests_leave_the_queue_first(clock, limits):
+    manager, pro = TuShareQuotaManager(), StubPro()
+    background = _enqueue(manager, pro, "stock_company", PRIORITY_BACKGROUND, ts_code="000001.SZ")
+    interactive = _enqueue(manager, pro, "stock_company", PRIORITY_INTERACTIVE, ts_code="600519.SH")
+    manager._bucket("stock_company").tokens = 1
+
+    batch, _ = manager._next_batch()
+    assert batch == [interactive]
+
+    # 令牌耗尽时返回需要等待的时间，补充令牌后才轮到后台请求
+    batch, sleep_for = manager._next_batch()
+    assert batch is None and sleep_for == pytest.approx(1.0)
+    clock.advance(1.0)
+    batch, _ = manager._next_batch()
+    assert batch == [background]
+
+
+def test_same_priority_is_first_in_first_out(clock, limits):
+    manager, pro = TuShareQuotaManager(), StubPro()
+    requests = [_enqueue(manager, pro, "stock_company", PRIORITY_INTERACTIVE, ts_code=f"60000{i}.SH")
+                for i in range(3)]
+    assert [manager._next_batch()[0][0] for _ in range(3)] == requests
+
+
+def test_queued_daily_calls_are_merged_and_split_per_caller(clock, limits):
+    manager, pro = TuShareQuotaManager(), StubPro()
+    dates = {"start_date": "20240102", "end_date": "20240105"}
+    a = _enqueue(manager, pro, "daily", PRIORITY_INTERACTIVE, ts_code="600519.SH", **dates)
+    b = _enqueue(manager, pro, "daily", PRIORITY_BACKGROUND, ts_code="000001.SZ,000002.SZ", **dates)
+    other_range = _enqueue(manager, pro, "daily", PRIORITY_INTERACTIVE, ts_code="300750.SZ",
+                           start_date="20230102", end_date="20230105")
+
+    batch, _ = manager._next_batch()
+    assert batch == [a, b]
+    assert manager._heap == [other_range]
+    assert manager.stats()["coalesced"] == 1
+
+    manager._execute(batch)
+    assert pro.calls == [{"ts_code": "600519.SH,000001.SZ,000002.SZ", **dates}]
+    assert set(a.future.result()["ts_code"]) == {"600519.SH"}
+    assert len(a.future.result()) == 4
+    assert set(b.future.result()["ts_code"]) == {"000001.SZ", "000002.SZ"}
+    assert len(b.future.result()) == 8
+
+
+def test_merge_is_bounded_by_estimated_rows(clock, limits, monkeypatch):
+    # 一年约 262 个工作日，6000 行上限下每次最多合并 22 只股票
+    manager, pro = TuShareQuotaManager(), StubPro()
+    dates = {"start_date": "20240101", "end_date": "20241231"}
+    assert tq.max_codes_per_daily_call(**dates) == 6000 // tq.estimate_trading_days(**dates) == 22
+    for i in range(30):
+        _enqueue(manager, pro, "daily", PRIORITY_INTERACTIVE, ts_code=f"{i:06d}.SZ", **dates)
+
+    first, _ = manager._next_batch()
+    second, _ = manager._next_batch()
+    assert (len(first), len(second)) == (22, 8)
+
+
+def test_single_trade_date_allows_full_code_batch(limits):
+    assert tq.estimate_trading_days(trade_date="20240105") == 1
+    assert tq.max_codes_per_daily_call(trade_date="20240105") == settings.tushare_daily_batch_size
+
+
+def test_failed_merged_call_fails_every_caller(clock, limits):
+    manager = TuShareQuotaManager()
+
+    class FailingPro:
+        def daily(self, **kwargs):
+            raise RuntimeError("抱歉，您每分钟最多访问该接口200次")
+
+    pro = FailingPro()
+    requests = [_enqueue(manager, pro, "daily", PRIORITY_INTERACTIVE, ts_code=code, trade_date="20240105")
+                for code in ("600519.SH", "000001.SZ")]
+    batch, _ = manager._next_batch()
+    manager._execute(batch)
+    for request in requests:
+        with pytest.raises(RuntimeError):
+            request.future.result(timeout=0)
+
+
+def test_call_through_wrapper_uses_context_priority(limits):
+    manager, pro = TuShareQuotaManager(), StubPro()
+    wrapped = manager.wrap(pro)
+    with tushare_priority(PRIORITY_BACKGROUND):
+        df = wrapped.stock_company(ts_code="600519.SH")
+    assert df["chairman"].tolist() == ["张三"]
+    assert list(manager.stats()["wait_by_priority"]) == [PRIORITY_BACKGROUND]
+
+
+def test_timed_out_request_is_removed_from_queue(clock, monkeypatch):
+    monkeypatch.setattr(settings, "tushare_rate_limits", {"default": 1})
+    monkeypatch.setattr(settings, "tushare_queue_timeout", 0.2)
+    manager, pro = TuShareQuotaManager(), StubPro()
+    # 假时钟不前进，令牌用完后不会补充，请求只能一直排队
+    manager._bucket("stock_company").tokens = 0
+
+    with pytest.raises(Exception, match="排队超过"):
+        manager.call(pro, "stock_company", ts_code="600519.SH")
+    stats = manager.stats()
+    assert stats["queued"] == 0 and stats["abandoned"] == 1
+    # 之后补充令牌也不会再发出这个无人等待的请求
+    clock.advance(120)
+    with manager._cond:
+        assert manager._next_batch() == (None, None)
+    assert pro.calls == []
@@ -1,73 +1,297 @@
+import matplotlib
+matplotlib.use("Agg")  # 无界面渲染，进程池子进程中同样适用
+import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 import mplfinance as mpf
-import io
-import base64
-from langchain.tools import tool
-from typing import List, Dict, Any
+import hashlib
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Dict, Any, Optional, Tuple
+from config.settings import settings
+from tools.single_flight import single_flight
+
+# 图表结果以标记形式嵌入回答文本，UI 据此找到图片文件并展示
+CHART_MARKER = "[图表:{path}]"
+_CHART_MARKER_PATTERN = re.compile(r"\[图表:([^\]]+\.png)\]")
+
+CANDLE_STYLE = {"up": "red", "down": "green", "gridcolor": "gray", "figcolor": "white"}
+LINE_STYLE = {"color": "tab:blue", "linewidth": 1.2, "grid": True}
+
+# K线由细到粗的聚合周期：(pandas Period 频率, 名称)
+RESAMPLE_LEVELS: List[Tuple[str, str]] = [("D", "日线"), ("W", "周线"), ("M", "月线"), ("Q", "季线")]
+CHART_DPI = 100
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """进程内共享的渲染进程池；使用 spawn 启动，避免在多线程进程中 fork"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=settings.chart_max_workers,
+                                        mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _figsize() -> Tuple[float, float]:
+    return settings.chart_width_px / CHART_DPI, settings.chart_height_px / CHART_DPI
+
+
+def _render_candlestick(df: pd.DataFrame, title: str, path: str) -> str:
+    """在子进程中渲染K线图并写入 path（先写临时文件再替换，读方不会看到半成品）"""
+    mc = mpf.make_marketcolors(up=CANDLE_STYLE["up"], down=CANDLE_STYLE["down"], inherit=True)
+    s = mpf.make_mpf_style(marketcolors=mc, gridcolor=CANDLE_STYLE["gridcolor"],
+                           figcolor=CANDLE_STYLE["figcolor"], y_on_right=False)
+    tmp_path = f"{path}.{os.getpid()}.tmp.png"
+    mpf.plot(df, type='candle', style=s, title=title,
+             ylabel='价格', ylabel_lower='成交量',
+             volume=True, figsize=_figsize(), savefig=dict(fname=tmp_path, dpi=CHART_DPI), closefig=True)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _render_line(df: pd.DataFrame, title: str, path: str) -> str:
+    """在子进程中渲染折线图：df 的索引为 X 轴，第一列为 Y 值"""
+    fig, ax = plt.subplots(figsize=_figsize(), dpi=CHART_DPI)
+    try:
+        ax.plot(df.index, df.iloc[:, 0], color=LINE_STYLE["color"], linewidth=LINE_STYLE["linewidth"])
+        ax.set_title(title)
+        ax.set_ylabel(str(df.columns[0]))
+        ax.grid(LINE_STYLE["grid"], alpha=0.3)
+        fig.autofmt_xdate()
+        tmp_path = f"{path}.{os.getpid()}.tmp.png"
+        fig.savefig(tmp_path, format="png")
+    finally:
+        plt.close(fig)
+    os.replace(tmp_path, path)
+    return path
+
+
+def max_bars_for_width(width_px: int = None) -> int:
+    """在给定像素宽度下仍能看清的K线根数"""
+    width_px = width_px or settings.chart_width_px
+    return max(2, width_px // settings.chart_min_bar_px)
+
+
+def choose_frequency(index: pd.DatetimeIndex, max_bars: int) -> Tuple[str, str]:
+    """选择使K线根数不超过 max_bars 的最细聚合周期；即使季线仍超出也返回季线"""
+    for freq, label in RESAMPLE_LEVELS:
+        count = len(index) if freq == "D" else index.to_period(freq).nunique()
+        if count <= max_bars:
+            return freq, label
+    return RESAMPLE_LEVELS[-1]
+
+
+def resample_ohlcv(df: pd.DataFrame, freq: str) -> pd.DataFrame:
+    """
+    日线 OHLCV 按周/月/季聚合：开盘取首日、收盘取末日、最高/最低取极值、成交量求和，
+    每根K线以该周期内最后一个交易日为日期。df 须以交易日升序的 DatetimeIndex 为索引。
+    """
+    if freq == "D" or df.empty:
+        return df
+    periods = df.index.to_period(freq)
+    grouped = df.groupby(periods, sort=True)
+    out = pd.DataFrame({
+        "Open": grouped["Open"].first(),
+        "High": grouped["High"].max(),
+        "Low": grouped["Low"].min(),
+        "Close": grouped["Close"].last(),
+        "Volume": grouped["Volume"].sum(),
+    })
+    last_dates = pd.Series(df.index, index=df.index).groupby(periods, sort=True).max()
+    out.index = pd.DatetimeIndex(last_dates.to_numpy(), name=df.index.name)
+    return out
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets 降采样，返回保留点的下标（升序，含首尾）。
+    每个桶内选出与上一保留点、下一桶均值构成三角形面积最大的点，峰谷等形状特征得以保留。
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        indices[i + 1] = a
+    return indices
+
+
+def extract_chart_paths(text: str) -> List[str]:
+    """找出回答文本中嵌入的图表文件路径"""
+    return _CHART_MARKER_PATTERN.findall(text or "")
+
+
+def strip_chart_markers(text: str) -> str:
+    return _CHART_MARKER_PATTERN.sub("", text or "").rstrip()
 
 
 class ChartTools:
-    @tool("生成股票K线图")
-    def generate_candlestick_chart(self, data: List[Dict[str, Any]], title: str = "股票K线图") -> str:
-        """根据提供的股票数据生成K线图，并返回其描述或Base64编码图片（如果环境支持）。
-        输入为包含'日期', '开盘价', '最高价', '最低价', '收盘价', '成交量'的字典列表。
-        返回图表描述或Base64编码的图片字符串。
+    """
+    图表生成：matplotlib 渲染放在进程池中执行，不占用调用线程的 GIL；
+    结果按 (数据, 样式, 标题) 的内容哈希缓存为 PNG 文件，相同图表只渲染一次，并发请求合并等待。
+    """
+
+    def __init__(self, chart_dir: str = None):
+        self.chart_dir = chart_dir or settings.chart_dir
+
+    @staticmethod
+    def _chart_key(kind: str, df: pd.DataFrame, title: str, style: Dict[str, Any]) -> str:
+        digest = hashlib.sha256()
+        size = (settings.chart_width_px, settings.chart_height_px)
+        digest.update(f"{kind}|{title}|{sorted(style.items())}|{size}".encode("utf-8"))
+        digest.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+        return digest.hexdigest()[:32]
+
+    def _render(self, render_fn, df: pd.DataFrame, title: str, path: str) -> str:
+        if os.path.exists(path):
+            return path
+        os.makedirs(self.chart_dir, exist_ok=True)
+        # 只有进程池本身不可用（子进程崩溃、无法创建进程）时才改为在当前进程渲染；
+        # 渲染超时（TimeoutError 是 OSError 的子类）直接抛给调用方，不重启进程池、不无限期重试
+        try:
+            future = _get_pool().submit(render_fn, df, title, path)
+        except (BrokenProcessPool, OSError) as e:
+            return self._render_in_process(e, render_fn, df, title, path)
+        try:
+            return future.result(timeout=settings.chart_render_timeout)
+        except BrokenProcessPool as e:
+            return self._render_in_process(e, render_fn, df, title, path)
+
+    @staticmethod
+    def _render_in_process(error: Exception, render_fn, df: pd.DataFrame, title: str, path: str) -> str:
+        print(f"[WARNING ChartTools] Process pool unavailable: {error}. Rendering in-process.")
+        _reset_pool()
+        return render_fn(df, title, path)
+
+    def render_candlestick_chart(self, data: List[Dict[str, Any]], title: str = "股票K线图") -> Dict[str, Any]:
+        """
+        渲染K线图，返回 {"path": PNG 文件路径, "cached": 是否命中缓存, "title": 标题}，
+        数据不足或格式不符时返回 {"error": ...}。
         """
         if not data:
-            return "没有足够的历史数据来生成K线图。"
+            return {"error": "没有足够的历史数据来生成K线图。"}
 
         df = pd.DataFrame(data)
-        # 假设数据中包含 'trade_date', 'open', 'high', 'low', 'close', 'vol'
-        # 需要根据实际TuShare/新浪财经返回的字段名进行调整
-        df.rename(columns={
+        # 数据中包含 TuShare 日线字段 'trade_date', 'open', 'high', 'low', 'close', 'vol'
+        df = df.rename(columns={
             'trade_date': 'Date',
             'open': 'Open',
             'high': 'High',
             'low': 'Low',
             'close': 'Close',
             'vol': 'Volume'
-        }, inplace=True)
+        })
 
         # 检查是否所有必要的列都存在
         required_cols = ['Date', 'Open', 'High', 'Low', 'Close', 'Volume']
         if not all(col in df.columns for col in required_cols):
-            # 尝试从新浪/腾讯的简单数据中提取
-            if 'date' in df.columns and 'open' in df.columns and 'current_price' in df.columns:
-                # 这段逻辑需要根据实际传入的数据结构来编写
-                # 比如将新浪的单日数据转换为日线数据
-                return "数据格式不完整，无法生成K线图。需要历史日线数据。"
-            return "数据格式不完整，无法生成K线图。"
+            if 'date' in df.columns and 'current_price' in df.columns:
+                # 新浪/腾讯实时行情只有单日数据
+                return {"error": "数据格式不完整，无法生成K线图。需要历史日线数据。"}
+            return {"error": "数据格式不完整，无法生成K线图。"}
 
-        df['Date'] = pd.to_datetime(df['Date'])
-        df.set_index('Date', inplace=True)
-
-        # 确保数据按日期排序
-        df.sort_index(inplace=True)
+        df = df[required_cols].copy()
+        df['Date'] = pd.to_datetime(df['Date'].astype(str))
+        df = df.set_index('Date').sort_index()
 
         # 检查是否有足够数据
         if len(df) < 2:
-            return "数据不足，无法生成K线图。"
+            return {"error": "数据不足，无法生成K线图。"}
+
+        # 日线根数超出图宽可容纳的数量时聚合为周/月/季线，渲染耗时与区间长度基本无关
+        freq, label = choose_frequency(df.index, max_bars_for_width())
+        if freq != "D":
+            df = resample_ohlcv(df, freq)
+            title = f"{title}（{label}）"
 
-        # 生成图表到内存
+        key = self._chart_key("candle", df, title, CANDLE_STYLE)
+        path = os.path.join(self.chart_dir, f"{key}.png")
+        cached = os.path.exists(path)
         try:
-            buf = io.BytesIO()
-            mc = mpf.make_marketcolors(up='red', down='green', inherit=True)
-            s = mpf.make_mpf_style(marketcolors=mc, gridcolor='gray', figcolor='white', y_on_right=False)
+            single_flight.do(("chart", key), self._render, _render_candlestick, df, title, path)
+        except FutureTimeoutError:
+            return {"error": f"生成K线图超过 {settings.chart_render_timeout} 秒"}
+        except Exception as e:
+            return {"error": f"生成K线图失败: {e}"}
+        return {"path": path, "cached": cached, "title": title, "frequency": label, "bars": len(df)}
 
-            mpf.plot(df, type='candle', style=s, title=title,
-                     ylabel='价格', ylabel_lower='成交量',
-                     volume=True, savefig=buf, closefig=True)
+    def generate_candlestick_chart(self, data: List[Dict[str, Any]], title: str = "股票K线图") -> str:
+        """根据提供的股票数据生成K线图，返回图表描述，并附带供界面展示的图表标记。
+        输入为包含'日期', '开盘价', '最高价', '最低价', '收盘价', '成交量'的字典列表。
+        """
+        result = self.render_candlestick_chart(data, title)
+        if "error" in result:
+            return result["error"]
+        return f"图表已生成，标题为：{title}。{CHART_MARKER.format(path=result['path'])}"
 
-            buf.seek(0)
-            img_base64 = base64.b64encode(buf.read()).decode('utf-8')
-            return f"图表已生成（Base64编码），标题为：{title}。请在支持Base64图片的环境中渲染。"
-        except Exception as e:
-            return f"生成K线图失败: {e}"
+    def render_line_chart(self, data: List[Dict[str, Any]], x_col: str, y_col: str,
+                          title: str = "折线图") -> Dict[str, Any]:
+        """
+        渲染折线图，返回 {"path", "cached", "title", "points"} 或 {"error": ...}。
+        点数超过图宽可分辨的数量时用 LTTB 降采样，保留峰谷形状。
+        """
+        if not data:
+            return {"error": "没有数据，无法生成折线图。"}
+        df = pd.DataFrame(data)
+        if x_col not in df.columns or y_col not in df.columns:
+            return {"error": f"数据中缺少列 {x_col} 或 {y_col}，无法生成折线图。"}
+
+        df = df[[x_col, y_col]].copy()
+        df[y_col] = pd.to_numeric(df[y_col], errors="coerce")
+        df = df.dropna(subset=[y_col])
+        if x_col in ("trade_date", "date", "Date", "日期"):
+            df[x_col] = pd.to_datetime(df[x_col].astype(str), errors="coerce")
+            df = df.dropna(subset=[x_col])
+        df = df.sort_values(x_col).set_index(x_col)
+        if len(df) < 2:
+            return {"error": "数据不足，无法生成折线图。"}
 
-    # @tool("生成简单的折线图")
-    # def generate_line_chart(self, data: List[Dict[str, Any]], x_col: str, y_col: str, title: str = "折线图") -> str:
-    #     """根据数据生成折线图，并返回其描述。
-    #     输入为字典列表，指定X轴和Y轴的列名。"""
-    #     # 类似K线图，用matplotlib生成，并返回描述或Base64
-    #     return f"生成了关于 {x_col} 和 {y_col} 的折线图，标题为 {title}。"
+        # 按位置而非日期做 X 轴距离，停牌等缺口不影响分桶
+        keep = lttb(np.arange(len(df)), df[y_col].to_numpy(), settings.chart_width_px // settings.chart_min_point_px)
+        df = df.iloc[keep]
+
+        key = self._chart_key("line", df, title, LINE_STYLE)
+        path = os.path.join(self.chart_dir, f"{key}.png")
+        cached = os.path.exists(path)
+        try:
+            single_flight.do(("chart", key), self._render, _render_line, df, title, path)
+        except FutureTimeoutError:
+            return {"error": f"生成折线图超过 {settings.chart_render_timeout} 秒"}
+        except Exception as e:
+            return {"error": f"生成折线图失败: {e}"}
+        return {"path": path, "cached": cached, "title": title, "points": len(df)}
 
+    def generate_line_chart(self, data: List[Dict[str, Any]], x_col: str, y_col: str, title: str = "折线图") -> str:
+        """根据数据生成折线图，并返回其描述，附带供界面展示的图表标记。
+        输入为字典列表，指定X轴和Y轴的列名。"""
+        result = self.render_line_chart(data, x_col, y_col, title)
+        if "error" in result:
+            return result["error"]
+        return f"生成了关于 {x_col} 和 {y_col} 的折线图，标题为 {title}。{CHART_MARKER.format(path=result['path'])}"
@@ -0,0 +1,185 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Tuple, Union
+
+# 所有函数沿最后一个轴（时间，升序）计算：输入可以是单只股票的 1-D 序列，
+# 也可以是多只股票对齐后的 2-D 数组 (股票数, 交易日数)。窗口不足的位置为 NaN。
+
+TRADING_DAYS_PER_YEAR = 252
+
+
+def _as_float(x) -> np.ndarray:
+    return np.asarray(x, dtype=np.float64)
+
+
+def sma(x, window: int) -> np.ndarray:
+    x = _as_float(x)
+    out = np.full_like(x, np.nan)
+    if x.shape[-1] < window:
+        return out
+    csum = np.cumsum(np.nan_to_num(x), axis=-1)
+    csum = np.concatenate([np.zeros(x.shape[:-1] + (1,)), csum], axis=-1)
+    out[..., window - 1:] = (csum[..., window:] - csum[..., :-window]) / window
+    return out
+
+
+def _ewm(x: np.ndarray, alpha: float, min_periods: int) -> np.ndarray:
+    """
+    指数加权均值 y_t = alpha * x_t + (1 - alpha) * y_{t-1}（y_0 = x_0），不做 Python 逐日循环：
+    块内展开为 y_j = d^(j+1) * y_prev + alpha * d^j * cumsum(x_i * d^-i)，d = 1 - alpha；
+    按块处理使 d^-i 不超过 e^50，避免溢出。
+    """
+    decay = 1.0 - alpha
+    n = x.shape[-1]
+    out = np.empty_like(x)
+    if n == 0:
+        return out
+    block = n if decay <= 0 else max(1, min(n, int(50 / -np.log(decay))))
+    prev = x[..., :1]
+    for start in range(0, n, block):
+        segment = x[..., start:start + block]
+        j = np.arange(segment.shape[-1])
+        powers = decay ** j
+        with np.errstate(divide="ignore", over="ignore", invalid="ignore"):
+            scaled = np.cumsum(segment / powers, axis=-1) if decay > 0 else segment
+            values = decay * powers * prev + alpha * powers * scaled if decay > 0 else segment
+        out[..., start:start + block] = values
+        prev = values[..., -1:]
+    out[..., :min_periods - 1] = np.nan
+    return out
+
+
+def ema(x, span: int) -> np.ndarray:
+    x = _as_float(x)
+    if x.shape[-1] == 0:
+        return x.copy()
+    return _ewm(x, 2.0 / (span + 1), span)
+
+
+def rsi(close, period: int = 14) -> np.ndarray:
+    """Wilder RSI"""
+    close = _as_float(close)
+    out = np.full_like(close, np.nan)
+    if close.shape[-1] <= period:
+        return out
+    delta = np.diff(close, axis=-1)
+    gains = np.clip(delta, 0, None)
+    losses = np.clip(-delta, 0, None)
+    avg_gain = _ewm(gains, 1.0 / period, period)
+    avg_loss = _ewm(losses, 1.0 / period, period)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rs = avg_gain / avg_loss
+        out[..., 1:] = np.where(avg_loss == 0, 100.0, 100.0 - 100.0 / (1.0 + rs))
+    out[..., 1:][np.isnan(avg_gain)] = np.nan
+    return out
+
+
+def macd(close, fast: int = 12, slow: int = 26, signal: int = 9) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """返回 (DIF, DEA, 柱)，柱按 A 股习惯为 2 * (DIF - DEA)"""
+    close = _as_float(close)
+    dif = ema(close, fast) - ema(close, slow)
+    dea = np.full_like(dif, np.nan)
+    valid_from = slow - 1
+    if dif.shape[-1] > valid_from:
+        dea[..., valid_from:] = ema(dif[..., valid_from:], signal)
+    return dif, dea, 2.0 * (dif - dea)
+
+
+def bollinger(close, window: int = 20, num_std: float = 2.0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """返回 (中轨, 上轨, 下轨)"""
+    close = _as_float(close)
+    mid = sma(close, window)
+    std = np.full_like(close, np.nan)
+    if close.shape[-1] >= window:
+        windows = np.lib.stride_tricks.sliding_window_view(close, window, axis=-1)
+        std[..., window - 1:] = windows.std(axis=-1)
+    return mid, mid + num_std * std, mid - num_std * std
+
+
+def atr(high, low, close, period: int = 14) -> np.ndarray:
+    """Wilder 平均真实波幅"""
+    high, low, close = _as_float(high), _as_float(low), _as_float(close)
+    prev_close = np.concatenate([close[..., :1], close[..., :-1]], axis=-1)
+    true_range = np.maximum.reduce([high - low, np.abs(high - prev_close), np.abs(low - prev_close)])
+    if true_range.shape[-1] == 0:
+        return true_range
+    return _ewm(true_range, 1.0 / period, period)
+
+
+def volatility(close, window: int = 20, annualize: bool = True) -> np.ndarray:
+    """对数收益率的滚动标准差，默认年化"""
+    close = _as_float(close)
+    out = np.full_like(close, np.nan)
+    if close.shape[-1] <= window:
+        return out
+    returns = np.diff(np.log(close), axis=-1)
+    windows = np.lib.stride_tricks.sliding_window_view(returns, window, axis=-1)
+    out[..., window:] = windows.std(axis=-1, ddof=1)
+    return out * np.sqrt(TRADING_DAYS_PER_YEAR) if annualize else out
+
+
+def drawdown(close) -> np.ndarray:
+    """相对历史最高点的回撤（负数）"""
+    close = _as_float(close)
+    running_max = np.maximum.accumulate(close, axis=-1)
+    return close / running_max - 1.0
+
+
+def max_drawdown(close) -> Union[float, np.ndarray]:
+    return drawdown(close).min(axis=-1)
+
+
+def align_closes(frames: Dict[str, pd.DataFrame], column: str = "close") -> Tuple[List[str], np.ndarray]:
+    """把多只股票的日线按交易日对齐为 (股票数, 交易日数) 数组，缺失日前向填充"""
+    codes = list(frames)
+    table = pd.concat({code: frame[column] for code, frame in frames.items()}, axis=1).sort_index().ffill()
+    return codes, table.to_numpy(dtype=np.float64).T
+
+
+def _last(x: np.ndarray) -> float:
+    return float(x[..., -1]) if x.size else float("nan")
+
+
+def indicator_summary(df: pd.DataFrame) -> Dict[str, Union[float, int, str]]:
+    """
+    单只股票的技术指标摘要（取最新值），df 为按交易日升序的日线（含 open/high/low/close）。
+    数值保留两位小数，窗口不足的指标不输出。
+    """
+    close = df["close"].to_numpy(dtype=np.float64)
+    high = df["high"].to_numpy(dtype=np.float64)
+    low = df["low"].to_numpy(dtype=np.float64)
+    n = close.size
+
+    dif, dea, hist = macd(close)
+    mid, upper, lower = bollinger(close)
+    last_close = _last(close)
+    atr14 = _last(atr(high, low, close))
+    band_width = _last(upper) - _last(lower)
+
+    summary = {
+        "截至": str(df["trade_date"].iloc[-1]) if "trade_date" in df else str(df.index[-1].date()),
+        "样本交易日": n,
+        "收盘价": last_close,
+        "MA5": _last(sma(close, 5)),
+        "MA20": _last(sma(close, 20)),
+        "MA60": _last(sma(close, 60)),
+        "EMA12": _last(ema(close, 12)),
+        "EMA26": _last(ema(close, 26)),
+        "RSI14": _last(rsi(close)),
+        "MACD_DIF": _last(dif),
+        "MACD_DEA": _last(dea),
+        "MACD柱": _last(hist),
+        "布林上轨": _last(upper),
+        "布林下轨": _last(lower),
+        "布林位置%": (last_close - _last(lower)) / band_width * 100 if band_width else float("nan"),
+        "ATR14": atr14,
+        "ATR14占价格%": atr14 / last_close * 100 if last_close else float("nan"),
+        "年化波动率%": _last(volatility(close)) * 100,
+        "区间最大回撤%": float(max_drawdown(close)) * 100 if n else float("nan"),
+        "近20日涨跌%": float(last_close / close[-21] - 1) * 100 if n > 20 else float("nan"),
+    }
+    return {
+        key: (round(value, 2) if isinstance(value, float) else value)
+        for key, value in summary.items()
+        if not (isinstance(value, float) and np.isnan(value))
+    }
@@ -0,0 +1,94 @@
+from collections import deque
+from typing import Any, Dict, Iterable, List, Tuple
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick 多模式匹配自动机。
+    一次扫描即可找出文本中出现的全部关键词，耗时只与文本长度和命中数量有关，
+    与关键词数量无关，适合路由关键词、股票名称等大词表的匹配。
+    """
+
+    def __init__(self, case_sensitive: bool = False):
+        self.case_sensitive = case_sensitive
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[str, Any]]] = [[]]
+        self._dict_suffix: List[int] = [0]
+        self._pattern_count = 0
+        self._built = True
+
+    def __len__(self) -> int:
+        return self._pattern_count
+
+    def _normalize(self, text: str) -> str:
+        return text if self.case_sensitive else text.lower()
+
+    def add(self, keyword: str, value: Any = None):
+        """添加关键词，value 为命中时返回的附加值（默认为关键词本身）"""
+        if not keyword:
+            return
+        node = 0
+        for ch in self._normalize(keyword):
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = nxt
+        self._output[node].append((keyword, keyword if value is None else value))
+        self._pattern_count += 1
+        self._built = False
+
+    def add_many(self, items: Iterable[Tuple[str, Any]]):
+        for keyword, value in items:
+            self.add(keyword, value)
+
+    def build(self):
+        """构建失败指针，添加完关键词后调用（search 时也会自动调用）"""
+        queue = deque()
+        for nxt in self._goto[0].values():
+            self._fail[nxt] = 0
+            queue.append(nxt)
+
+        # 每个节点的输出只保存自身的关键词，匹配时沿 dict 后缀链收集，避免构建时复制列表
+        self._dict_suffix = [0] * len(self._goto)
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                suffix = self._fail[nxt]
+                self._dict_suffix[nxt] = suffix if self._output[suffix] else self._dict_suffix[suffix]
+
+        self._built = True
+
+    def iter_matches(self, text: str):
+        """
+        扫描文本，依次产出 (起始位置, 结束位置, 关键词, 附加值)。
+        结束位置为开区间，可直接用于切片。
+        """
+        if not self._built:
+            self.build()
+
+        goto, fail, output, dict_suffix = self._goto, self._fail, self._output, self._dict_suffix
+        node = 0
+        for i, ch in enumerate(self._normalize(text)):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+
+            hit = node if output[node] else dict_suffix[node]
+            while hit:
+                for keyword, value in output[hit]:
+                    yield i + 1 - len(keyword), i + 1, keyword, value
+                hit = dict_suffix[hit]
+
+    def search(self, text: str) -> List[Tuple[int, int, str, Any]]:
+        """返回文本中全部命中（允许重叠）"""
+        return list(self.iter_matches(text))
@@ -0,0 +1,56 @@
+from datetime import datetime, time, timedelta, timezone
+
+# A股交易时段（北京时间，无夏令时），未考虑法定节假日
+CN_TZ = timezone(timedelta(hours=8))
+TRADING_SESSIONS = [(time(9, 30), time(11, 30)), (time(13, 0), time(15, 0))]
+
+
+def now_cn() -> datetime:
+    return datetime.now(CN_TZ)
+
+
+def _to_cn(dt: datetime = None) -> datetime:
+    if dt is None:
+        return now_cn()
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=CN_TZ)
+    return dt.astimezone(CN_TZ)
+
+
+def is_trading_time(dt: datetime = None) -> bool:
+    """当前是否处于A股连续竞价时段"""
+    dt = _to_cn(dt)
+    if dt.weekday() >= 5:
+        return False
+    return any(start <= dt.time() < end for start, end in TRADING_SESSIONS)
+
+
+def next_open(dt: datetime = None) -> datetime:
+    """下一个交易时段的开始时间（交易时段内返回当前时间）"""
+    dt = _to_cn(dt)
+    if is_trading_time(dt):
+        return dt
+    day = dt
+    while True:
+        if day.weekday() < 5:
+            for start, _ in TRADING_SESSIONS:
+                candidate = datetime.combine(day.date(), start, tzinfo=CN_TZ)
+                if candidate > dt:
+                    return candidate
+        day = datetime.combine(day.date() + timedelta(days=1), time(0, 0), tzinfo=CN_TZ)
+
+
+def seconds_until_next_open(dt: datetime = None) -> float:
+    dt = _to_cn(dt)
+    return max((next_open(dt) - dt).total_seconds(), 0.0)
+
+
+def market_aware_ttl(trading_ttl: float, max_closed_ttl: float = None, dt: datetime = None) -> float:
+    """
+    行情类数据的缓存时间：交易时段内使用较短的 trading_ttl，
+    休市期间数据不会变化，缓存到下一次开盘（可用 max_closed_ttl 设置上限）。
+    """
+    if is_trading_time(dt):
+        return trading_ttl
+    ttl = max(seconds_until_next_open(dt), trading_ttl)
+    return min(ttl, max_closed_ttl) if max_closed_ttl else ttl
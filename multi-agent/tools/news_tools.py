@@ -1,52 +1,223 @@
-import requests
-from bs4 import BeautifulSoup
+from abc import ABC, abstractmethod
+from bs4 import BeautifulSoup, SoupStrainer
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import quote, urlsplit
+import hashlib
+import json
 import re
+import time
 from typing import List, Dict, Union
+from config.settings import settings
+from tools.http_client import http_client
+from tools.single_flight import single_flight
+from storage.news_store import NewsStore, UNKNOWN_DATE
+
+_DATE_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}')
+_TAG_PATTERN = re.compile(r'<[^>]+>')
+_TITLE_NOISE_PATTERN = re.compile(r'[\s\W_]+', re.UNICODE)
+
+
+class NewsSource(ABC):
+    """
+    新闻来源基类：子类必须实现 fetch，返回 {title, link, date} 字典列表，未实现时实例化即报错。
+    since 为已见过的最新发布时间（YYYY-MM-DD HH:MM），不晚于它的条目无需解析返回。
+    """
+    name = "base"
+
+    @abstractmethod
+    def fetch(self, company_name: str, limit: int, since: str = None) -> List[Dict[str, str]]:
+        ...
+
+
+class SinaNewsSource(NewsSource):
+    """新浪新闻搜索页"""
+    name = "sina"
+
+    # 只解析搜索结果容器，跳过页头、推荐位等无关节点
+    _strainer = SoupStrainer("div", class_="box-result")
+
+    def fetch(self, company_name: str, limit: int, since: str = None) -> List[Dict[str, str]]:
+        url = f"https://search.sina.com.cn/?q={quote(company_name + ' 股票')}&c=news&by=media"
+        res = http_client.get(url)
+        res.encoding = "utf-8"
+        soup = BeautifulSoup(res.text, "lxml", parse_only=self._strainer)
+
+        items = []
+        for item in soup.select("div.box-result > div.r-info"):
+            date_source_tag = item.select_one("span.fg-c-a")
+            if not date_source_tag:
+                continue
+            match = _DATE_PATTERN.search(date_source_tag.get_text(strip=True))
+            # 先看发布时间，游标之前的旧新闻不再解析标题
+            if since and match and match.group(0) <= since:
+                continue
+            title_tag = item.select_one("h2 > a")
+            if title_tag:
+                items.append({
+                    "title": title_tag.get_text(strip=True),
+                    "link": title_tag.get("href"),
+                    "date": match.group(0) if match else UNKNOWN_DATE
+                })
+            if len(items) >= limit:
+                break
+        return items
+
+
+class EastmoneyNewsSource(NewsSource):
+    """东方财富资讯搜索接口（JSONP）"""
+    name = "eastmoney"
+
+    def fetch(self, company_name: str, limit: int, since: str = None) -> List[Dict[str, str]]:
+        param = {
+            "uid": "",
+            "keyword": company_name,
+            "type": ["cmsArticleWebOld"],
+            "client": "web",
+            "clientType": "web",
+            "clientVersion": "curr",
+            "param": {"cmsArticleWebOld": {
+                "searchScope": "default", "sort": "time", "pageIndex": 1, "pageSize": limit,
+                "preTag": "", "postTag": ""
+            }},
+        }
+        url = ("https://search-api-web.eastmoney.com/search/jsonp?cb=jQuery&param="
+               + quote(json.dumps(param, ensure_ascii=False, separators=(",", ":"))))
+        res = http_client.get(url, headers={"Referer": "https://so.eastmoney.com/"})
+        res.encoding = "utf-8"
+        body = res.text[res.text.index("(") + 1:res.text.rindex(")")]
+        articles = (json.loads(body).get("result") or {}).get("cmsArticleWebOld") or []
+
+        items = []
+        for article in articles[:limit]:
+            match = _DATE_PATTERN.search(article.get("date") or "")
+            # 结果按时间倒序，遇到游标之前的条目即可停止
+            if since and match and match.group(0) <= since:
+                break
+            items.append({
+                "title": _TAG_PATTERN.sub("", article.get("title") or "").strip(),
+                "link": article.get("url"),
+                "date": match.group(0) if match else UNKNOWN_DATE
+            })
+        return items
+
+
+def _title_key(title: str) -> str:
+    return hashlib.md5(_TITLE_NOISE_PATTERN.sub("", title).lower().encode("utf-8")).hexdigest()
+
+
+def _url_key(url: str) -> str:
+    parts = urlsplit((url or "").strip())
+    normalized = f"{parts.netloc.lower()}{parts.path.rstrip('/')}?{parts.query}"
+    return hashlib.md5(normalized.encode("utf-8")).hexdigest()
 
 
 class NewsTools:
 
+    def __init__(self, sources: List[NewsSource] = None):
+        self.sources: List[NewsSource] = sources or [SinaNewsSource(), EastmoneyNewsSource()]
+        self.pool = ThreadPoolExecutor(max_workers=settings.news_max_workers, thread_name_prefix="news")
+
+        # 新闻本地存储，数据库不可用时每次都完整抓取
+        try:
+            self.store = NewsStore()
+        except Exception as e:
+            print(f"[WARNING NewsTools] News store unavailable: {e}. Fetching without local store.")
+            self.store = None
+
+    def register_source(self, source: NewsSource):
+        """注册额外的新闻来源"""
+        self.sources.append(source)
+
     def get_company_news(self, company_name: str) -> Union[List[Dict[str, str]], Dict[str, str]]:
         """
         从新浪财经或东方财富抓取与公司相关的新闻。
         输入为公司名称，例如 '贵州茅台'。
         返回包含新闻标题、链接、发布日期等信息的列表。
+        同一公司的并发请求会合并为一次抓取。
+        """
+        company_name = company_name.strip()
+        return single_flight.do(("company_news", company_name), self._fetch_company_news, company_name)
+
+    def _fetch_company_news(self, company_name: str) -> Union[List[Dict[str, str]], Dict[str, str]]:
+        """
+        先查本地存储：news_freshness_seconds 内抓取过则直接返回存储中的最新新闻；
+        否则只抓取游标之后的新条目写入存储，再从存储返回最新 news_max_items 条。
         """
+        limit = settings.news_max_items
+        if not self.store:
+            return self._aggregate(company_name, limit)
+
+        try:
+            if self.store.is_fresh(company_name, settings.news_freshness_seconds):
+                print(f"[DEBUG NewsTools] Serving news for '{company_name}' from local store.")
+                return self.store.latest(company_name, limit) or {"error": f"未找到 '{company_name}' 相关新闻"}
+            since, _ = self.store.cursor(company_name)
+        except Exception as e:
+            print(f"[WARNING NewsTools] Reading news store failed for '{company_name}': {e}")
+            return self._aggregate(company_name, limit)
+
+        fresh_items = self._aggregate(company_name, limit, since)
+        if not isinstance(fresh_items, list):
+            # 抓取失败不推进游标，下次请求会重新抓取；此前存储的新闻仍可返回
+            try:
+                return self.store.latest(company_name, limit) or fresh_items
+            except Exception as e:
+                print(f"[WARNING NewsTools] Reading news store failed for '{company_name}': {e}")
+                return fresh_items
         try:
-            news_items = []
-
-            # 尝试从新浪新闻搜索页面获取
-            search_url_generic = f"https://search.sina.com.cn/?q={company_name} 股票&c=news&by=media"
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-                              "(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36)"
-            }
-            res_generic = requests.get(search_url_generic, headers=headers, timeout=5)
-            res_generic.encoding = "utf-8"
-            soup_generic = BeautifulSoup(res_generic.text, "html.parser")
-
-            for item in soup_generic.select("div.box-result > div.r-info"):
-                title_tag = item.select_one("h2 > a")
-                date_source_tag = item.select_one("span.fg-c-a")
-                if title_tag and date_source_tag:
-                    date_text = date_source_tag.get_text(strip=True)
-                    match = re.search(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}', date_text)
-                    date_str = match.group(0) if match else "未知日期"
-
-                    news_items.append({
-                        "title": title_tag.get_text(strip=True),
-                        "link": title_tag.get("href"),
-                        "date": date_str
-                    })
-
-                if len(news_items) >= 5:
-                    break
+            inserted = self.store.add(company_name, fresh_items)
+            print(f"[DEBUG NewsTools] Stored {inserted} new news items for '{company_name}'.")
+            stored = self.store.latest(company_name, limit)
+        except Exception as e:
+            print(f"[WARNING NewsTools] Writing news store failed for '{company_name}': {e}")
+            return fresh_items
+        return stored or fresh_items
+
+    def _aggregate(self, company_name: str, limit: int, since: str = None) -> Union[List[Dict[str, str]], Dict[str, str]]:
+        """并发查询全部来源，在 news_deadline_seconds 内返回已到达的结果，按标题/链接去重"""
+        try:
+            started = time.monotonic()
+            futures = {self.pool.submit(source.fetch, company_name, limit, since): source for source in self.sources}
+            done, not_done = wait(futures, timeout=settings.news_deadline_seconds)
+            for future in not_done:
+                future.cancel()
+                print(f"[WARNING NewsTools] Source '{futures[future].name}' missed the "
+                      f"{settings.news_deadline_seconds}s deadline for '{company_name}'.")
+
+            news_items, seen = [], set()
+            succeeded = 0
+            # 按来源注册顺序合并，保证结果稳定
+            for future, source in futures.items():
+                if future not in done:
+                    continue
+                try:
+                    items = future.result()
+                except Exception as e:
+                    print(f"[ERROR NewsTools] Source '{source.name}' failed for '{company_name}': {e}")
+                    continue
+                succeeded += 1
+                for item in items:
+                    title_key = _title_key(item["title"])
+                    url_key = _url_key(item["link"]) if item.get("link") else title_key
+                    if not item["title"] or {title_key, url_key} & seen:
+                        continue
+                    seen |= {title_key, url_key}
+                    news_items.append({**item, "source": source.name, "url_hash": url_key})
 
+            if not succeeded:
+                # 所有来源均失败或超时：返回错误，调用方据此不推进游标
+                return {"error": f"获取 '{company_name}' 相关新闻失败：所有新闻来源均不可用"}
+            if not news_items and since:
+                print(f"[DEBUG NewsTools] No news newer than {since} for '{company_name}'.")
+                return []
             if not news_items:
                 print(f"[ERROR NewsTools] No news found for '{company_name}' after general search.")
                 return {"error": f"未找到 '{company_name}' 相关新闻"}
 
-            print(f"[DEBUG NewsTools] Successfully retrieved {len(news_items)} news items for '{company_name}'.")
+            news_items.sort(key=lambda item: item["date"] if item["date"] != UNKNOWN_DATE else "", reverse=True)
+            news_items = news_items[:limit]
+            print(f"[DEBUG NewsTools] Successfully retrieved {len(news_items)} news items for '{company_name}' "
+                  f"in {time.monotonic() - started:.2f}s.")
             return news_items
 
         except Exception as e:
@@ -0,0 +1,328 @@
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+from config.settings import settings
+from tools.market_hours import is_trading_time, CN_TZ
+
+try:
+    import fcntl
+except ImportError:  # Windows 无 fcntl
+    fcntl = None
+
+# 快照文件布局：头部(魔数, 版本, 容量, 条数, 序列号) + 定长记录
+# 写入时序列号先变为奇数、写完再变为偶数（seqlock），读方据此判断是否读到半写状态
+_MAGIC = b"QSNP"
+_VERSION = 1
+_HEADER = struct.Struct("<4sIIIQ")
+_HEADER_SIZE = 32
+_RECORD = struct.Struct("<16s48s16s7d")
+_NUMERIC_FIELDS = ["current_price", "last_close", "open", "high", "low", "volume"]
+
+
+def _encode(text: str, size: int) -> bytes:
+    data = str(text or "").encode("utf-8")[:size]
+    # 截断可能切断多字节字符，回退到完整字符边界
+    return data.decode("utf-8", errors="ignore").encode("utf-8")
+
+
+class QuoteSnapshot:
+    """
+    基于 mmap 文件的行情快照，一个进程写、多个进程（Streamlit/worker）只读共享。
+    读取按代码 O(1) 查找，每条记录带刷新时间戳。
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or settings.quote_snapshot_path
+        self._mm: Optional[mmap.mmap] = None
+        self._file = None
+        self._writable = False
+        self._index: Dict[str, int] = {}
+        self._index_seq = -1
+        self._lock = threading.Lock()
+
+    def _open_reader(self) -> bool:
+        if self._mm is not None:
+            return True
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < _HEADER_SIZE:
+            return False
+        self._file = open(self.path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return True
+
+    def _open_writer(self, capacity: int):
+        size = _HEADER_SIZE + capacity * _RECORD.size
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.close()
+        self._file = open(self.path, "a+b")
+        # 文件只增不减，避免其他进程已映射的区域被截断
+        existing = os.path.getsize(self.path)
+        if existing < size:
+            self._file.truncate(size)
+        self._mm = mmap.mmap(self._file.fileno(), max(size, existing), access=mmap.ACCESS_WRITE)
+        # 延续已有序列号，防止读方用旧索引匹配到新写入的同一序列号
+        seq = 0
+        if existing >= _HEADER_SIZE:
+            magic, _, _, _, old_seq = _HEADER.unpack_from(self._mm, 0)
+            if magic == _MAGIC:
+                seq = old_seq + old_seq % 2
+        _HEADER.pack_into(self._mm, 0, _MAGIC, _VERSION, capacity, 0, seq)
+        self._writable = True
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._writable = False
+        self._index_seq = -1
+
+    def publish(self, quotes: List[Dict]):
+        """写入一批行情（覆盖旧快照），quotes 为 get_stock_prices_batch 风格的记录"""
+        with self._lock:
+            capacity = max(len(quotes), settings.quote_poller_top_n)
+            if not self._writable or _HEADER.unpack_from(self._mm, 0)[2] < len(quotes):
+                self._open_writer(capacity)
+            magic, version, capacity, _, seq = _HEADER.unpack_from(self._mm, 0)
+            now = time.time()
+
+            _HEADER.pack_into(self._mm, 0, magic, version, capacity, 0, seq + 1)
+            for slot, quote in enumerate(quotes[:capacity]):
+                numbers = []
+                for field in _NUMERIC_FIELDS:
+                    try:
+                        numbers.append(float(quote.get(field)))
+                    except (TypeError, ValueError):
+                        numbers.append(float("nan"))
+                _RECORD.pack_into(
+                    self._mm, _HEADER_SIZE + slot * _RECORD.size,
+                    _encode(quote.get("code"), 16), _encode(quote.get("name"), 48), _encode(quote.get("date"), 16),
+                    *numbers, now
+                )
+            _HEADER.pack_into(self._mm, 0, magic, version, capacity, min(len(quotes), capacity), seq + 2)
+            self._mm.flush()
+
+    def get(self, ts_code: str, max_age: float = None) -> Optional[Dict]:
+        """读取单只股票的快照行情，不存在或超过 max_age 秒返回 None"""
+        with self._lock:
+            if not self._open_reader():
+                return None
+            for _ in range(3):
+                magic, _, capacity, count, seq = _HEADER.unpack_from(self._mm, 0)
+                if magic != _MAGIC or seq % 2:
+                    time.sleep(0.001)
+                    continue
+                if _HEADER_SIZE + count * _RECORD.size > len(self._mm):
+                    # 写方扩容后重新映射
+                    self.close()
+                    if not self._open_reader():
+                        return None
+                    continue
+                if seq != self._index_seq:
+                    self._index = {
+                        _RECORD.unpack_from(self._mm, _HEADER_SIZE + slot * _RECORD.size)[0]
+                        .rstrip(b"\0").decode("utf-8"): slot
+                        for slot in range(count)
+                    }
+                    self._index_seq = seq
+                slot = self._index.get(ts_code)
+                if slot is None:
+                    return None
+                record = _RECORD.unpack_from(self._mm, _HEADER_SIZE + slot * _RECORD.size)
+                if _HEADER.unpack_from(self._mm, 0)[4] != seq:
+                    continue
+                break
+            else:
+                return None
+
+        code, name, date, *numbers, updated_at = record
+        if max_age is not None and time.time() - updated_at > max_age:
+            return None
+        quote = {"code": code.rstrip(b"\0").decode("utf-8"), "name": name.rstrip(b"\0").decode("utf-8")}
+        quote.update(zip(_NUMERIC_FIELDS, numbers))
+        quote["date"] = date.rstrip(b"\0").decode("utf-8")
+        quote["snapshot_at"] = datetime.fromtimestamp(updated_at, CN_TZ).strftime("%Y-%m-%d %H:%M:%S")
+        quote["source"] = "snapshot"
+        return quote
+
+
+class HotTickerTracker:
+    """
+    统计最近一段时间内被查询的股票，按查询次数取热门股票。
+    查询先在进程内计数，由 flush() 定期累加到 SQLite（hot_ticker_hits），
+    因此写方进程排名时能看到所有进程的查询；数据库不可用时退化为只统计本进程。
+    """
+
+    def __init__(self, window_seconds: float = None, store=None):
+        self.window_seconds = window_seconds or settings.quote_poller_window_seconds
+        self.bucket_seconds = settings.quote_poller_bucket_seconds
+        self._store = store
+        self._store_failed = False
+        self._pending: Counter = Counter()
+        self._local: Dict[int, Counter] = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, now: float = None) -> int:
+        return int((time.time() if now is None else now) // self.bucket_seconds)
+
+    def _first_bucket(self) -> int:
+        return self._bucket(time.time() - self.window_seconds)
+
+    def _get_store(self):
+        if self._store is None and not self._store_failed:
+            try:
+                from storage.hot_ticker_store import HotTickerStore
+                self._store = HotTickerStore()
+            except Exception as e:
+                print(f"[WARNING HotTickerTracker] Shared hit store unavailable: {e}. Counting this process only.")
+                self._store_failed = True
+        return self._store
+
+    def record(self, ts_code: str):
+        bucket = self._bucket()
+        with self._lock:
+            self._pending[ts_code] += 1
+            if bucket not in self._local:
+                # 进入新时间桶时丢弃窗口外的本地计数（未开启轮询时 flush 不会被调用）
+                first = self._first_bucket()
+                for old in [b for b in self._local if b < first]:
+                    del self._local[old]
+                self._local[bucket] = Counter()
+            self._local[bucket][ts_code] += 1
+
+    def flush(self):
+        """把本进程尚未提交的查询次数累加到共享表，并清理窗口外的旧时间桶"""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            first = self._first_bucket()
+            for bucket in [b for b in self._local if b < first]:
+                del self._local[bucket]
+        store = self._get_store()
+        if store is None:
+            return
+        try:
+            store.add(pending, self._bucket())
+            store.prune(first)
+        except Exception as e:
+            print(f"[WARNING HotTickerTracker] Flushing {sum(pending.values())} hits failed: {e}")
+            with self._lock:
+                self._pending.update(pending)
+
+    def top(self, n: int) -> List[str]:
+        self.flush()
+        store = self._get_store()
+        if store is not None:
+            try:
+                return store.top(n, self._first_bucket())
+            except Exception as e:
+                print(f"[WARNING HotTickerTracker] Reading shared hits failed: {e}. Using this process only.")
+        first = self._first_bucket()
+        with self._lock:
+            counts = sum((c for b, c in self._local.items() if b >= first), Counter())
+        return [code for code, _ in counts.most_common(n)]
+
+
+class WriterLease:
+    """
+    快照写方选举：对 <快照路径>.lock 加非阻塞排他 flock，同一时刻只有一个进程能持有，
+    持有者进程退出时由操作系统自动释放，其他进程随后可以接手。
+    """
+
+    def __init__(self, snapshot_path: str):
+        self.path = f"{snapshot_path}.lock"
+        self._file = None
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None
+
+    def try_acquire(self) -> bool:
+        if self._file is not None:
+            return True
+        if fcntl is None:
+            # 无法跨进程加锁的平台上退化为单进程使用（请只在一个进程中开启轮询）
+            self._file = True
+            return True
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        lock_file = open(self.path, "a+b")
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._file = lock_file
+        return True
+
+    def release(self):
+        if self._file is not None and self._file is not True:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self._file.close()
+        self._file = None
+
+
+class QuotePoller:
+    """
+    后台行情轮询：交易时段内按固定间隔用腾讯批量接口刷新（所有进程查询次数合计）最热门的 N 只股票，
+    结果发布到共享快照，行情查询命中快照时无需联网。
+    快照为单写方设计（seqlock），多个进程都开启轮询时只有持有 WriterLease 的进程写入，
+    其余进程每个周期尝试接手。
+    """
+
+    def __init__(self, stock_tools, tracker: HotTickerTracker = None, snapshot: QuoteSnapshot = None):
+        self.stock_tools = stock_tools
+        self.tracker = tracker or hot_tickers
+        self.snapshot = snapshot or QuoteSnapshot()
+        self.interval = settings.quote_poller_interval
+        self.top_n = settings.quote_poller_top_n
+        self.lease = WriterLease(self.snapshot.path)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="quote-poller", daemon=True)
+        self._thread.start()
+        print(f"[DEBUG QuotePoller] Started: top {self.top_n} tickers every {self.interval}s.")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval + 1)
+        self.lease.release()
+
+    def poll_once(self) -> int:
+        codes = self.tracker.top(self.top_n)
+        if not codes:
+            return 0
+        df = self.stock_tools._get_prices_batch_from_tencent(codes)
+        if df.empty:
+            return 0
+        self.snapshot.publish(df.to_dict(orient="records"))
+        return len(df)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            # 每个进程都提交本进程的查询次数，写方据此按全部进程的查询排名
+            self.tracker.flush()
+            was_writer = self.lease.held
+            if self.lease.try_acquire() and not was_writer:
+                print(f"[DEBUG QuotePoller] Process {os.getpid()} is now the snapshot writer.")
+            if self.lease.held and is_trading_time():
+                try:
+                    self.poll_once()
+                except Exception as e:
+                    print(f"[ERROR QuotePoller] Polling failed: {e}")
+            self._stop.wait(self.interval)
+
+
+# 进程内共享的热门股票统计（跨进程汇总于 SQLite）与快照读取器
+hot_tickers = HotTickerTracker()
+quote_snapshot = QuoteSnapshot()
@@ -0,0 +1,230 @@
+import csv
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from config.settings import settings
+from tools.keyword_automaton import KeywordAutomaton
+from tools.source_health import InputError
+
+SNAPSHOT_FIELDS = ["ts_code", "symbol", "name", "fullname", "cnspell"]
+
+# 标准 A 股代码（也用作文件名，须整串匹配）
+TS_CODE_PATTERN = re.compile(r"^\d{6}\.(SH|SZ|BJ)$")
+_CODE_PATTERN = re.compile(r'(?<![0-9A-Za-z])(\d{6})(?:\.(SH|SZ|BJ))?(?![0-9A-Za-z])', re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class Security:
+    ts_code: str
+    symbol: str
+    name: str
+    fullname: str = ""
+    cnspell: str = ""
+
+
+def infer_ts_code(symbol: str) -> Optional[str]:
+    """根据6位代码的号段推断交易所后缀，无法识别时返回 None"""
+    if not re.fullmatch(r'\d{6}', symbol):
+        return None
+    if symbol.startswith(("60", "68", "90")):
+        return f"{symbol}.SH"
+    if symbol.startswith(("00", "30", "20")):
+        return f"{symbol}.SZ"
+    if symbol.startswith(("43", "83", "87", "88", "92")):
+        return f"{symbol}.BJ"
+    return None
+
+
+class InvalidCodeError(InputError, ValueError):
+    """无法识别的股票代码"""
+
+
+def normalize_ts_code(code: str) -> str:
+    """规范化为 TuShare 代码（去空白、大写，6位代码按号段补交易所后缀），无法识别时抛出 InvalidCodeError"""
+    text = str(code or "").strip().upper()
+    if TS_CODE_PATTERN.match(text):
+        return text
+    ts_code = infer_ts_code(text)
+    if ts_code is None:
+        raise InvalidCodeError(f"无效的股票代码: {code}")
+    return ts_code
+
+
+class SecurityMaster:
+    """
+    A股证券主数据：从本地快照加载，建立代码/名称/拼音首字母索引。
+    resolve() 单次扫描用户文本即可识别其中提到的全部股票。
+    """
+
+    def __init__(self, snapshot_path: str = None):
+        self.snapshot_path = snapshot_path or settings.security_master_path
+        self.by_code: Dict[str, Security] = {}
+        self.by_symbol: Dict[str, Security] = {}
+        self.automaton = KeywordAutomaton()
+        self.load(self.snapshot_path)
+
+    def __len__(self) -> int:
+        return len(self.by_code)
+
+    def load(self, path: str):
+        """加载快照文件并重建索引"""
+        by_code, by_symbol = {}, {}
+        automaton = KeywordAutomaton()
+
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8", newline="") as f:
+                for row in csv.DictReader(f):
+                    ts_code = (row.get("ts_code") or "").strip().upper()
+                    if not ts_code:
+                        continue
+                    security = Security(
+                        ts_code=ts_code,
+                        symbol=(row.get("symbol") or ts_code[:6]).strip(),
+                        name=(row.get("name") or "").strip(),
+                        fullname=(row.get("fullname") or "").strip(),
+                        cnspell=(row.get("cnspell") or "").strip().lower(),
+                    )
+                    by_code[ts_code] = security
+                    by_symbol.setdefault(security.symbol, security)
+                    for alias in self._aliases(security):
+                        automaton.add(alias, security)
+        else:
+            print(f"[WARNING SecurityMaster] Snapshot not found at {path}. Only code patterns will be resolved.")
+
+        automaton.build()
+        self.by_code, self.by_symbol, self.automaton = by_code, by_symbol, automaton
+        print(f"[DEBUG SecurityMaster] Loaded {len(by_code)} securities from snapshot.")
+
+    @staticmethod
+    def _aliases(security: Security) -> List[str]:
+        aliases = [security.name, security.fullname]
+        # "万科A"、"京东方A" 等简称在口语中常省略股份类别后缀
+        if security.name.endswith(("A", "B")) and len(security.name) > 2:
+            aliases.append(security.name[:-1])
+        # 拼音首字母过短时误匹配太多，只收录3位及以上
+        if len(security.cnspell) >= 3:
+            aliases.append(security.cnspell)
+        return [a for a in dict.fromkeys(aliases) if a]
+
+    def lookup(self, key: str) -> Optional[Security]:
+        """按 ts_code、6位代码、名称或拼音首字母精确查找"""
+        key = key.strip()
+        if key.upper() in self.by_code:
+            return self.by_code[key.upper()]
+        if key in self.by_symbol:
+            return self.by_symbol[key]
+        matches = [m for m in self.automaton.iter_matches(key) if m[0] == 0 and m[1] == len(key)]
+        if matches:
+            return matches[0][3]
+        ts_code = infer_ts_code(key)
+        return Security(ts_code=ts_code, symbol=key, name="") if ts_code else None
+
+    def resolve(self, text: str) -> List[Security]:
+        """
+        扫描文本，返回按出现顺序去重的股票列表。
+        名称重叠时取最长匹配（如"中国平安保险"优先于"中国平安"），拼音首字母要求前后不是字母。
+        """
+        candidates = []
+        for start, end, keyword, security in self.automaton.iter_matches(text):
+            if keyword.isascii():
+                before = text[start - 1] if start > 0 else ""
+                after = text[end] if end < len(text) else ""
+                if before.isascii() and before.isalnum() or after.isascii() and after.isalnum():
+                    continue
+            candidates.append((start, end, security))
+
+        for match in _CODE_PATTERN.finditer(text):
+            symbol, suffix = match.group(1), match.group(2)
+            if suffix:
+                ts_code = f"{symbol}.{suffix.upper()}"
+                security = self.by_code.get(ts_code) or Security(ts_code=ts_code, symbol=symbol, name="")
+            else:
+                security = self.by_symbol.get(symbol)
+                if security is None:
+                    ts_code = infer_ts_code(symbol)
+                    if not ts_code:
+                        continue
+                    security = Security(ts_code=ts_code, symbol=symbol, name="")
+            candidates.append((match.start(), match.end(), security))
+
+        # 贪心选取最左最长且互不重叠的匹配
+        candidates.sort(key=lambda c: (c[0], -(c[1] - c[0])))
+        resolved, seen, last_end = [], set(), -1
+        for start, end, security in candidates:
+            if start < last_end:
+                continue
+            last_end = end
+            if security.ts_code not in seen:
+                seen.add(security.ts_code)
+                resolved.append(security)
+        return resolved
+
+    @staticmethod
+    def refresh_from_tushare(pro, path: str = None) -> int:
+        """从 TuShare stock_basic 拉取全部上市股票，写入本地快照，返回条数"""
+        path = path or settings.security_master_path
+        df = pro.stock_basic(exchange="", list_status="L", fields=",".join(SNAPSHOT_FIELDS))
+        if df is None or df.empty:
+            raise Exception("TuShare stock_basic 无数据或无权限")
+        df = df.reindex(columns=SNAPSHOT_FIELDS).fillna("")
+        df["cnspell"] = df["cnspell"].str.lower()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        df.sort_values("ts_code").to_csv(tmp_path, index=False, encoding="utf-8")
+        os.replace(tmp_path, path)
+        print(f"[DEBUG SecurityMaster] Refreshed snapshot with {len(df)} securities: {path}")
+        return len(df)
+
+
+_security_master: Optional[SecurityMaster] = None
+_security_master_lock = threading.Lock()
+
+
+def snapshot_is_stale(master: SecurityMaster) -> bool:
+    """快照缺失、只有样例规模或超过 security_master_max_age 秒未更新"""
+    path = master.snapshot_path
+    if not os.path.exists(path) or len(master) < settings.security_master_min_size:
+        return True
+    return time.time() - os.path.getmtime(path) > settings.security_master_max_age
+
+
+def _refresh_in_background(master: SecurityMaster):
+    """后台从 TuShare 刷新快照并重新加载，刷新期间继续使用已有快照"""
+    def task():
+        try:
+            import tushare as ts
+            from tools.tushare_quota import PRIORITY_BACKGROUND, quota_manager, tushare_priority
+            with tushare_priority(PRIORITY_BACKGROUND):
+                SecurityMaster.refresh_from_tushare(quota_manager.wrap(ts.pro_api(settings.tushare_token)),
+                                                    master.snapshot_path)
+            master.load(master.snapshot_path)
+        except Exception as e:
+            print(f"[WARNING SecurityMaster] Refreshing snapshot from TuShare failed: {e}. "
+                  f"Keeping {len(master)} securities.")
+    threading.Thread(target=task, name="security-master-refresh", daemon=True).start()
+
+
+def get_security_master() -> SecurityMaster:
+    """进程内共享的证券主数据实例（首次调用时加载，快照过期且配置了 TUSHARE_TOKEN 时后台刷新）"""
+    global _security_master
+    if _security_master is None:
+        with _security_master_lock:
+            if _security_master is None:
+                master = SecurityMaster()
+                if settings.tushare_token and snapshot_is_stale(master):
+                    _refresh_in_background(master)
+                _security_master = master
+    return _security_master
+
+
+if __name__ == "__main__":
+    # 用法：python -m tools.security_master  （需配置 TUSHARE_TOKEN；运行时也会在快照过期时自动刷新）
+    import tushare as ts
+
+    if not settings.tushare_token:
+        raise SystemExit("TUSHARE_TOKEN not configured.")
+    ts.set_token(settings.tushare_token)
+    SecurityMaster.refresh_from_tushare(ts.pro_api())
@@ -0,0 +1,65 @@
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, Hashable
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    并发请求合并：同一个 key 同时只执行一次 fn，其余并发调用者等待并共享该次结果（或异常）。
+    key 约定为 (工具名, 规范化参数...)，统计按工具名汇总。
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.executed = Counter()
+        self.coalesced = Counter()
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        name = key[0] if isinstance(key, tuple) and key else key
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced[name] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.executed[name] += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {
+                name: {"executed": self.executed[name], "coalesced": self.coalesced[name]}
+                for name in set(self.executed) | set(self.coalesced)
+            }
+
+
+# 进程内共享实例，所有工具共用
+single_flight = SingleFlight()
@@ -0,0 +1,170 @@
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, Tuple
+from config.settings import settings
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class InputError(Exception):
+    """调用方输入有误（如无效股票代码），不是数据源故障：不计入健康统计，也不切换备用源，直接抛给调用方"""
+
+
+class SourceHealth:
+    """
+    单个数据源的健康状况：滚动窗口内的耗时与成功率，以及熔断器状态。
+    错误率超过阈值时熔断 cooldown 秒，冷却后放行一次试探请求，成功则恢复。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._samples = deque(maxlen=settings.source_health_window)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """当前是否允许请求该数据源"""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN and time.monotonic() - self._opened_at >= settings.circuit_cooldown_seconds:
+                self._state = HALF_OPEN
+            if self._state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record(self, latency: float, ok: bool):
+        with self._lock:
+            self._samples.append((latency, ok))
+            if self._state == HALF_OPEN:
+                self._trial_in_flight = False
+                if ok:
+                    self._state = CLOSED
+                    self._samples.clear()
+                else:
+                    self._trip()
+                return
+            if self._state == CLOSED and len(self._samples) >= settings.circuit_min_calls:
+                recent = list(self._samples)[-settings.circuit_min_calls:]
+                error_rate = sum(1 for _, success in recent if not success) / len(recent)
+                if error_rate >= settings.circuit_error_threshold:
+                    self._trip()
+
+    def _trip(self):
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        print(f"[WARNING SourceHealth] Circuit opened for '{self.name}', "
+              f"skipping it for {settings.circuit_cooldown_seconds}s.")
+
+    def latency_quantile(self, q: float = 0.95) -> float:
+        """成功请求耗时的分位数，样本不足时返回 None"""
+        with self._lock:
+            latencies = sorted(latency for latency, ok in self._samples if ok)
+        if len(latencies) < 5:
+            return None
+        return latencies[min(int(q * len(latencies)), len(latencies) - 1)]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = list(self._samples)
+            state = self._state
+        errors = sum(1 for _, ok in samples if not ok)
+        p95 = self.latency_quantile(0.95)
+        return {
+            "state": state,
+            "calls": len(samples),
+            "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+            "p95_latency": round(p95, 4) if p95 is not None else None,
+        }
+
+
+class SourceHealthRegistry:
+    """各数据源健康状况的注册表，并提供带熔断与对冲请求的主备调用"""
+
+    def __init__(self):
+        self._sources: Dict[str, SourceHealth] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=settings.hedge_max_workers, thread_name_prefix="hedge")
+
+    def get(self, name: str) -> SourceHealth:
+        with self._lock:
+            return self._sources.setdefault(name, SourceHealth(name))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            sources = dict(self._sources)
+        return {name: health.stats() for name, health in sources.items()}
+
+    def _timed(self, name: str, fn: Callable, args: tuple, is_ok: Callable[[Any], bool]) -> Tuple[bool, Any]:
+        started = time.monotonic()
+        try:
+            result = fn(*args)
+            ok = is_ok(result)
+        except InputError:
+            raise
+        except Exception as e:
+            result, ok = e, False
+        self.get(name).record(time.monotonic() - started, ok)
+        return ok, result
+
+    def call_with_fallback(self, primary: Tuple[str, Callable], fallback: Tuple[str, Callable], args: tuple,
+                           is_ok: Callable[[Any], bool], hedge: bool = None) -> Any:
+        """
+        先调用主数据源，失败或熔断时调用备用源。
+        hedge=True 时，主数据源超过其 p95 耗时仍未返回就并行发起备用请求，取先成功的结果。
+        两者都失败时返回备用源的结果（可能是错误字典或异常对象）；InputError 直接抛出。
+        """
+        primary_name, primary_fn = primary
+        fallback_name, fallback_fn = fallback
+        hedge = settings.hedged_requests_enabled if hedge is None else hedge
+
+        if not self.get(primary_name).allow():
+            print(f"[DEBUG SourceHealth] '{primary_name}' circuit open, using '{fallback_name}' directly.")
+            return self._timed(fallback_name, fallback_fn, args, is_ok)[1]
+
+        if not hedge:
+            ok, result = self._timed(primary_name, primary_fn, args, is_ok)
+            if ok:
+                return result
+            if isinstance(result, Exception):
+                print(f"[WARNING SourceHealth] '{primary_name}' failed: {result}. Trying '{fallback_name}'.")
+            return self._timed(fallback_name, fallback_fn, args, is_ok)[1]
+
+        p95 = self.get(primary_name).latency_quantile(0.95)
+        delay = settings.hedge_default_delay if p95 is None else p95
+        delay = min(max(delay, settings.hedge_min_delay), settings.hedge_max_delay)
+
+        # 复制上下文，使 TuShare 调用优先级等上下文变量在线程池中依然生效
+        primary_future = self._pool.submit(contextvars.copy_context().run,
+                                           self._timed, primary_name, primary_fn, args, is_ok)
+        done, _ = wait([primary_future], timeout=delay)
+        if done:
+            ok, result = primary_future.result()
+            if ok:
+                return result
+            return self._timed(fallback_name, fallback_fn, args, is_ok)[1]
+
+        print(f"[DEBUG SourceHealth] '{primary_name}' slower than {delay:.2f}s, hedging with '{fallback_name}'.")
+        fallback_future = self._pool.submit(contextvars.copy_context().run,
+                                            self._timed, fallback_name, fallback_fn, args, is_ok)
+        pending = {primary_future, fallback_future}
+        last = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                ok, result = future.result()
+                if ok:
+                    return result
+                if future is fallback_future or last is None:
+                    last = result
+        return last
+
+
+# 进程内共享的数据源健康状况
+source_health = SourceHealthRegistry()
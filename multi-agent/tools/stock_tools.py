@@ -1,10 +1,33 @@
 import tushare as ts
-import requests
 from bs4 import BeautifulSoup
 from config.settings import settings
+from tools.cache import TTLCache, MISSING
+from tools.http_client import http_client
+from tools.single_flight import single_flight
+from tools.quote_poller import hot_tickers, quote_snapshot
+from tools.source_health import source_health
+from tools.tushare_quota import quota_manager, max_codes_per_daily_call
+from tools.market_hours import market_aware_ttl
+from storage.profile_store import CompanyProfileStore
+from storage.history_store import HistoryStore
+from tools.security_master import InvalidCodeError, get_security_master, normalize_ts_code
+from tools.indicators import indicator_summary
+from datetime import datetime, timedelta
+from typing import Dict, List, Union
 import pandas as pd
 import re
 
+# 腾讯行情 v_xxx="..." 中以 '~' 分隔的字段下标
+TENCENT_QUOTE_FIELDS = {
+    "name": 1, "current_price": 3, "last_close": 4, "open": 5, "volume": 6,
+    "date": 30, "high": 33, "low": 34,
+}
+QUOTE_NUMERIC_COLUMNS = ["current_price", "last_close", "open", "high", "low", "volume"]
+
+
+def _is_error(result) -> bool:
+    return isinstance(result, dict) and "error" in result
+
 
 class StockTools:
 
@@ -15,7 +38,8 @@ class StockTools:
         if self.tushare_token:
             try:
                 ts.set_token(self.tushare_token)
-                self.pro = ts.pro_api()
+                # 所有 TuShare 调用经配额管理器按接口限速、按优先级排队
+                self.pro = quota_manager.wrap(ts.pro_api())
                 print("[DEBUG StockTools] TuShare Pro API initialized successfully.")
             except Exception as e:
                 print(f"[ERROR StockTools] TuShare Pro API initialization failed: {e}. "
@@ -26,52 +50,174 @@ class StockTools:
                   "Will only use fallback data sources.")
             self.pro = None
 
+        # 行情与公司信息分开缓存，避免高频行情挤掉低频变化的公司资料
+        self._price_cache = TTLCache(maxsize=settings.stock_cache_size, name="stock_price")
+        self._info_cache = TTLCache(maxsize=settings.stock_cache_size, name="company_info")
+
+        # 公司资料持久缓存（data/finance_agent.db），数据库不可用时仅使用内存缓存
+        try:
+            self.profile_store = CompanyProfileStore()
+        except Exception as e:
+            print(f"[WARNING StockTools] Company profile store unavailable: {e}. Using in-memory cache only.")
+            self.profile_store = None
+
+        # 日线历史本地存储，只在需要时向 TuShare 补齐缺失交易日
+        self.history_store = HistoryStore(self.pro)
+
     def get_stock_price_internal(self, ts_code: str = "600519.SH") -> dict:
         """
         获取股票最近5天行情，优先TuShare，失败回退新浪财经。
+        交易时段内缓存 price_cache_ttl_trading 秒，休市期间缓存到下次开盘。
         这是一个内部方法。
         """
-        if self.pro:
-            try:
-                df = self.pro.daily(ts_code=ts_code, limit=5)
-                if df is None or df.empty:
-                    raise Exception("TuShare无数据或无权限")
-                print(f"[DEBUG StockTools] Successfully got stock price from TuShare for {ts_code}.")
-                return df.to_dict(orient="records")
-            except Exception as e:
-                print(f"[WARNING StockTools] TuShare getting stock price failed: {e}. "
-                      f"Trying fallback Sina/Tencent.")
-        else:
-            print(f"[WARNING StockTools] TuShare Pro API not available. "
-                  f"Trying fallback Sina/Tencent for {ts_code} price.")
+        try:
+            ts_code = normalize_ts_code(ts_code)
+        except InvalidCodeError as e:
+            return {"error": str(e)}
+        hot_tickers.record(ts_code)
+        cached = self._price_cache.get(ts_code)
+        if cached is not MISSING:
+            return cached
+        # 多个会话同时查询同一股票时只发起一次上游请求
+        return single_flight.do(("stock_price", ts_code), self._load_stock_price, ts_code)
 
-        return self._get_price_from_sina(ts_code)
+    def _load_stock_price(self, ts_code):
+        result = self._fetch_stock_price(ts_code)
+        if not _is_error(result):
+            ttl = market_aware_ttl(settings.price_cache_ttl_trading, settings.price_cache_ttl_closed_max or None)
+            self._price_cache.set(ts_code, result, ttl)
+        return result
 
-    def get_company_info_internal(self, ts_code: str = "600519.SH") -> dict:
+    def get_company_info_internal(self, ts_code: str = "600519.SH", refresh: bool = False) -> dict:
         """
         获取公司信息，优先TuShare，失败回退新浪财经。
+        公司资料变化很少：先查内存缓存，再查 SQLite 持久缓存，都未命中才联网抓取。
+        refresh=True 时跳过缓存强制抓取（用于批量预热）。
         这是一个内部方法。
         """
-        if self.pro:
-            try:
-                df = self.pro.stock_company(ts_code=ts_code)
-                if df is None or df.empty:
-                    raise Exception("TuShare无数据或无权限")
-                print(f"[DEBUG StockTools] Successfully got company info from TuShare for {ts_code}.")
-                return df.to_dict(orient="records")
-            except Exception as e:
-                print(f"[WARNING StockTools] TuShare getting company info failed: {e}. Trying fallback Sina.")
-        else:
-            print(f"[WARNING StockTools] TuShare Pro API not available. Trying fallback Sina for {ts_code} info.")
+        try:
+            ts_code = normalize_ts_code(ts_code)
+        except InvalidCodeError as e:
+            return {"error": str(e)}
+        if not refresh:
+            cached = self._info_cache.get(ts_code)
+            if cached is not MISSING:
+                return cached
+        return single_flight.do(("company_info", ts_code, refresh), self._load_company_info, ts_code, refresh)
 
-        return self._get_info_from_sina_html(ts_code)
+    def _load_company_info(self, ts_code, refresh):
+        if not refresh:
+            stored = self._load_stored_profile(ts_code)
+            if stored is not None:
+                self._info_cache.set(ts_code, stored, settings.company_info_cache_ttl)
+                return stored
+
+        result = self._fetch_company_info(ts_code)
+        if not _is_error(result):
+            self._info_cache.set(ts_code, result, settings.company_info_cache_ttl)
+            self._save_stored_profile(ts_code, result)
+        return result
+
+    def _load_stored_profile(self, ts_code):
+        if not self.profile_store:
+            return None
+        try:
+            return self.profile_store.get(ts_code, max_age=settings.company_profile_max_age)
+        except Exception as e:
+            print(f"[WARNING StockTools] Reading company profile store failed for {ts_code}: {e}")
+            return None
+
+    def _save_stored_profile(self, ts_code, result):
+        if not self.profile_store:
+            return
+        try:
+            self.profile_store.put(ts_code, result)
+        except Exception as e:
+            print(f"[WARNING StockTools] Writing company profile store failed for {ts_code}: {e}")
+
+    def get_stock_history(self, ts_code: str, start_date: str = None, end_date: str = None) -> Union[List[Dict], dict]:
+        """
+        获取任意区间的日线历史（YYYYMMDD），数据来自本地 Parquet 存储并按需增量补齐。
+        需要 TuShare；返回按交易日升序的记录列表。
+        """
+        try:
+            df = self.history_store.get_history(ts_code, start_date, end_date)
+        except Exception as e:
+            print(f"[ERROR StockTools] Getting stock history failed for {ts_code}: {e}")
+            return {"error": f"历史行情获取失败: {e}"}
+        if df.empty:
+            if not self.pro:
+                return {"error": "历史行情需要 TuShare，当前未配置或初始化失败"}
+            return {"error": f"{ts_code} 在 {start_date or '最早'} - {end_date or '最新'} 区间内无历史行情"}
+        return df.to_dict(orient="records")
+
+    def get_indicator_summary(self, ts_code: str) -> dict:
+        """
+        基于本地日线历史计算技术指标摘要（均线、RSI、MACD、布林带、ATR、波动率、回撤），
+        取最近 indicator_lookback_days 个交易日，需要 TuShare 历史数据。
+        """
+        ts_code = ts_code.strip().upper()
+        try:
+            df = self.history_store.get_history(ts_code)
+        except Exception as e:
+            print(f"[ERROR StockTools] Getting history for indicators failed for {ts_code}: {e}")
+            return {"error": f"技术指标计算失败: {e}"}
+        if df.empty:
+            if not self.pro:
+                return {"error": "技术指标需要 TuShare 历史行情，当前未配置或初始化失败"}
+            return {"error": f"{ts_code} 无历史行情，无法计算技术指标"}
+        return indicator_summary(df.tail(settings.indicator_lookback_days))
+
+    def cache_stats(self) -> dict:
+        """返回行情与公司信息缓存的命中/未命中/淘汰计数，以及并发请求合并次数"""
+        return {
+            "stock_price": self._price_cache.stats(),
+            "company_info": self._info_cache.stats(),
+            "single_flight": single_flight.stats(),
+            "source_health": source_health.stats(),
+            "tushare_quota": quota_manager.stats(),
+        }
+
+    def _fetch_stock_price(self, ts_code):
+        """
+        行情实际获取逻辑（不经过缓存）：热门股票先读后台轮询写入的共享快照（O(1)，不联网），
+        未命中时 TuShare 为主、腾讯为备，受熔断与对冲策略控制
+        """
+        try:
+            snapshot = quote_snapshot.get(ts_code, max_age=settings.quote_snapshot_max_age)
+            if snapshot is not None:
+                print(f"[DEBUG StockTools] Got stock price from quote snapshot for {ts_code}.")
+                return snapshot
+        except Exception as e:
+            print(f"[WARNING StockTools] Reading quote snapshot failed for {ts_code}: {e}")
+
+        if not self.pro:
+            print(f"[WARNING StockTools] TuShare Pro API not available. "
+                  f"Trying fallback Sina/Tencent for {ts_code} price.")
+            return self._get_price_from_sina(ts_code)
+
+        result = source_health.call_with_fallback(
+            ("tushare.daily", self._get_price_from_tushare), ("tencent.quote", self._get_price_from_sina),
+            (ts_code,), is_ok=lambda r: not _is_error(r)
+        )
+        if isinstance(result, Exception):
+            return {"error": f"行情获取失败: {result}"}
+        return result
+
+    def _get_price_from_tushare(self, ts_code):
+        # 从本地历史存储取最近5个交易日（按 TuShare 习惯降序），只联网补齐缺失部分
+        df = self.history_store.get_history(ts_code)
+        if df is None or df.empty:
+            raise Exception("TuShare无数据或无权限")
+        print(f"[DEBUG StockTools] Successfully got stock price from TuShare for {ts_code}.")
+        return df.iloc[::-1].head(5).to_dict(orient="records")
 
     def _get_price_from_sina(self, ts_code):
         """从腾讯财经抓取行情"""
         try:
             code = self._code_for_sina(ts_code)
             url = f"https://qt.gtimg.cn/q={code}"
-            res = requests.get(url, timeout=5)
+            res = http_client.get(url)
             res.encoding = "gbk"
             data = res.text.split('~')
 
@@ -98,16 +244,138 @@ class StockTools:
             print(f"[ERROR StockTools] Sina/Tencent getting stock price failed for {ts_code}: {e}")
             return {"error": f"新浪/腾讯财经行情获取失败: {e}"}
 
+    def _fetch_company_info(self, ts_code):
+        """公司信息实际获取逻辑（不经过缓存）：TuShare 为主、新浪为备，受熔断与对冲策略控制"""
+        if not self.pro:
+            print(f"[WARNING StockTools] TuShare Pro API not available. Trying fallback Sina for {ts_code} info.")
+            return self._get_info_from_sina_html(ts_code)
+
+        result = source_health.call_with_fallback(
+            ("tushare.stock_company", self._get_info_from_tushare),
+            ("sina.company_info", self._get_info_from_sina_html),
+            (ts_code,), is_ok=lambda r: not _is_error(r)
+        )
+        if isinstance(result, Exception):
+            return {"error": f"公司信息获取失败: {result}"}
+        return result
+
+    def _get_info_from_tushare(self, ts_code):
+        df = self.pro.stock_company(ts_code=ts_code)
+        if df is None or df.empty:
+            raise Exception("TuShare无数据或无权限")
+        print(f"[DEBUG StockTools] Successfully got company info from TuShare for {ts_code}.")
+        return df.to_dict(orient="records")
+
+    def get_stock_prices_batch(self, ts_codes: List[str]) -> List[Dict]:
+        """
+        批量获取多只股票的最新行情，把代码分块后尽量合并为少量上游请求：
+        优先 TuShare daily（多个 ts_code 一次查询），缺失的再用腾讯行情批量接口补齐。
+        返回统一字段的记录列表，获取失败的股票记录中带有 error 字段。
+        """
+        codes = list(dict.fromkeys(code.strip().upper() for code in ts_codes if code and code.strip()))
+        if not codes:
+            return []
+
+        frames = []
+        remaining = codes
+        if self.pro:
+            df = self._get_prices_batch_from_tushare(remaining)
+            if not df.empty:
+                frames.append(df)
+                retrieved = set(df["code"])
+                remaining = [code for code in remaining if code not in retrieved]
+        if remaining:
+            df = self._get_prices_batch_from_tencent(remaining)
+            if not df.empty:
+                frames.append(df)
+
+        table = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        records = {row["code"]: row for row in table.to_dict(orient="records")}
+        print(f"[DEBUG StockTools] Batch quotes: {len(records)}/{len(codes)} codes retrieved.")
+        return [records.get(code) or {"code": code, "error": "未获取到行情数据"} for code in codes]
+
+    def _get_prices_batch_from_tushare(self, ts_codes: List[str]) -> pd.DataFrame:
+        """TuShare daily 支持逗号分隔的多个 ts_code，取每只股票最近一个交易日"""
+        end = datetime.now()
+        start = end - timedelta(days=14)
+        frames = []
+        size = max_codes_per_daily_call(start_date=start.strftime("%Y%m%d"), end_date=end.strftime("%Y%m%d"))
+        for i in range(0, len(ts_codes), size):
+            chunk = ts_codes[i:i + size]
+            try:
+                df = self.pro.daily(ts_code=",".join(chunk), start_date=start.strftime("%Y%m%d"),
+                                    end_date=end.strftime("%Y%m%d"))
+                if df is not None and not df.empty:
+                    frames.append(df)
+            except Exception as e:
+                print(f"[WARNING StockTools] TuShare batch daily failed for {len(chunk)} codes: {e}. "
+                      f"Trying fallback Tencent.")
+        if not frames:
+            return pd.DataFrame()
+
+        df = pd.concat(frames, ignore_index=True)
+        latest = df.sort_values("trade_date").groupby("ts_code", as_index=False).tail(1)
+        master = get_security_master()
+        return pd.DataFrame({
+            "code": latest["ts_code"],
+            "name": latest["ts_code"].map(lambda c: getattr(master.by_code.get(c), "name", "")),
+            "current_price": latest["close"],
+            "last_close": latest["pre_close"],
+            "open": latest["open"],
+            "high": latest["high"],
+            "low": latest["low"],
+            "volume": latest["vol"],
+            "date": latest["trade_date"],
+            "source": "tushare",
+        }).reset_index(drop=True)
+
+    def _get_prices_batch_from_tencent(self, ts_codes: List[str]) -> pd.DataFrame:
+        """腾讯行情接口支持逗号分隔的多只股票，一次请求返回多行 v_xxx="...";"""
+        symbol_to_code = {self._code_for_sina(code).lower(): code for code in ts_codes}
+        symbols = list(symbol_to_code)
+        texts = []
+        size = settings.tencent_quote_batch_size
+        for i in range(0, len(symbols), size):
+            chunk = symbols[i:i + size]
+            try:
+                res = http_client.get(f"https://qt.gtimg.cn/q={','.join(chunk)}")
+                res.encoding = "gbk"
+                texts.append(res.text)
+            except Exception as e:
+                print(f"[ERROR StockTools] Tencent batch quotes failed for {len(chunk)} codes: {e}")
+        if not texts:
+            return pd.DataFrame()
+        return self._parse_tencent_quotes("".join(texts), symbol_to_code)
+
+    @staticmethod
+    def _parse_tencent_quotes(text: str, symbol_to_code: Dict[str, str]) -> pd.DataFrame:
+        """把腾讯行情多行文本一次性向量化解析为 DataFrame"""
+        lines = pd.Series(text.split(";")).str.strip()
+        parts = lines.str.extract(r'^v_(?P<symbol>\w+)="(?P<body>.*)"$').dropna()
+        if parts.empty:
+            return pd.DataFrame()
+
+        fields = parts["body"].str.split("~", expand=True)
+        if fields.shape[1] <= max(TENCENT_QUOTE_FIELDS.values()):
+            return pd.DataFrame()
+        # 字段不足的行（停牌、代码不存在时腾讯返回 v_pv_none_match 等）直接丢弃
+        valid = fields[max(TENCENT_QUOTE_FIELDS.values())].notna()
+        fields, symbols = fields[valid], parts["symbol"][valid]
+
+        table = pd.DataFrame({name: fields[idx] for name, idx in TENCENT_QUOTE_FIELDS.items()})
+        for col in ("high", "low"):
+            table[col] = table[col].mask(table[col].eq(""), table["current_price"])
+        table[QUOTE_NUMERIC_COLUMNS] = table[QUOTE_NUMERIC_COLUMNS].apply(pd.to_numeric, errors="coerce")
+        table.insert(0, "code", symbols.str.lower().map(symbol_to_code))
+        table["source"] = "tencent"
+        return table.dropna(subset=["code"]).reset_index(drop=True)
+
     def _get_info_from_sina_html(self, ts_code):
         """爬取新浪财经股票公司概况HTML"""
         try:
             stock_id = ts_code[:6]
             url = f"https://vip.stock.finance.sina.com.cn/corp/go.php/vCI_CorpInfo/stockid/{stock_id}.phtml"
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-                              "(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-            }
-            res = requests.get(url, headers=headers, timeout=5)
+            res = http_client.get(url)
             res.encoding = "gbk"
             soup = BeautifulSoup(res.text, "html.parser")
 
@@ -147,5 +415,7 @@ class StockTools:
             return "sz" + ts_code[:6]
         elif ts_code.endswith(".SH"):
             return "sh" + ts_code[:6]
+        elif ts_code.endswith(".BJ"):
+            return "bj" + ts_code[:6]
         else:
             return ts_code
@@ -0,0 +1,63 @@
+import math
+import re
+import threading
+from config.settings import settings
+
+_CJK_PATTERN = re.compile(r"[　-〿㐀-鿿＀-￯]")
+
+_encoding = None
+_encoding_failed = False
+_lock = threading.Lock()
+
+
+def _get_encoding():
+    """加载本地 tiktoken 编码；编码文件不可用（如离线且无缓存）时返回 None，改用估算"""
+    global _encoding, _encoding_failed
+    if _encoding is not None or _encoding_failed:
+        return _encoding
+    with _lock:
+        if _encoding is None and not _encoding_failed:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding(settings.tokenizer_encoding)
+            except Exception as e:
+                _encoding_failed = True
+                print(f"[WARNING TokenCounter] tiktoken encoding '{settings.tokenizer_encoding}' unavailable: {e}. "
+                      f"Falling back to character-based estimate.")
+    return _encoding
+
+
+def _char_cost(char: str) -> float:
+    # 估算：中文字符约 1 token/字，其余约 4 字符/token
+    return 1.0 if _CJK_PATTERN.match(char) else 0.25
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def truncate_to_tokens(text: str, max_tokens: int, suffix: str = "…") -> str:
+    """截断到不超过 max_tokens 个 token，发生截断时追加 suffix"""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        # 截断处可能切断多字节字符，解码时忽略残缺部分
+        return encoding.decode(tokens[:max_tokens], errors="ignore").rstrip() + suffix
+
+    cost, end = 0.0, 0
+    for end, char in enumerate(text):
+        cost += _char_cost(char)
+        if cost > max_tokens:
+            break
+    return text[:end].rstrip() + suffix
@@ -0,0 +1,252 @@
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from typing import Any, Dict, List
+import numpy as np
+import pandas as pd
+from config.settings import settings
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+# 支持把多个请求合并为一次调用的接口：接口名 -> 可用逗号拼接的参数名
+COALESCIBLE_ENDPOINTS = {"daily": "ts_code"}
+
+
+def estimate_trading_days(start_date: str = None, end_date: str = None, trade_date: str = None) -> int:
+    """按工作日估算 [start_date, end_date]（YYYYMMDD）内的交易日数，用于估计 daily 返回行数（未扣除节假日，偏保守）"""
+    if trade_date or not (start_date or end_date):
+        return 1
+    start = pd.Timestamp(start_date or end_date).date()
+    end = pd.Timestamp(end_date).date() if end_date else pd.Timestamp.now().date()
+    return max(1, int(np.busday_count(start, end)) + 1)
+
+
+def max_codes_per_daily_call(**kwargs) -> int:
+    """单次 daily 调用最多可合并的股票数：估算行数（代码数 × 交易日数）不超过 tushare_daily_max_rows"""
+    days = estimate_trading_days(kwargs.get("start_date"), kwargs.get("end_date"), kwargs.get("trade_date"))
+    return max(1, min(settings.tushare_daily_batch_size, settings.tushare_daily_max_rows // days))
+
+
+_current_priority = contextvars.ContextVar("tushare_priority", default=PRIORITY_INTERACTIVE)
+
+
+@contextmanager
+def tushare_priority(priority: int):
+    """在该上下文内发起的 TuShare 调用使用指定优先级（例如后台预热使用 PRIORITY_BACKGROUND）"""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class TokenBucket:
+    """按每分钟调用次数补充令牌的令牌桶"""
+
+    def __init__(self, per_minute: int):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, float(per_minute))
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self) -> float:
+        """距离下一个令牌可用还需等待的秒数"""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+
+class _Request:
+    __slots__ = ("priority", "seq", "pro", "endpoint", "kwargs", "future", "enqueued_at")
+
+    def __init__(self, priority, seq, pro, endpoint, kwargs):
+        self.priority = priority
+        self.seq = seq
+        self.pro = pro
+        self.endpoint = endpoint
+        self.kwargs = kwargs
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+    def merge_key(self):
+        """可合并请求的分组键：同一接口、除拼接参数外其余参数完全相同"""
+        field = COALESCIBLE_ENDPOINTS.get(self.endpoint)
+        if field is None or field not in self.kwargs or "limit" in self.kwargs:
+            return None
+        others = tuple(sorted((k, v) for k, v in self.kwargs.items() if k != field))
+        return id(self.pro), self.endpoint, others
+
+
+class TuShareQuotaManager:
+    """
+    TuShare 调用配额管理：每个接口一个令牌桶（tushare_rate_limits 配置每分钟次数），
+    排队请求按优先级出队，交互请求优先于后台预热/批量任务；
+    排队中的同接口 daily 请求合并为一次多代码调用（按估算行数限制合并规模）。
+    """
+
+    def __init__(self):
+        self._heap: List[_Request] = []
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._workers = ThreadPoolExecutor(max_workers=settings.tushare_max_concurrency,
+                                           thread_name_prefix="tushare")
+        self._dispatcher = None
+        self.wait_stats: Dict[int, Dict[str, float]] = {}
+        self.calls: Dict[str, int] = {}
+        self.coalesced = 0
+        self.abandoned = 0
+
+    def wrap(self, pro) -> "QuotaLimitedPro":
+        return QuotaLimitedPro(pro, self)
+
+    def _bucket(self, endpoint: str) -> TokenBucket:
+        if endpoint not in self._buckets:
+            limits = settings.tushare_rate_limits
+            self._buckets[endpoint] = TokenBucket(limits.get(endpoint, limits.get("default", 100)))
+        return self._buckets[endpoint]
+
+    def call(self, pro, endpoint: str, priority: int = None, **kwargs) -> Any:
+        """排队执行 pro.<endpoint>(**kwargs)，阻塞直到返回结果，超过 tushare_queue_timeout 抛出异常"""
+        priority = _current_priority.get() if priority is None else priority
+        request = _Request(priority, next(self._seq), pro, endpoint, kwargs)
+        with self._cond:
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch_loop, name="tushare-quota", daemon=True)
+                self._dispatcher.start()
+            heapq.heappush(self._heap, request)
+            self._cond.notify()
+        try:
+            return request.future.result(timeout=settings.tushare_queue_timeout)
+        except FutureTimeoutError:
+            # 仍在排队的请求移出队列，避免之后照常发出、消耗配额却无人取结果
+            with self._cond:
+                if request in self._heap:
+                    self._heap.remove(request)
+                    heapq.heapify(self._heap)
+                    self.abandoned += 1
+            raise Exception(f"TuShare {endpoint} 排队超过 {settings.tushare_queue_timeout} 秒")
+
+    def _dispatch_loop(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                batch, sleep_for = self._next_batch()
+                if not batch:
+                    self._cond.wait(timeout=sleep_for)
+                    continue
+            self._workers.submit(self._execute, batch)
+
+    def _next_batch(self):
+        """按优先级找到第一个有令牌可用的请求，并合并同组的排队请求；都没有令牌时返回需等待的时间"""
+        sleep_for = None
+        for request in sorted(self._heap):
+            bucket = self._bucket(request.endpoint)
+            wait = bucket.wait_time()
+            if wait > 0:
+                sleep_for = wait if sleep_for is None else min(sleep_for, wait)
+                continue
+
+            batch = [request]
+            key = request.merge_key()
+            if key is not None:
+                field = COALESCIBLE_ENDPOINTS[request.endpoint]
+                size = len(str(request.kwargs[field]).split(","))
+                # 同组请求日期参数相同，按 代码数 × 交易日数 估算返回行数，不超过单次调用的行数上限
+                max_codes = max_codes_per_daily_call(**request.kwargs)
+                for other in sorted(self._heap):
+                    if other is request or other.merge_key() != key:
+                        continue
+                    other_size = len(str(other.kwargs[field]).split(","))
+                    if size + other_size > max_codes:
+                        continue
+                    batch.append(other)
+                    size += other_size
+
+            for item in batch:
+                self._heap.remove(item)
+            heapq.heapify(self._heap)
+            bucket.take()
+
+            now = time.monotonic()
+            for item in batch:
+                stats = self.wait_stats.setdefault(item.priority, {"count": 0, "total_wait": 0.0, "max_wait": 0.0})
+                waited = now - item.enqueued_at
+                stats["count"] += 1
+                stats["total_wait"] += waited
+                stats["max_wait"] = max(stats["max_wait"], waited)
+            self.calls[request.endpoint] = self.calls.get(request.endpoint, 0) + 1
+            self.coalesced += len(batch) - 1
+            return batch, None
+        return None, sleep_for
+
+    def _execute(self, batch: List[_Request]):
+        head = batch[0]
+        try:
+            if len(batch) == 1:
+                head.future.set_result(getattr(head.pro, head.endpoint)(**head.kwargs))
+                return
+
+            field = COALESCIBLE_ENDPOINTS[head.endpoint]
+            codes = list(dict.fromkeys(
+                code for item in batch for code in str(item.kwargs[field]).split(",")
+            ))
+            kwargs = dict(head.kwargs, **{field: ",".join(codes)})
+            df = getattr(head.pro, head.endpoint)(**kwargs)
+            for item in batch:
+                wanted = set(str(item.kwargs[field]).split(","))
+                if df is None or df.empty:
+                    item.future.set_result(df)
+                else:
+                    item.future.set_result(df[df[field].isin(wanted)].reset_index(drop=True))
+        except Exception as e:
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(e)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            wait_stats = {
+                priority: {
+                    "count": s["count"],
+                    "avg_wait": round(s["total_wait"] / s["count"], 4) if s["count"] else 0.0,
+                    "max_wait": round(s["max_wait"], 4),
+                }
+                for priority, s in self.wait_stats.items()
+            }
+            return {"queued": len(self._heap), "calls": dict(self.calls), "coalesced": self.coalesced,
+                    "abandoned": self.abandoned, "wait_by_priority": wait_stats}
+
+
+class QuotaLimitedPro:
+    """包装 ts.pro_api()，所有接口调用都经过配额管理器排队"""
+
+    def __init__(self, pro, manager: TuShareQuotaManager):
+        self._pro = pro
+        self._manager = manager
+
+    def __getattr__(self, endpoint: str):
+        def call(**kwargs) -> pd.DataFrame:
+            return self._manager.call(self._pro, endpoint, **kwargs)
+        return call
+
+
+# 进程内共享：同一个 TuShare token 的配额在所有 StockTools 实例间共用
+quota_manager = TuShareQuotaManager()
@@ -5,10 +5,32 @@ sys.path.insert(0, ROOT_DIR)
 
 import streamlit as st
 from langchain_core.messages import HumanMessage, AIMessage
-from main import run_agent_workflow, short_term_memory # 导入LangGraph运行函数和记忆
+from main import stream_agent_workflow, short_term_memory # 导入LangGraph流式运行函数和记忆
+from config.settings import settings
+from tools.chart_tools import extract_chart_paths, strip_chart_markers
 
 st.set_page_config(page_title="金融多智能体分析系统", layout="wide")
 
+# 各节点在进度面板中的显示名称
+NODE_LABELS = {
+    "router": "识别请求类型",
+    "data_retrieval": "获取行情、公司信息与新闻",
+    "analysis": "分析数据",
+    "report_generation": "生成报告",
+    "fused_report": "分析并生成报告",
+    "reused_result": "复用近期相同分析结果",
+    "general_response": "生成回复",
+}
+
+
+def render_answer(content: str):
+    """展示回答文本，并把其中引用的图表文件以图片形式显示"""
+    st.markdown(strip_chart_markers(content))
+    for path in extract_chart_paths(content):
+        if os.path.exists(path):
+            st.image(path)
+
+
 st.title("💰 金融多智能体分析系统 (国内版)")
 st.caption("基于LangGraph和通义千问，提供股票数据、分析和报告生成。")
 
@@ -21,19 +43,44 @@ for msg in st.session_state.messages:
     if isinstance(msg, HumanMessage):
         st.chat_message("user").write(msg.content)
     elif isinstance(msg, AIMessage):
-        st.chat_message("assistant").write(msg.content)
+        with st.chat_message("assistant"):
+            render_answer(msg.content)
+
+bypass_cache = st.sidebar.checkbox("忽略缓存，重新生成", value=False)
+fused_report = st.sidebar.checkbox("报告一次生成（合并分析与报告）", value=settings.fused_report_enabled)
 
 # 用户输入
 if prompt := st.chat_input("输入你的问题，例如：分析一下贵州茅台的投资价值"):
     st.session_state.messages.append(HumanMessage(content=prompt))
     st.chat_message("user").write(prompt)
 
-    with st.spinner("AI正在思考..."):
-        # 调用 LangGraph 运行函数
-        response = run_agent_workflow(prompt)
-        ai_message = AIMessage(content=response)
-        st.session_state.messages.append(ai_message)
-        st.chat_message("assistant").write(response)
+    with st.chat_message("assistant"):
+        status = st.status("AI正在思考...", expanded=False)
+        answer = st.empty()
+        result = {}
+
+        def token_stream():
+            # 节点进度写入状态面板，LLM token 交给 st.write_stream 逐步渲染
+            for event in stream_agent_workflow(prompt, bypass_cache=bypass_cache, fused_report=fused_report):
+                if event["type"] == "node":
+                    label = NODE_LABELS.get(event["node"], event["node"])
+                    status.write(f"✅ {label}")
+                    status.update(label=f"{label}完成")
+                elif event["type"] == "token":
+                    yield event["content"]
+                elif event["type"] == "final":
+                    result["content"] = event["content"]
+
+        with answer.container():
+            streamed = st.write_stream(token_stream())
+        status.update(label="完成", state="complete")
+
+        # 未流式输出（命中缓存、通用回复等）或最终结果附带了工具输出时，以完整结果为准
+        response = result.get("content") or streamed or ""
+        if response != streamed or extract_chart_paths(response):
+            with answer.container():
+                render_answer(response)
+        st.session_state.messages.append(AIMessage(content=response))
 
 st.sidebar.title("系统信息")
 st.sidebar.write("模型：通义千问 Qwen-turbo")